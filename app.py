@@ -1,10 +1,29 @@
 import os
 import time
 import datetime
-from flask import Flask, jsonify, render_template, request, redirect, url_for, session, flash, Response
-from sqlalchemy import func
-from models import db, Customer, Employee, Predictions, ConsultationLogs, InternetService, Contract, PhoneService
-from fpdf import FPDF
+import click
+from flask import Flask, jsonify, render_template, request, redirect, url_for, session, flash, Response, stream_with_context, abort, send_file
+from sqlalchemy import func, select, text, and_, or_
+from models import db, Customer, Employee, Predictions, ConsultationLogs, InternetService, Contract, PhoneService, next_log_id
+from models import HIGH_RISK_THRESHOLD, RISK_BAND_LOW, RISK_BAND_MEDIUM, RISK_BAND_HIGH, risk_band
+from migrations import run_migrations
+from scoring import DEFAULT_MODEL_PATH, score_columns, object_columns, rescore_predictions, retention_strategies
+from churn_model import DEFAULT_TRAIN_SAMPLE, train_model
+from bulk_writer import upsert_predictions
+from streaming import iter_result_batches, json_array_chunks, ndjson_chunks
+from stats_cache import AggregateCache, contract_values
+from log_feed import log_entry, recent_logs_select, logs_since_select, parse_log_cursor, next_log_cursor
+from log_writer import LogWriter
+from loaders import load_customer
+from profiling import RequestProfiler, DEFAULT_FLUSH_INTERVAL
+from report_jobs import ReportJobs, DEFAULT_JOB_TIMEOUT
+from risk_cache import RiskViewCache, DEFAULT_RISK_CACHE_SIZE, DEFAULT_RISK_CACHE_TTL, backend_from_url
+from rescore_queue import RescoreQueue
+from churn_cube import CUBE_DIMENSIONS, DEFAULT_CUBE_CHECK_INTERVAL, CubeStore, parse_cube_query, refresh_cube
+from tenure_aging import DEFAULT_AGING_CHUNK, PERIOD_FORMAT, run_tenure_aging, recent_runs
+from batch_predict import DEFAULT_PREDICT_BATCH_MAX, parse_feature_records, load_batch, merge_columns, score_batch
+from bulk_import import READERS, DEFAULT_IMPORT_CHUNK, import_customers, parse_probability
+from export import EXPORT_FORMATS, DEFAULT_EXPORT_BATCH, export_chunks, export_to_file, iter_export_batches, pyarrow_available
 from flasgger import Swagger 
 
 app = Flask(__name__)
@@ -14,92 +33,212 @@ app.secret_key = 'clientguard_secret_key'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///local.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool, sized per worker process (pool_size should cover the worker's
+# threads). pre_ping drops connections MySQL closed while idle and recycle
+# retires them before its wait_timeout does.
+def engine_options(database_url):
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 280))
+    }
+    if database_url.startswith('mysql'):
+        options['connect_args'] = {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5))}
+    if not database_url.startswith('sqlite'):
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 10))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
 # Swagger Config
 app.config['SWAGGER'] = {
     'title': 'ClientGuard API',
     'uiversion': 3
 }
 
+CUSTOMER_PAGE_SIZE = 100
+CUSTOMER_PAGE_MAX = 1000
+
+EXPORT_BATCH_MAX = 200000
+IMPORT_CHUNK_MAX = 50000
+PREDICT_BATCH_MAX = int(os.environ.get('PREDICT_BATCH_MAX', DEFAULT_PREDICT_BATCH_MAX))
+IMPORT_CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+
+DASHBOARD_PAGE_SIZE = 25
+DASHBOARD_PAGE_MAX = 200
+
+# Dashboard sorts: (key columns before CustomerID, parser of the ?after=
+# cursor value into key values, cursor value of a row) and risk bands (same
+# thresholds as the progress bars). Churn sorts on (RiskBand,
+# ChurnProbability, CustomerID), the order of ix_predictions_band_probability;
+# customers without a prediction are a separate range keyed on CustomerID
+# alone (cursor value 'pending'), before the scored ones ascending and after
+# them descending, so the keyset never compares against NULL.
+DASHBOARD_PENDING = 'pending'
+
+
+def parse_churn_cursor(value):
+    if value == DASHBOARD_PENDING:
+        return None
+    probability = float(value)
+    return (risk_band(probability), probability)
+
+
+DASHBOARD_SORTS = {
+    'id': ((), lambda value: (), lambda row: row['customer_id']),
+    'churn': ((Predictions.risk_band, Predictions.churn_probability), parse_churn_cursor,
+              lambda row: DASHBOARD_PENDING if row['churn_probability'] is None else row['churn_probability']),
+    'tenure': ((Customer.tenure,), lambda value: (int(value),), lambda row: row['tenure'])
+}
+RISK_BANDS = {
+    'high': Predictions.risk_band == RISK_BAND_HIGH,
+    'medium': Predictions.risk_band == RISK_BAND_MEDIUM,
+    'low': Predictions.risk_band == RISK_BAND_LOW,
+    'pending': Predictions.customer_id.is_(None)
+}
+
 swagger = Swagger(app)
 db.init_app(app)
 
-def wait_for_db():
+# Store shared by all workers (Redis; gunicorn.conf.py defaults it with several workers)
+shared_cache = backend_from_url(os.environ.get('RISK_CACHE_URL'))
+
+# Dashboard / reports aggregates, maintained incrementally by the CRUD routes
+aggregate_cache = AggregateCache(ttl=int(os.environ.get('AGGREGATE_CACHE_TTL', 300)), backend=shared_cache)
+
+# Background writer for consultation logs (batched multi-row INSERTs)
+log_writer = LogWriter(app,
+                       max_queue=int(os.environ.get('LOG_WRITER_QUEUE', 10000)),
+                       batch_size=int(os.environ.get('LOG_WRITER_BATCH', 500)),
+                       flush_interval=float(os.environ.get('LOG_WRITER_INTERVAL', 1.0)))
+
+# Per-request SQL/latency instrumentation (Server-Timing headers, /metrics)
+profiler = RequestProfiler(app, db,
+                           enabled=os.environ.get('PROFILING_ENABLED', '0').lower() in ('1', 'true', 'yes'),
+                           slow_query_ms=float(os.environ.get('PROFILING_SLOW_QUERY_MS', 200)),
+                           shared_dir=os.environ.get('PROFILING_DIR') or None,
+                           flush_interval=float(os.environ.get('PROFILING_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)))
+
+# predict_tool risk views, invalidated by every route that edits a customer
+risk_cache = RiskViewCache(max_entries=int(os.environ.get('RISK_CACHE_SIZE', DEFAULT_RISK_CACHE_SIZE)),
+                           ttl=int(os.environ.get('RISK_CACHE_TTL', DEFAULT_RISK_CACHE_TTL)),
+                           backend=shared_cache)
+
+# Customers whose rows changed in a committed session, rescored in batches
+def predictions_rescored(changes):
+    for _, old_risk, new_risk in changes:
+        aggregate_cache.prediction_changed(old_risk, new_risk)
+    risk_cache.invalidate(*(cid for cid, _, _ in changes))
+
+rescore_queue = RescoreQueue(app,
+                             batch_size=int(os.environ.get('RESCORE_QUEUE_BATCH', 500)),
+                             interval=float(os.environ.get('RESCORE_QUEUE_INTERVAL', 1.0)),
+                             on_rescored=predictions_rescored)
+if os.environ.get('RESCORE_ON_CHANGE', '1').lower() in ('1', 'true', 'yes'):
+    rescore_queue.watch(db.session)
+
+# Per-worker copy of the materialized churn cube (rebuilt by `flask refresh-cube`)
+cube_store = CubeStore(check_interval=float(os.environ.get('CUBE_CHECK_INTERVAL', DEFAULT_CUBE_CHECK_INTERVAL)))
+
+# PDF reports rendered by a process pool into an on-disk LRU cache
+report_jobs = ReportJobs(cache_dir=os.environ.get('REPORT_CACHE_DIR', 'report_cache'),
+                         max_bytes=int(os.environ.get('REPORT_CACHE_MAX_MB', 512)) * 1024 * 1024,
+                         workers=int(os.environ.get('REPORT_WORKERS', 2)),
+                         job_timeout=int(os.environ.get('REPORT_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)))
+
+def ping_db():
+    with db.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def wait_for_db(timeout=None):
+    """
+    Retries a SELECT 1 with exponential backoff (0.1s doubling up to 2s)
+    until the database answers or timeout seconds pass, then creates the
+    schema and applies migrations. Returns True once the DB is ready.
+    """
+    timeout = float(os.environ.get('DB_WAIT_TIMEOUT', 60)) if timeout is None else timeout
     with app.app_context():
         print("Connecting to DB...")
-        time.sleep(10)
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while True:
+            try:
+                ping_db()
+                break
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"DB Error: {e}")
+                    return False
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 2.0)
         try:
             db.create_all()
+            applied = run_migrations(db.engine)
+            if applied: print(f"Migrations applied: {', '.join(applied)}")
             print("DB Connected successfully!")
+            return True
         except Exception as e:
             print(f"DB Error: {e}")
+            return False
 
 
 #  LOGIC ENGINE (BUSINESS LOGIC)
-def calculate_churn_risk(customer, contract, internet):
+def calculate_churn_risk(customer, contract, internet, phone=None):
     """
     Calculates risk based on REAL database attributes.
+    Thin wrapper over the active scorer in scoring.py (batch of one).
     """
-    score = 0.30 # Base risk
-
-    # 1. Tenure
-    if customer.tenure < 6: score += 0.20
-    elif customer.tenure > 24: score -= 0.15
-
-    # 2. Contract (High impact)
-    if contract:
-        if contract.contract_mode == 'Month-to-month': score += 0.25
-        elif contract.contract_mode == 'Two year': score -= 0.20
-
-    # 3. Internet
-    if internet and internet.internet_type == 'Fiber optic': score += 0.10
-
-    # 4. Demographics
-    if customer.senior_citizen: score += 0.05
-    if not customer.partner and not customer.dependents: score += 0.05 # Alone = higher risk
-
-    return max(0.01, min(0.99, score))
+    scores = score_columns(object_columns(customer, contract, internet, phone))
+    return float(scores[0])
 
 def get_retention_strategies(customer, contract, risk_score):
-    strategies = []
-    
-    if risk_score > 0.80:
-        if contract and contract.contract_mode == 'Month-to-month':
-            strategies.append({
-                "title": "Contract Stabilization",
-                "desc": "User is on a volatile Month-to-month plan. Offer 20% off for 6 months to switch to a 1-Year contract."
-            })
-        
-        if customer.tenure > 24:
-            strategies.append({
-                "title": "VIP Retention",
-                "desc": "Long-term high-risk customer. Authorize a 'Loyalty Speed Boost' or free equipment upgrade."
-            })
-        else:
-            strategies.append({
-                "title": "Onboarding Rescue",
-                "desc": "New customer at risk. Schedule a call with a Success Manager immediately."
-            })
-            
-    return strategies
+    return retention_strategies(risk_score, customer.tenure, contract.contract_mode if contract else None)
 
-<<<<<<< HEAD
-# ==========================================
-#  ZONA API RESTful
-# ==========================================
-=======
->>>>>>> ea8cb0ce8b092116bb2c0de5d42614f6abc76497
+def risk_view(customer, risk_score):
+    """What predict_tool renders for a customer (plain data, so it can be cached)."""
+    return {
+        'result': {
+            'score': round(risk_score * 100, 1),
+            'risk_level': 'High' if risk_score > 0.5 else 'Low'
+        },
+        'strategies': get_retention_strategies(customer, customer.contract, risk_score),
+        'customer': {
+            'customer_id': customer.customer_id,
+            'tenure': customer.tenure,
+            'senior_citizen': customer.senior_citizen
+        }
+    }
 
 #  API RESTful
 @app.route('/api/customers', methods=['GET'])
 def api_get_customers():
     """
-    Obtener todos los clientes
+    Obtener clientes (paginación por cursor o streaming)
     ---
     tags:
       - Customers
+    parameters:
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Cursor (último CustomerID recibido). Activa la paginación.
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        description: Tamaño de página (máx. 1000). Activa la paginación.
+      - in: query
+        name: format
+        type: string
+        enum: [json, ndjson]
+        required: false
+        description: Formato del streaming cuando no se pagina.
     responses:
       200:
-        description: Lista de clientes activos
+        description: Lista de clientes activos (array JSON en streaming, NDJSON o página con next_after)
         schema:
           type: array
           items:
@@ -113,11 +252,66 @@ def api_get_customers():
               tenure:
                 type: integer
     """
-    customers = Customer.query.all()
-    output = []
-    for c in customers:
-        output.append({'id': c.customer_id, 'gender': c.gender, 'tenure': c.tenure})
-    return jsonify(output)
+    stmt = select(Customer.customer_id.label('id'), Customer.gender.label('gender'),
+                  Customer.tenure.label('tenure')).order_by(Customer.customer_id)
+
+    # Keyset pagination: ?after=<CustomerID>&limit=<n>
+    if 'after' in request.args or 'limit' in request.args:
+        limit = max(1, min(request.args.get('limit', CUSTOMER_PAGE_SIZE, type=int), CUSTOMER_PAGE_MAX))
+        after = request.args.get('after')
+        if after:
+            stmt = stmt.where(Customer.customer_id > after)
+        rows = [dict(r) for r in db.session.execute(stmt.limit(limit)).mappings()]
+        next_after = rows[-1]['id'] if len(rows) == limit else None
+        return jsonify({'data': rows, 'next_after': next_after})
+
+    # Streaming mode: server-side cursor, fixed-size batches
+    batches = iter_result_batches(db.session, stmt)
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_with_context(ndjson_chunks(batches)), mimetype='application/x-ndjson')
+    return Response(stream_with_context(json_array_chunks(batches)), mimetype='application/json')
+
+@app.route('/api/export/customers', methods=['GET'])
+def api_export_customers():
+    """
+    Exportación completa (cliente + contrato + internet + teléfono + predicción)
+    ---
+    tags:
+      - Customers
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [csv, parquet, arrow]
+        default: csv
+      - in: query
+        name: batch_size
+        type: integer
+        default: 50000
+        description: Filas leídas por lote del cursor (máx. 200000)
+    responses:
+      200:
+        description: Fichero en streaming (CSV, Parquet o Arrow IPC)
+      400:
+        description: Formato desconocido
+      401:
+        description: Sesión no iniciada
+      501:
+        description: Parquet / Arrow requieren pyarrow instalado
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': f"Unknown format '{fmt}'", 'formats': list(EXPORT_FORMATS)}), 400
+    if fmt != 'csv' and not pyarrow_available():
+        return jsonify({'message': 'pyarrow is not installed on the server'}), 501
+    batch_size = max(1, min(request.args.get('batch_size', DEFAULT_EXPORT_BATCH, type=int), EXPORT_BATCH_MAX))
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    chunks = export_chunks(iter_export_batches(db.session, batch_size), fmt)
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment;filename=clientguard_customers.{extension}'
+    })
 
 @app.route('/api/customers', methods=['POST'])
 def api_create_customer():
@@ -162,10 +356,83 @@ def api_create_customer():
         )
         db.session.add(new_cust)
         db.session.commit()
+        aggregate_cache.customer_added()
         return jsonify({'message': 'Cliente creado', 'id': new_cust.customer_id}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def imported_customers_changed():
+    # Chunks commit as they go, so even a failed import may have written rows
+    aggregate_cache.invalidate()
+    risk_cache.clear()
+
+@app.route('/api/customers/import', methods=['POST'])
+def api_import_customers():
+    """
+    Importación masiva de clientes (CSV o NDJSON)
+    ---
+    tags:
+      - Customers
+    consumes:
+      - text/csv
+      - application/x-ndjson
+      - multipart/form-data
+    parameters:
+      - in: query
+        name: format
+        type: string
+        enum: [csv, ndjson]
+        required: false
+        description: Por defecto se deduce del Content-Type (o de la extensión del fichero subido)
+      - in: query
+        name: chunk_size
+        type: integer
+        default: 5000
+        description: Filas por lote validado y por transacción (máx. 50000)
+      - in: query
+        name: score
+        type: boolean
+        default: false
+        description: Calcular la probabilidad de churn al importar (si no, se usa churn_probability del fichero)
+      - in: formData
+        name: file
+        type: file
+        required: false
+        description: Fichero a importar (alternativa a enviarlo como cuerpo)
+    responses:
+      200:
+        description: Resumen (insertados, rechazados, estadísticas por lote) y errores por fila
+      400:
+        description: Formato desconocido
+      401:
+        description: Sesión no iniciada
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        guessed = 'ndjson' if upload.filename and upload.filename.endswith(('.ndjson', '.jsonl')) else 'csv'
+    else:
+        stream = request.stream
+        guessed = IMPORT_CONTENT_TYPES.get(request.mimetype, 'csv')
+    fmt = request.args.get('format', guessed)
+    if fmt not in READERS:
+        return jsonify({'message': f"Unknown format '{fmt}'", 'formats': list(READERS)}), 400
+    chunk_size = max(1, min(request.args.get('chunk_size', DEFAULT_IMPORT_CHUNK, type=int), IMPORT_CHUNK_MAX))
+    score = request.args.get('score', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        summary = import_customers(db.session, READERS[fmt](stream), chunk_size=chunk_size, score=score)
+    except UnicodeDecodeError as e:
+        db.session.rollback()
+        return jsonify({'error': f'File is not UTF-8: {e}'}), 400
+    finally:
+        imported_customers_changed()
+    if summary['inserted']:
+        summary['cube'] = refresh_cube(db.session)
+        cube_store.invalidate()
+    return jsonify(summary)
+
 @app.route('/api/customers/<id>', methods=['PUT'])
 def api_update_customer(id):
     """
@@ -200,6 +467,7 @@ def api_update_customer(id):
     
     if 'tenure' in data: customer.tenure = data['tenure']
     db.session.commit()
+    risk_cache.invalidate(id)
     return jsonify({'message': f'Cliente {id} actualizado'})
 
 @app.route('/api/customers/<id>', methods=['DELETE'])
@@ -221,12 +489,240 @@ def api_delete_customer(id):
       404:
         description: Cliente no encontrado
     """
-    customer = Customer.query.get(id)
+    customer = load_customer(db.session, id)
     if not customer: return jsonify({'message': 'Cliente no encontrado'}), 404
+    removed = (contract_values(customer.contract),
+               customer.internet.internet_type if customer.internet else None,
+               customer.prediction.churn_probability if customer.prediction else None)
+    # Contract, internet, phone and prediction rows go with the customer (cascade)
     db.session.delete(customer)
     db.session.commit()
+    aggregate_cache.customer_removed(*removed)
+    risk_cache.invalidate(id)
     return jsonify({'message': f'Cliente {id} eliminado'})
 
+@app.route('/api/predictions/rescore', methods=['POST'])
+def api_rescore_predictions():
+    """
+    Recalcular toda la tabla de predicciones (motor vectorizado)
+    ---
+    tags:
+      - Predictions
+    parameters:
+      - in: query
+        name: batch_size
+        type: integer
+        required: false
+        description: Filas por lote de lectura
+        default: 50000
+    responses:
+      200:
+        description: Resumen del recálculo (filas, segundos)
+      401:
+        description: Sesión no iniciada
+      403:
+        description: Requiere el rol Manager
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    if session.get('role') != 'Manager': return jsonify({'message': 'Manager role required'}), 403
+    batch_size = request.args.get('batch_size', 50000, type=int)
+    summary = rescore_predictions(db.session, batch_size=max(1, batch_size))
+    aggregate_cache.invalidate()
+    risk_cache.clear()
+    return jsonify(summary)
+
+@app.route('/api/predictions/bands', methods=['GET'])
+def api_prediction_bands():
+    """
+    Número de clientes por banda de riesgo
+    ---
+    tags:
+      - Predictions
+    responses:
+      200:
+        description: Conteos low (<=50%), medium (50-80%) y high (>80%), mantenidos en la caché de agregados
+    """
+    stats = aggregate_cache.get(db.session)
+    return jsonify({'bands': stats['bands'], 'high_risk': stats['high_risk']})
+
+@app.route('/api/predictions/top', methods=['GET'])
+def api_top_predictions():
+    """
+    Clientes con mayor riesgo de churn
+    ---
+    tags:
+      - Predictions
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        default: 20
+        description: Número de clientes (máx. 1000)
+    responses:
+      200:
+        description: Clientes ordenados por probabilidad descendente
+    """
+    limit = max(1, min(request.args.get('limit', 20, type=int), CUSTOMER_PAGE_MAX))
+    # Backward walk of ix_predictions_band_probability; stops after `limit` rows
+    stmt = select(Predictions.customer_id, Predictions.churn_probability)\
+        .order_by(Predictions.risk_band.desc(), Predictions.churn_probability.desc(), Predictions.customer_id.desc())\
+        .limit(limit)
+    return jsonify([{'id': cid, 'probability': prob} for cid, prob in db.session.execute(stmt)])
+
+@app.route('/api/predictions/bulk', methods=['POST'])
+def api_bulk_predictions():
+    """
+    Guardar predicciones en bloque (upsert por lotes)
+    ---
+    tags:
+      - Predictions
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: array
+          items:
+            type: object
+            properties:
+              id:
+                type: string
+                example: "CUST-001"
+              probability:
+                type: number
+                example: 0.42
+    responses:
+      200:
+        description: Estadísticas por lote (filas, segundos, filas/seg)
+      400:
+        description: Datos inválidos (lista de filas rechazadas; probability debe estar entre 0 y 1)
+      401:
+        description: Sesión no iniciada
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return jsonify({'error': 'Expected a JSON array of {id, probability}'}), 400
+    # Same rules as the bulk import: nothing is written if any row is rejected
+    pairs, errors = [], []
+    for n, item in enumerate(data):
+        if not isinstance(item, dict):
+            errors.append({'row': n, 'id': None, 'errors': ['expected an object']})
+            continue
+        messages = []
+        if not isinstance(item.get('id'), str) or not item['id']:
+            messages.append(f"id: {'missing' if item.get('id') in (None, '') else 'invalid'} value")
+        probability = parse_probability(item.get('probability'))
+        if probability is None:
+            messages.append(f"probability: {'missing' if item.get('probability') in (None, '') else 'invalid'} value")
+        if messages:
+            errors.append({'row': n, 'id': item.get('id'), 'errors': messages})
+        else:
+            pairs.append((item['id'], probability))
+    if errors:
+        return jsonify({'error': f'{len(errors)} invalid rows', 'errors': errors[:1000]}), 400
+    try:
+        stats = upsert_predictions(db.session, pairs)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        aggregate_cache.invalidate()
+        risk_cache.invalidate(*(cid for cid, _ in pairs))
+    return jsonify({'rows': len(pairs), 'chunks': stats})
+
+@app.route('/api/predictions/score', methods=['POST'])
+def api_score_batch():
+    """
+    Scoring en lote (IDs de cliente o registros de características)
+    ---
+    tags:
+      - Predictions
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            customer_ids:
+              type: array
+              items:
+                type: string
+              example: ["CUST-001", "CUST-002"]
+            customers:
+              type: array
+              description: Registros sin guardar (tenure obligatorio; senior_citizen, partner, dependents, contract_mode, internet_type)
+              items:
+                type: object
+            save:
+              type: boolean
+              default: true
+              description: Guarda las predicciones nuevas de los IDs (como la herramienta de predicción; requiere sesión)
+            log:
+              type: boolean
+              default: false
+              description: Registra una consulta por ID (requiere sesión)
+    responses:
+      200:
+        description: Probabilidad, nivel de riesgo y estrategias por cliente, en el orden pedido
+      400:
+        description: Datos inválidos o lote demasiado grande
+      401:
+        description: save=true con IDs, o log=true, sin sesión iniciada
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with customer_ids and/or customers'}), 400
+    customer_ids = data.get('customer_ids') or []
+    records = data.get('customers') or []
+    if not isinstance(customer_ids, list) or not isinstance(records, list) \
+            or not all(isinstance(cid, str) for cid in customer_ids):
+        return jsonify({'error': 'customer_ids must be a list of strings and customers a list of objects'}), 400
+    if len(customer_ids) + len(records) > PREDICT_BATCH_MAX:
+        return jsonify({'error': f'At most {PREDICT_BATCH_MAX} customers per request'}), 400
+    log = bool(data.get('log', False))
+    save = bool(data.get('save', True)) and bool(customer_ids)
+    if (log or save) and 'user_id' not in session:
+        return jsonify({'message': 'Login required (pass "save": false to score without storing)'}), 401
+    try:
+        inline = parse_feature_records(records)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # One joined read for the ids, then one vectorized scoring call for ids and records together
+    unique_ids = list(dict.fromkeys(customer_ids))
+    columns = load_batch(db.session, unique_ids)
+    found = len(columns['customer_id'])
+    results = score_batch(merge_columns(columns, inline))
+    by_id = {r['id']: r for r in results[:found]}
+
+    fresh = [(r['id'], r['probability']) for r in by_id.values() if r['source'] == 'computed']
+    if fresh and save:
+        try:
+            upsert_predictions(db.session, fresh)
+            for _, probability in fresh:
+                aggregate_cache.prediction_changed(None, probability)
+            risk_cache.invalidate(*(cid for cid, _ in fresh))
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error saving predictions: {e}")
+
+    if log and by_id:
+        # Enqueued in memory; the LogWriter turns them into multi-row INSERTs
+        for cid in by_id:
+            log_time = datetime.datetime.now() # Own timestamp per row, like single consultations
+            log_writer.enqueue(next_log_id(), log_time, session['user_id'], cid)
+
+    return jsonify({
+        'results': [by_id[cid] for cid in customer_ids if cid in by_id] + results[found:],
+        'not_found': [cid for cid in unique_ids if cid not in by_id],
+        'logged': len(by_id) if log else 0
+    })
+
+def recent_log_entries():
+    return [log_entry(*row) for row in db.session.execute(recent_logs_select())]
+
 @app.route('/api/recent_logs', methods=['GET'])
 def api_recent_logs():
     """
@@ -234,24 +730,141 @@ def api_recent_logs():
     ---
     tags:
       - Monitoring
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Punto de partida ISO-8601; devuelve solo los eventos consultados después, en orden de escritura.
+      - in: query
+        name: after
+        type: integer
+        required: false
+        description: Cursor (next_after de la respuesta anterior); devuelve solo los eventos escritos después
     responses:
       200:
-        description: Últimos 10 eventos del sistema
+        description: Últimos 10 eventos del sistema, o {data, next_after} si se usa since o after
+      400:
+        description: Cursor inválido
     """
-    logs = db.session.query(ConsultationLogs, Employee, Customer).\
-        join(Employee, ConsultationLogs.employee_id == Employee.employee_id).\
-        join(Customer, ConsultationLogs.customer_id == Customer.customer_id).\
-        order_by(ConsultationLogs.consultation_time.desc()).limit(10).all()
-    
-    data = []
-    for log, emp, cust in logs:
-        data.append({
-            'time': log.consultation_time,
-            'employee': emp.employee_name,
-            'role': emp.role,
-            'customer': cust.customer_id
-        })
-    return jsonify(data)
+    if 'since' not in request.args and 'after' not in request.args:
+        return jsonify(recent_log_entries())
+    try:
+        after, since_time = parse_log_cursor(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    logs = db.session.execute(logs_since_select(after, since_time)).all()
+    return jsonify({'data': [log_entry(*row) for row in logs], 'next_after': next_log_cursor(logs, after)})
+
+@app.route('/api/stats/cache', methods=['GET'])
+def api_cache_stats():
+    """
+    Contadores de la caché de agregados
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Aciertos, fallos, ratio e invalidaciones de la caché
+    """
+    return jsonify(aggregate_cache.stats())
+
+@app.route('/api/stats/log_writer', methods=['GET'])
+def api_log_writer_stats():
+    """
+    Métricas del escritor asíncrono de logs
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Profundidad de cola, filas escritas/descartadas/fallidas y tiempos de flush
+    """
+    return jsonify(log_writer.stats())
+
+@app.route('/api/stats/risk_cache', methods=['GET'])
+def api_risk_cache_stats():
+    """
+    Contadores de la caché de vistas de riesgo (herramienta de predicción)
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Aciertos, fallos, ratio, tamaño, expulsiones, expiraciones e invalidaciones
+    """
+    return jsonify(risk_cache.stats())
+
+@app.route('/api/stats/rescore_queue', methods=['GET'])
+def api_rescore_queue_stats():
+    """
+    Métricas de la cola de reevaluación incremental (clientes modificados)
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Clientes marcados, pendientes, reevaluados, sin cambios, omitidos y tiempos de lote
+    """
+    return jsonify(rescore_queue.stats())
+
+@app.route('/api/stats/tenure_aging', methods=['GET'])
+def api_tenure_aging_stats():
+    """
+    Últimas ejecuciones del envejecimiento mensual de antigüedad
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Periodo, inicio, fin, clientes envejecidos y predicciones recalculadas por ejecución
+    """
+    return jsonify(recent_runs(db.session))
+
+
+#  HEALTH CHECKS
+# /healthz only says the process is serving (liveness); /readyz also needs a
+# database round trip, so load balancers stop routing to a worker that cannot
+# reach MySQL without restarting it.
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness del proceso
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: El proceso atiende peticiones
+    """
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: conexión a la base de datos y estado del pool
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Base de datos accesible
+      503:
+        description: Base de datos no disponible
+    """
+    started = time.perf_counter()
+    try:
+        ping_db()
+    except Exception as e:
+        print(f"Readiness check failed: {e}")
+        return jsonify({'status': 'unavailable', 'database': 'down'}), 503
+    return jsonify({
+        'status': 'ready',
+        'database': 'up',
+        'db_ms': round((time.perf_counter() - started) * 1000, 2),
+        'pool': db.engine.pool.status(),
+        'log_queue_depth': log_writer.stats()['depth']
+    })
 
 
 #  GUI ROUTES
@@ -280,28 +893,151 @@ def logout():
 def dashboard():
     if 'user_id' not in session: return redirect(url_for('login'))
     
-    results = db.session.query(Customer, Predictions).outerjoin(Predictions, Customer.customer_id == Predictions.customer_id).all()
-    
-    # Simple analytics for charts
-    internet_stats = db.session.query(InternetService.internet_type, func.count(InternetService.customer_id)).group_by(InternetService.internet_type).all()
-    labels_int = [x[0] for x in internet_stats]
-    data_int = [x[1] for x in internet_stats]
-
-    contract_stats = db.session.query(Contract.contract_mode, func.count(Contract.customer_id)).group_by(Contract.contract_mode).all()
-    labels_cont = [x[0] for x in contract_stats]
-    data_cont = [x[1] for x in contract_stats]
-
-    payment_stats = db.session.query(Contract.payment_method, func.count(Contract.customer_id)).group_by(Contract.payment_method).all()
-    labels_pay = [x[0] for x in payment_stats]
-    data_pay = [x[1] for x in payment_stats]
+    # The customer table itself is loaded page by page from /api/dashboard/customers;
+    # chart figures come from the aggregate cache (no queries on a hit)
+    stats = aggregate_cache.get(db.session)
+    labels_int = [x[0] for x in stats['internet']]
+    data_int = [x[1] for x in stats['internet']]
+
+    labels_cont = [x[0] for x in stats['contract']]
+    data_cont = [x[1] for x in stats['contract']]
+
+    labels_pay = [x[0] for x in stats['payment']]
+    data_pay = [x[1] for x in stats['payment']]
     
     return render_template('dashboard.html', 
-                           data=results, 
+                           total_customers=stats['customers'], 
+                           page_size=DASHBOARD_PAGE_SIZE,
                            labels_int=labels_int, data_int=data_int,
                            labels_cont=labels_cont, data_cont=data_cont,
                            labels_pay=labels_pay, data_pay=data_pay,
                            user=session['user_name'])
 
+@app.route('/api/dashboard/customers', methods=['GET'])
+def api_dashboard_customers():
+    """
+    Tabla del dashboard paginada en servidor
+    ---
+    tags:
+      - Dashboard
+    parameters:
+      - in: query
+        name: per_page
+        type: integer
+        default: 25
+        description: Filas por página (máx. 200)
+      - in: query
+        name: sort
+        type: string
+        enum: [id, churn, tenure]
+        default: id
+      - in: query
+        name: order
+        type: string
+        enum: [asc, desc]
+        default: asc
+      - in: query
+        name: band
+        type: string
+        enum: [high, medium, low, pending]
+        required: false
+        description: Filtro por banda de riesgo (>80%, 50-80%, <=50%, sin predicción)
+      - in: query
+        name: after
+        type: string
+        required: false
+        description: Valor de ordenación de la última fila vista (next_after de la página anterior; 'pending' para clientes sin predicción al ordenar por churn)
+      - in: query
+        name: after_id
+        type: string
+        required: false
+        description: CustomerID de la última fila vista (next_after_id de la página anterior)
+    responses:
+      200:
+        description: Página de clientes con su probabilidad de churn, total del filtro y cursor de la página siguiente
+      400:
+        description: Cursor no válido
+      401:
+        description: Sesión no iniciada
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+
+    per_page = max(1, min(request.args.get('per_page', DASHBOARD_PAGE_SIZE, type=int), DASHBOARD_PAGE_MAX))
+    sort = request.args.get('sort') if request.args.get('sort') in DASHBOARD_SORTS else 'id'
+    keys, parse_after, cursor_value = DASHBOARD_SORTS[sort]
+    descending = request.args.get('order') == 'desc'
+
+    columns = (Customer.customer_id, Customer.gender, Customer.senior_citizen, Customer.partner,
+               Customer.dependents, Customer.tenure, Predictions.churn_probability)
+
+    # Totals come from the aggregate cache (band counts), not a COUNT(*) per page
+    stats = aggregate_cache.get(db.session)
+    band = request.args.get('band')
+    if band not in RISK_BANDS:
+        band = None
+        total = stats['customers']
+    elif band != 'pending':
+        total = stats['bands'][band]
+    else:
+        total = stats['customers'] - sum(stats['bands'].values())
+
+    # Key ranges in page order: (statement, key columns ending in the CustomerID
+    # they are ordered on; the scored range reads it from predictions so the
+    # whole key is ix_predictions_band_probability's order)
+    if sort == 'churn':
+        scored = select(*columns).join(Predictions, Customer.customer_id == Predictions.customer_id)
+        if band is not None:
+            scored = scored.where(RISK_BANDS[band])
+        pending = select(*columns).outerjoin(Predictions, Customer.customer_id == Predictions.customer_id)\
+            .where(RISK_BANDS['pending'])
+        ranges = [(pending, (Customer.customer_id,)), (scored, keys + (Predictions.customer_id,))]
+        if band is not None:
+            ranges = ranges[:1] if band == 'pending' else ranges[1:]
+    else:
+        stmt = select(*columns).outerjoin(Predictions, Customer.customer_id == Predictions.customer_id)
+        if band is not None:
+            stmt = stmt.where(RISK_BANDS[band])
+        ranges = [(stmt, keys + (Customer.customer_id,))]
+    if descending:
+        ranges.reverse()
+
+    # Keyset on the range's key columns, all in the requested direction
+    after_id = request.args.get('after_id')
+    start, after = 0, None
+    if after_id is not None:
+        try:
+            after = parse_after(request.args.get('after', after_id))
+        except ValueError:
+            return jsonify({'error': 'after does not match the sort key'}), 400
+        if after is None: # Churn cursor inside the unscored range
+            after = ()
+        after += (after_id,)
+        start = next((i for i, (_, range_keys) in enumerate(ranges) if len(range_keys) == len(after)), len(ranges))
+
+    rows = []
+    for i, (stmt, range_keys) in enumerate(ranges[start:]):
+        if i == 0 and after_id is not None:
+            stmt = stmt.where(keyset_beyond(range_keys, after, descending))
+        order = [c.desc() if descending else c.asc() for c in range_keys]
+        rows += [dict(r) for r in db.session.execute(stmt.order_by(*order).limit(per_page + 1 - len(rows))).mappings()]
+        if len(rows) > per_page:
+            break
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    next_after = next_after_id = None
+    if has_more:
+        next_after, next_after_id = cursor_value(rows[-1]), rows[-1]['customer_id']
+
+    return jsonify({'data': rows, 'per_page': per_page, 'total': total,
+                    'next_after': next_after, 'next_after_id': next_after_id})
+
+
+def keyset_beyond(columns, values, descending):
+    """Rows past values in the lexicographic order of columns."""
+    beyond = (lambda col, value: col < value) if descending else (lambda col, value: col > value)
+    return or_(*[and_(*[c == v for c, v in zip(columns[:i], values[:i])], beyond(columns[i], values[i]))
+                 for i in range(len(columns))])
+
 # PREDICTION TOOL
 @app.route('/predict', methods=['GET', 'POST'])
 def predict_tool():
@@ -314,66 +1050,55 @@ def predict_tool():
     if request.method == 'POST':
         cust_id = request.form['customer_id']
         
+        # Cached view first; on a miss, customer + contract + internet + phone + prediction in one query
+        view = risk_cache.get(cust_id)
+        if view is not None:
+            flash(f'Análisis recuperado de la base de datos para {cust_id}.', 'info')
+        else:
+            generation = risk_cache.generation(cust_id)
+            customer = load_customer(db.session, cust_id)
         
-        customer = Customer.query.get(cust_id)
-        
-        if customer:
-            
-            pred = Predictions.query.get(cust_id)
-            
-            if pred:
+            if customer:
                 
-                risk_score = pred.churn_probability
-                flash(f'Análisis recuperado de la base de datos para {cust_id}.', 'info')
-            else:
+                pred = customer.prediction
+                new_score = None
                 
-                contract = Contract.query.get(cust_id)
-                internet = InternetService.query.get(cust_id)
+                if pred:
+                    
+                    risk_score = pred.churn_probability
+                    flash(f'Análisis recuperado de la base de datos para {cust_id}.', 'info')
+                else:
+                    
+                    risk_score = calculate_churn_risk(customer, customer.contract, customer.internet, customer.phone)
+                    
+                    customer.prediction = Predictions(customer_id=cust_id, churn_probability=risk_score)
+                    new_score = risk_score
+                    flash(f'Nuevo análisis generado y guardado para {cust_id}.', 'success')
                 
-                risk_score = calculate_churn_risk(customer, contract, internet)
+                view = risk_view(customer, risk_score)
                 
-                n
-                pred = Predictions(customer_id=cust_id, churn_probability=risk_score)
-                db.session.add(pred)
-                flash(f'Nuevo análisis generado y guardado para {cust_id}.', 'success')
-            
-            
-            try:
-                new_log = ConsultationLogs(
-                    log_id=f"LOG-{int(time.time())}",
-                    consultation_time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    employee_id=session['user_id'],
-                    customer_id=cust_id
-                )
-                db.session.add(new_log)
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                print(f"Error logging: {e}")
-            
-            
-            result = {
-                'score': round(risk_score * 100, 1),
-                'risk_level': 'High' if risk_score > 0.5 else 'Low'
-            }
-            
+                if new_score is not None:
+                    try:
+                        db.session.commit()
+                        aggregate_cache.prediction_changed(None, new_score)
+                        risk_cache.put(cust_id, view, generation)
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error saving prediction: {e}")
+                else:
+                    risk_cache.put(cust_id, view, generation)
+        
+        if view is not None:
+            result, strategies, customer_data = view['result'], view['strategies'], view['customer']
             
-            if risk_score > 0.80:
-                # Recuperamos los objetos si no los tenemos cargados del "Caso B"
-                contract = Contract.query.get(cust_id)
-                strategies = get_retention_strategies(customer, contract, risk_score)
-                
-            customer_data = customer 
+            # Log row is written in the background (in-memory enqueue only)
+            log_time = datetime.datetime.now()
+            log_writer.enqueue(next_log_id(), log_time, session['user_id'], cust_id)
             
         else:
             flash(f'Customer {cust_id} not found.', 'danger')
 
     return render_template('predict.html', result=result, strategies=strategies, c=customer_data)
-<<<<<<< HEAD
-
-# --- CRUD OPERATIONS ---
-=======
->>>>>>> ea8cb0ce8b092116bb2c0de5d42614f6abc76497
 
 # CRUD OPERATIONS
 @app.route('/add_web', methods=['POST'])
@@ -404,6 +1129,7 @@ def add_customer_web():
         
         
         db.session.commit()
+        aggregate_cache.customer_added(contract_values(new_contract), new_internet.internet_type)
         flash('Customer registered. Status: Pending Analysis (N/A).', 'success')
     except Exception as e:
         flash(f'Error: {str(e)}', 'danger')
@@ -425,6 +1151,7 @@ def update_customer_web():
         customer.dependents = 'dependents' in request.form
             
         db.session.commit()
+        risk_cache.invalidate(cust_id)
         flash(f'Customer {cust_id} attributes updated.', 'info')
     
     return redirect(url_for('dashboard'))
@@ -433,16 +1160,20 @@ def update_customer_web():
 def delete_customer_web(id):
     if 'user_id' not in session: return redirect(url_for('login'))
     
-    Predictions.query.filter_by(customer_id=id).delete()
-    InternetService.query.filter_by(customer_id=id).delete()
-    Contract.query.filter_by(customer_id=id).delete()
-    PhoneService.query.filter_by(customer_id=id).delete()
-    ConsultationLogs.query.filter_by(customer_id=id).delete()
-    
-    customer = Customer.query.get(id)
+    customer = load_customer(db.session, id)
     if customer:
+        # Remember what the aggregates counted for this customer before deleting
+        removed = (contract_values(customer.contract),
+                   customer.internet.internet_type if customer.internet else None,
+                   customer.prediction.churn_probability if customer.prediction else None)
+
+        log_writer.flush() # Queued logs for this customer must land before they are deleted
+        ConsultationLogs.query.filter_by(customer_id=id).delete()
+        # Contract, internet, phone and prediction rows go with the customer (cascade)
         db.session.delete(customer)
         db.session.commit()
+        aggregate_cache.customer_removed(*removed)
+        risk_cache.invalidate(id)
         flash(f'Customer {id} deleted.', 'warning')
     return redirect(url_for('dashboard'))
 
@@ -487,13 +1218,15 @@ def manage_services(customer_id):
     if 'user_id' not in session: return redirect(url_for('login'))
     
    
-    customer = Customer.query.get_or_404(customer_id)
-    contract = Contract.query.get(customer_id)
-    internet = InternetService.query.get(customer_id)
-    phone = PhoneService.query.get(customer_id)
+    customer = load_customer(db.session, customer_id)
+    if not customer: abort(404)
+    contract, internet, phone = customer.contract, customer.internet, customer.phone
 
     if request.method == 'POST':
-        
+        old_contract = contract_values(contract)
+        old_internet = internet.internet_type if internet else None
+        old_risk = customer.prediction.churn_probability if customer.prediction else None
+
         if not contract:
             contract = Contract(customer_id=customer_id, contract_mode="Month-to-month", paperless_billing=0, payment_method="Mailed check", monthly_charges=0, total_charges=0)
             db.session.add(contract)
@@ -528,16 +1261,19 @@ def manage_services(customer_id):
         
         # Calculate Churn
         
-        new_risk = calculate_churn_risk(customer, contract, internet)
+        new_risk = calculate_churn_risk(customer, contract, internet, phone)
         
-        # Save in predictions
-        pred = Predictions.query.get(customer_id)
-        if not pred:
-            pred = Predictions(customer_id=customer_id)
-            db.session.add(pred)
-        pred.churn_probability = new_risk
+        # Save in predictions (single upsert)
+        upsert_predictions(db.session, [(customer_id, new_risk)], commit=False)
 
+        new_contract = contract_values(contract)
+        new_internet = internet.internet_type
         db.session.commit()
+
+        aggregate_cache.contract_changed(old_contract, new_contract)
+        aggregate_cache.internet_changed(old_internet, new_internet)
+        aggregate_cache.prediction_changed(old_risk, new_risk)
+        risk_cache.invalidate(customer_id)
         
         flash('Services updated and Churn Probability recalculated.', 'success')
         return redirect(url_for('dashboard'))
@@ -546,92 +1282,338 @@ def manage_services(customer_id):
 
 @app.route('/history')
 def history():
-    return render_template('history.html')
+    # Live stream only where the async app is mounted (asgi.py); plain polling otherwise
+    return render_template('history.html', stream_url=os.environ.get('LOG_STREAM_URL'))
 
 
 #  REPORTING MODULE
 
-class PDF(FPDF):
-    def header(self):
-        
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, 'ClientGuard - Executive Report', 0, 1, 'C')
-        self.ln(5)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
 @app.route('/reports')
 def reports():
     if 'user_id' not in session: return redirect(url_for('login'))
     
-    total_customers = Customer.query.count()
-    
-    total_revenue = db.session.query(func.sum(Contract.monthly_charges)).scalar() or 0
-    
-    avg_churn = db.session.query(func.avg(Predictions.churn_probability)).scalar() or 0
-    
-    high_risk_count = Predictions.query.filter(Predictions.churn_probability > 0.80).count()
-    
-    contracts = db.session.query(Contract.contract_mode, func.count(Contract.customer_id)).group_by(Contract.contract_mode).all()
+    stats = aggregate_cache.get(db.session)
 
     return render_template('reports.html', 
-                           total=total_customers, 
-                           revenue=round(total_revenue, 2),
-                           avg_churn=round(avg_churn * 100, 1),
-                           risk_count=high_risk_count,
-                           contracts=contracts)
+                           total=stats['customers'], 
+                           revenue=round(stats['revenue'], 2),
+                           avg_churn=round(stats['avg_churn'] * 100, 1),
+                           risk_count=stats['high_risk'],
+                           contracts=stats['contract'])
 
 @app.route('/download_report')
 def download_report():
     if 'user_id' not in session: return redirect(url_for('login'))
     
-    total_revenue = db.session.query(func.sum(Contract.monthly_charges)).scalar() or 0
-    high_risk_customers = db.session.query(Customer, Predictions).join(Predictions).filter(Predictions.churn_probability > 0.80).limit(20).all()
-    
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(200, 10, txt="1. Executive Summary", ln=True)
-    pdf.set_font("Arial", size=12)
-    
-    pdf.cell(200, 10, txt=f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=True)
-    pdf.cell(200, 10, txt=f"Total Monthly Revenue: ${round(total_revenue, 2):,}", ln=True)
-    pdf.cell(200, 10, txt=f"High Risk Customers (>80%): {len(high_risk_customers)} (Showing top 20)", ln=True)
-    pdf.ln(10)
-    
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(200, 10, txt="2. Priority Action List (High Risk)", ln=True)
-    pdf.set_font("Arial", size=10)
-    
-    pdf.set_fill_color(200, 220, 255)
-    pdf.cell(40, 10, 'Customer ID', 1, 0, 'C', 1)
-    pdf.cell(30, 10, 'Tenure', 1, 0, 'C', 1)
-    pdf.cell(40, 10, 'Contract', 1, 0, 'C', 1)
-    pdf.cell(30, 10, 'Risk %', 1, 1, 'C', 1)
-    
-    for cust, pred in high_risk_customers:
-        contract = Contract.query.get(cust.customer_id)
-        mode = contract.contract_mode if contract else "N/A"
-        
-        pdf.cell(40, 10, str(cust.customer_id), 1)
-        pdf.cell(30, 10, f"{cust.tenure} months", 1)
-        pdf.cell(40, 10, str(mode), 1)
-        
-        pdf.set_text_color(220, 50, 50)
-        pdf.cell(30, 10, f"{int(pred.churn_probability * 100)}%", 1, 1, 'C')
-        pdf.set_text_color(0, 0, 0) # Reset color
+    # Rendered in the background; an up-to-date cached copy is sent right away
+    job = report_jobs.submit(db.session, HIGH_RISK_THRESHOLD)
+    if job['status'] == 'done':
+        return send_report(job)
+    return redirect(url_for('reports', job=job['id']))
 
-    response = pdf.output(dest='S').encode('latin-1')
-    
-    from flask import Response
-    return Response(response, mimetype='application/pdf', headers={
-        'Content-Disposition': 'attachment;filename=clientguard_report.pdf'
-    })
+def send_report(job):
+    path = report_jobs.artifact(job['id'])
+    if path is None: abort(410)
+    # The file's mtime tracks cache use; Last-Modified is when this copy was rendered
+    rendered_at = datetime.datetime.fromisoformat(job['rendered_at']) if job.get('rendered_at') else None
+    response = send_file(os.path.abspath(path), mimetype='application/pdf', as_attachment=True,
+                         download_name='clientguard_report.pdf', last_modified=rendered_at)
+    if rendered_at is not None:
+        response.headers['X-Report-Rendered-At'] = job['rendered_at']
+    return response
+
+def report_job_json(job):
+    job['status_url'] = url_for('api_report_job', job_id=job['id'])
+    job['download_url'] = url_for('api_report_job_download', job_id=job['id']) if job['status'] == 'done' else None
+    return job
+
+@app.route('/api/reports/jobs', methods=['POST'])
+def api_create_report_job():
+    """
+    Encola la generación del informe PDF ejecutivo
+    ---
+    tags:
+      - Reports
+    responses:
+      200:
+        description: Informe idéntico ya disponible en caché (status done)
+      202:
+        description: Trabajo encolado; consultar status_url hasta que termine
+      401:
+        description: Sesión no iniciada
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    job = report_jobs.submit(db.session, HIGH_RISK_THRESHOLD)
+    return jsonify(report_job_json(job)), 200 if job['status'] == 'done' else 202
+
+@app.route('/api/reports/jobs/<job_id>', methods=['GET'])
+def api_report_job(job_id):
+    """
+    Estado de un trabajo de informe
+    ---
+    tags:
+      - Reports
+    parameters:
+      - in: path
+        name: job_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: queued, running, done (con rendered_at), failed o evicted (volver a encolar)
+      401:
+        description: Sesión no iniciada
+      404:
+        description: Trabajo desconocido
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    job = report_jobs.get(job_id)
+    if job is None: return jsonify({'message': 'Job not found'}), 404
+    return jsonify(report_job_json(job))
+
+@app.route('/api/reports/jobs/<job_id>/download', methods=['GET'])
+def api_report_job_download(job_id):
+    """
+    Descarga el PDF de un trabajo terminado
+    ---
+    tags:
+      - Reports
+    parameters:
+      - in: path
+        name: job_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Informe PDF
+      401:
+        description: Sesión no iniciada
+      404:
+        description: Trabajo desconocido
+      409:
+        description: El informe aún no está listo
+      410:
+        description: El informe fue expulsado de la caché; encolar de nuevo
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    job = report_jobs.get(job_id)
+    if job is None: return jsonify({'message': 'Job not found'}), 404
+    if job['status'] == 'evicted': return jsonify(report_job_json(job)), 410
+    if job['status'] != 'done': return jsonify(report_job_json(job)), 409
+    return send_report(job)
+
+@app.route('/api/stats/report_jobs', methods=['GET'])
+def api_report_job_stats():
+    """
+    Métricas de la cola de informes y de su caché en disco
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Trabajos enviados, aciertos de caché, renderizados, fallidos, expulsados y bytes en caché
+    """
+    return jsonify(report_jobs.stats())
+
+@app.route('/api/cube', methods=['GET'])
+def api_churn_cube():
+    """
+    Análisis de churn por dimensiones (cubo materializado)
+    ---
+    tags:
+      - Reports
+    parameters:
+      - in: query
+        name: by
+        type: string
+        required: false
+        description: "Dimensiones de desglose separadas por comas: contract_mode, internet_type, payment_method, senior_citizen, partner, dependents, tenure_bucket"
+      - in: query
+        name: contract_mode
+        type: string
+        required: false
+        description: "Filtro (corte); igual para cualquier otra dimensión. Varios valores separados por comas"
+    responses:
+      200:
+        description: Celdas agrupadas (clientes, analizados, churn medio, alto riesgo, ingresos) y total del corte
+      400:
+        description: Dimensión o valor no válido
+      503:
+        description: Cubo todavía no generado
+    """
+    try:
+        by, filters = parse_cube_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cube = cube_store.get(db.session)
+    if cube is None:
+        return jsonify({'message': 'Cube not built yet (run flask refresh-cube)'}), 503
+    cells, total = cube.query(by, filters)
+    return jsonify({'version': cube.version, 'refreshed_at': cube.refreshed_at.isoformat(timespec='seconds'),
+                    'by': by, 'filters': filters, 'cells': cells, 'total': total})
+
+@app.route('/api/cube/dimensions', methods=['GET'])
+def api_churn_cube_dimensions():
+    """
+    Valores de cada dimensión del cubo de churn
+    ---
+    tags:
+      - Reports
+    responses:
+      200:
+        description: Miembros por dimensión, en orden de presentación
+      503:
+        description: Cubo todavía no generado
+    """
+    cube = cube_store.get(db.session)
+    if cube is None:
+        return jsonify({'message': 'Cube not built yet (run flask refresh-cube)'}), 503
+    return jsonify({'version': cube.version, 'dimensions': {name: cube.members[name] for name in CUBE_DIMENSIONS}})
+
+@app.route('/api/cube/refresh', methods=['POST'])
+def api_refresh_churn_cube():
+    """
+    Regenerar el cubo de churn (una pasada agrupada sobre las tablas base)
+    ---
+    tags:
+      - Reports
+    responses:
+      200:
+        description: Nueva versión, celdas, clientes y segundos
+      401:
+        description: Sesión no iniciada
+      403:
+        description: Requiere el rol Manager
+    """
+    if 'user_id' not in session: return jsonify({'message': 'Login required'}), 401
+    if session.get('role') != 'Manager': return jsonify({'message': 'Manager role required'}), 403
+    summary = refresh_cube(db.session)
+    cube_store.invalidate()
+    return jsonify(summary)
+
+@app.route('/api/stats/cube', methods=['GET'])
+def api_cube_stats():
+    """
+    Estado de la copia local del cubo de churn
+    ---
+    tags:
+      - Monitoring
+    responses:
+      200:
+        description: Versión cargada, fecha de generación, celdas, consultas y recargas
+    """
+    return jsonify(cube_store.stats())
+
+
+#  CLI COMMANDS
+@app.cli.command('rescore')
+@click.option('--batch-size', default=50000, show_default=True, help='Rows per keyset batch.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows per upsert statement.')
+def rescore_command(batch_size, chunk_size):
+    """Rescore the whole predictions table in one pass."""
+    def report(stats):
+        click.echo(f"  chunk {stats['chunk']}: {stats['rows']} rows, {stats['rows_per_sec']} rows/sec")
+    summary = rescore_predictions(db.session, batch_size=batch_size, chunk_size=chunk_size, on_chunk=report)
+    risk_cache.clear() # Reaches the other workers only through a shared backend
+    click.echo(f"Rescored {summary['rows']} predictions in {summary['seconds']}s")
+
+
+@app.cli.command('age-tenure')
+@click.option('--period', default=None, help='Month being closed (YYYY-MM). Default: the current month.')
+@click.option('--chunk-size', default=DEFAULT_AGING_CHUNK, show_default=True, help='Customers per UPDATE transaction.')
+@click.option('--batch-size', default=50000, show_default=True, help='Rows per rescoring batch.')
+def age_tenure_command(period, chunk_size, batch_size):
+    """Monthly roll-forward: tenure + 1, total charges + monthly charges, rescore boundary crossers."""
+    if period is not None:
+        try:
+            datetime.datetime.strptime(period, PERIOD_FORMAT)
+        except ValueError:
+            raise click.BadParameter('expected YYYY-MM', param_hint='--period')
+    def report(stats):
+        click.echo(f"  up to {stats['upto']}: {stats['rows']} customers in {stats['seconds']}s")
+    summary = run_tenure_aging(db.session, period, chunk_size=chunk_size, batch_size=batch_size, on_chunk=report)
+    if summary['status'] == 'skipped':
+        click.echo(f"Period {summary['period']} already aged at {summary['finished_at']}")
+        return
+    aggregate_cache.invalidate()
+    risk_cache.clear() # Reaches the other workers only through a shared backend
+    click.echo(f"Aged {summary['customers_aged']} customers for {summary['period']} in {summary['aging_seconds']}s, "
+               f"rescored {summary['rescored']} ({summary['rescore_scope']}) in {summary['seconds']}s total")
+    cube = refresh_cube(db.session) # Every customer moved a month; buckets shift
+    click.echo(f"Churn cube v{cube['version']} rebuilt in {cube['seconds']}s")
+
+
+@app.cli.command('refresh-cube')
+def refresh_cube_command():
+    """Rebuild the materialized churn cube."""
+    summary = refresh_cube(db.session)
+    click.echo(f"Churn cube v{summary['version']}: {summary['cells']} cells over {summary['customers']} customers "
+               f"in {summary['seconds']}s")
+
+
+@app.cli.command('import-customers')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(READERS)), default=None, help='Default: from the file extension.')
+@click.option('--chunk-size', default=DEFAULT_IMPORT_CHUNK, show_default=True, help='Rows per validated chunk / transaction.')
+@click.option('--score/--no-score', default=False, show_default=True, help='Score churn inline.')
+def import_customers_command(path, fmt, chunk_size, score):
+    """Bulk-import customers from a CSV or NDJSON file."""
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    def report(stats):
+        click.echo(f"  chunk {stats['chunk']}: {stats['inserted']}/{stats['rows']} rows, {stats['rows_per_sec']} rows/sec")
+    with open(path, 'rb') as f:
+        try:
+            summary = import_customers(db.session, READERS[fmt](f), chunk_size=chunk_size, score=score, on_chunk=report)
+        finally:
+            imported_customers_changed()
+    for error in summary['errors']:
+        click.echo(f"  row {error['row']} ({error['id']}): {'; '.join(error['errors'])}")
+    if summary['errors_truncated']:
+        click.echo(f"  ... and {summary['rejected'] - len(summary['errors'])} more rejected rows")
+    click.echo(f"Imported {summary['inserted']} of {summary['rows']} rows ({summary['rejected']} rejected, {summary['scored']} predictions)")
+    if summary['inserted']:
+        cube = refresh_cube(db.session)
+        click.echo(f"Churn cube v{cube['version']} rebuilt in {cube['seconds']}s")
+
+
+@app.cli.command('export')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--out', default=None, help='Output path (default: customers.<format>).')
+@click.option('--batch-size', default=DEFAULT_EXPORT_BATCH, show_default=True, help='Rows per cursor batch.')
+def export_command(fmt, out, batch_size):
+    """Export every customer with contract, services and prediction."""
+    if fmt != 'csv' and not pyarrow_available():
+        raise click.ClickException('Parquet / Arrow export needs pyarrow (pip install pyarrow)')
+    out = out or f"customers.{EXPORT_FORMATS[fmt][1]}"
+    start = time.perf_counter()
+    def report(rows):
+        click.echo(f"  {rows} rows, {rows / (time.perf_counter() - start):,.0f} rows/sec")
+    rows = export_to_file(db.session, out, fmt, batch_size=batch_size, on_chunk=report)
+    click.echo(f"Exported {rows} rows to {out} in {time.perf_counter() - start:.1f}s")
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    db.create_all()
+    applied = run_migrations(db.engine)
+    click.echo(f"Applied: {', '.join(applied)}" if applied else "Schema is up to date")
+
+
+@app.cli.command('train-model')
+@click.option('--out', default=DEFAULT_MODEL_PATH, show_default=True, help='Model directory to write.')
+@click.option('--labels', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='CSV with customer_id,churn. Without it the stored churn probabilities are the targets.')
+@click.option('--sample', default=DEFAULT_TRAIN_SAMPLE, show_default=True, help='Training rows (uniform sample).')
+@click.option('--l2', default=1.0, show_default=True, help='L2 regularization strength.')
+def train_model_command(out, labels, sample, l2):
+    """Train the logistic churn model offline from the database tables."""
+    meta = train_model(db.session, out, labels_path=labels, sample=sample, l2=l2)
+    trained = meta['trained']
+    click.echo(f"Trained on {trained['rows']} rows ({trained['target']}) in {trained['iterations']} iterations: "
+               f"{trained['metrics']}")
+    click.echo(f"Model written to {out}. Serve it with CHURN_SCORER=logistic CHURN_MODEL_PATH={out}, "
+               f"then run `flask --app app rescore` to refresh stored predictions.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+import contextlib
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from app import app as flask_app
+from async_api import create_async_api
+
+#  ASGI ENTRY POINT
+# `uvicorn asgi:app --workers 4`: the async read API under /async/api, and
+# every other path handed to the existing Flask app (run in a thread pool).
+# The async routes that need a login read the same signed session cookie.
+# Schema creation and migrations stay with the Gunicorn service
+# (gunicorn.conf.py) or `flask --app app migrate`.
+
+def flask_session(cookies):
+    """The Flask session in the request's cookie, or {} if it is missing, expired or not signed by us."""
+    value = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not value or serializer is None:
+        return {}
+    try:
+        return serializer.loads(value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+async_api = create_async_api(flask_app.config['SQLALCHEMY_DATABASE_URI'], load_session=flask_session)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    yield
+    await async_api.state.engine.dispose()
+
+
+app = Starlette(routes=[
+    Mount('/async/api', app=async_api),
+    Mount('/', app=WSGIMiddleware(flask_app)),
+], lifespan=lifespan)
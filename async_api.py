@@ -0,0 +1,302 @@
+import os
+import json
+import asyncio
+from collections import deque
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from models import Customer, Predictions, RISK_BAND_NAMES, risk_band
+from export import export_select
+from log_feed import (LOG_RECENT_LIMIT, LOG_SINCE_LIMIT, log_entry, recent_logs_select, logs_since_select,
+                      latest_sequenced_logs_select, parse_log_cursor, next_log_cursor)
+
+#  ASYNC READ API
+# Read-only lookups for high-concurrency callers (CTI / IVR): customer,
+# prediction and recent consultation logs, served from an asyncio event loop
+# over an async driver (aiomysql / aiosqlite) and its own connection pool, so
+# thousands of waiting lookups cost coroutines instead of blocked threads.
+# Queries are the same Core statements the sync routes and exports build
+# from models.py. Mounted next to the Flask app by asgi.py.
+#
+# Customer and prediction lookups need the same logged-in session as the
+# Flask routes: asgi.py passes a loader that reads the Flask session cookie.
+#
+# The live consultation feed (SSE) lives here too. One LogStreamHub per
+# process polls the shared LogSeq cursor (one query per LOG_STREAM_POLL,
+# whatever the number of clients) and fans new rows out to per-client
+# asyncio queues; a ring of recent events answers reconnects without a
+# query. Clients see logs from every worker and never hold a request thread.
+
+ASYNC_DRIVERS = {'mysql': 'mysql+aiomysql', 'sqlite': 'sqlite+aiosqlite'}
+LOG_STREAM_HEARTBEAT = 15
+
+
+def async_database_url(database_url):
+    """The same database behind its asyncio driver (mysql+pymysql -> mysql+aiomysql)."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    if url.drivername == ASYNC_DRIVERS[backend]:
+        return url
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(url):
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 280))
+    }
+    if url.get_backend_name() != 'sqlite':
+        options['pool_size'] = int(os.environ.get('ASYNC_DB_POOL_SIZE', 20))
+        options['max_overflow'] = int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 20))
+        options['pool_timeout'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    return options
+
+
+def _login_required(request):
+    session = request.app.state.load_session(request.cookies)
+    if 'user_id' not in session:
+        return JSONResponse({'message': 'Login required'}, status_code=401)
+    return None
+
+
+async def customer_detail(request):
+    denied = _login_required(request)
+    if denied is not None: return denied
+    customer_id = request.path_params['customer_id']
+    async with request.app.state.engine.connect() as conn:
+        result = await conn.execute(export_select().where(Customer.customer_id == customer_id))
+        row = result.mappings().first()
+    if row is None:
+        return JSONResponse({'message': 'Cliente no encontrado'}, status_code=404)
+    data = dict(row)
+    probability = data['churn_probability']
+    data['risk_band'] = RISK_BAND_NAMES[risk_band(probability)] if probability is not None else 'pending'
+    return JSONResponse(data)
+
+
+async def prediction_detail(request):
+    denied = _login_required(request)
+    if denied is not None: return denied
+    customer_id = request.path_params['customer_id']
+    stmt = select(Predictions.churn_probability, Predictions.risk_band)\
+        .where(Predictions.customer_id == customer_id)
+    async with request.app.state.engine.connect() as conn:
+        row = (await conn.execute(stmt)).first()
+    if row is None:
+        return JSONResponse({'message': 'Predicción no encontrada'}, status_code=404)
+    probability, band = row
+    return JSONResponse({'id': customer_id, 'probability': probability, 'risk_band': RISK_BAND_NAMES[band]})
+
+
+async def recent_logs(request):
+    """Same contract as GET /api/recent_logs: latest 10, or {data, next_after} with ?since / ?after."""
+    params = request.query_params
+    engine = request.app.state.engine
+    if 'since' not in params and 'after' not in params:
+        async with engine.connect() as conn:
+            rows = (await conn.execute(recent_logs_select())).all()
+        return JSONResponse([log_entry(*row) for row in rows])
+
+    try:
+        after, since_time = parse_log_cursor(params)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(logs_since_select(after, since_time))).all()
+    return JSONResponse({'data': [log_entry(*row) for row in rows], 'next_after': next_log_cursor(rows, after)})
+
+
+def _log_event(row):
+    # Event id = the LogSeq cursor, so Last-Event-ID resumes without gaps or duplicates
+    return f"id: {row[-1]}\nevent: log\ndata: {json.dumps(log_entry(*row))}\n\n"
+
+
+def _stream_cursor(last_event_id):
+    try:
+        return int(last_event_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class LogStreamHub:
+    """
+    Per-process fan-out of new consultation logs. The poller task runs only
+    while someone is connected; a client whose queue overflows is cut off
+    and resumes through Last-Event-ID like any reconnect.
+    """
+
+    def __init__(self, engine, poll=1.0, ring_size=1000, queue_size=1000):
+        self.engine = engine
+        self.poll = poll
+        self.queue_size = queue_size
+        self._ring = deque(maxlen=ring_size) # (LogSeq, event text), oldest first
+        self._clients = set()
+        self._cursor = None
+        self._task = None
+        self.metrics = {'polls': 0, 'events': 0, 'catchup_queries': 0, 'dropped_clients': 0, 'errors': 0}
+
+    async def _start(self):
+        # Starts at the newest row; the ring only ever holds consecutive rows in LogSeq order
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(latest_sequenced_logs_select())).all()
+        self._ring.clear()
+        for row in reversed(rows):
+            self._ring.append((row[-1], _log_event(row)))
+        self._cursor = rows[0][-1] if rows else 0
+
+    async def subscribe(self, last_seq=None):
+        """Registers a client; returns (queue, backlog): (LogSeq, event) pairs, backlog first."""
+        if self._cursor is None:
+            await self._start()
+        client = asyncio.Queue(maxsize=self.queue_size)
+        # No await between reading the cursor and registering: the queue gets every row after it
+        cursor = self._cursor
+        self._clients.add(client)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            backlog = await self._backlog(last_seq, cursor)
+        except BaseException:
+            self.unsubscribe(client)
+            raise
+        return client, backlog
+
+    def unsubscribe(self, client):
+        self._clients.discard(client)
+
+    async def _backlog(self, last_seq, cursor):
+        if last_seq is None:
+            return list(self._ring)[-LOG_RECENT_LIMIT:]
+        if not self._ring or self._ring[0][0] <= last_seq + 1:
+            return [(seq, event) for seq, event in self._ring if last_seq < seq <= cursor]
+        # Gap older than the ring: page it from the table once for this client
+        events = []
+        self.metrics['catchup_queries'] += 1
+        while last_seq < cursor:
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(logs_since_select(last_seq))).all()
+            rows = [row for row in rows if row[-1] <= cursor]
+            if not rows:
+                break
+            events += [(row[-1], _log_event(row)) for row in rows]
+            last_seq = rows[-1][-1]
+        return events
+
+    async def _run(self):
+        while self._clients:
+            try:
+                await self._poll()
+            except Exception as e:
+                self.metrics['errors'] += 1
+                print(f"Log stream poll failed: {e}")
+            await asyncio.sleep(self.poll)
+        self._cursor = None # Restart from the newest row next time
+
+    async def _poll(self):
+        while True:
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(logs_since_select(self._cursor))).all()
+            self.metrics['polls'] += 1
+            for row in rows:
+                event = (row[-1], _log_event(row))
+                self._ring.append(event)
+                for client in list(self._clients):
+                    try:
+                        client.put_nowait(event)
+                    except asyncio.QueueFull:
+                        # Drop what it has not read; it resumes from its last delivered event
+                        self._clients.discard(client)
+                        while not client.empty():
+                            client.get_nowait()
+                        client.put_nowait(None)
+                        self.metrics['dropped_clients'] += 1
+            if rows:
+                self._cursor = rows[-1][-1]
+                self.metrics['events'] += len(rows)
+            if len(rows) < LOG_SINCE_LIMIT:
+                return
+
+    def stats(self):
+        data = dict(self.metrics)
+        data['clients'] = len(self._clients)
+        data['cursor'] = self._cursor
+        data['ring'] = len(self._ring)
+        data['poll'] = self.poll
+        return data
+
+
+async def logs_stream(request):
+    """
+    Server-Sent Events: replays the latest entries (or everything after
+    Last-Event-ID), then one 'log' event per new consultation.
+    """
+    hub = request.app.state.log_hub
+    last_seq = _stream_cursor(request.headers.get('last-event-id'))
+    client, backlog = await hub.subscribe(last_seq)
+
+    async def events():
+        sent = last_seq or 0
+        try:
+            for seq, event in backlog:
+                sent = seq
+                yield event
+            while True:
+                try:
+                    item = await asyncio.wait_for(client.get(), timeout=LOG_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if item is None:
+                    return # Too slow: dropped, the browser reconnects with Last-Event-ID
+                seq, event = item
+                # A reconnect can land on a worker whose poller is slightly behind
+                if seq > sent:
+                    sent = seq
+                    yield event
+        finally:
+            hub.unsubscribe(client)
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def log_stream_stats(request):
+    return JSONResponse(request.app.state.log_hub.stats())
+
+
+async def readyz(request):
+    try:
+        async with request.app.state.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        print(f"Async readiness check failed: {e}")
+        return JSONResponse({'status': 'unavailable', 'database': 'down'}, status_code=503)
+    return JSONResponse({'status': 'ready', 'database': 'up', 'pool': request.app.state.engine.pool.status()})
+
+
+def create_async_api(database_url, load_session=None):
+    """
+    Starlette app with the async read routes. The engine is created here but
+    connects lazily, on the event loop of the worker that first uses it;
+    call `await api.state.engine.dispose()` on shutdown. load_session maps
+    the request cookies to the caller's session dict; without it every
+    login-only route answers 401.
+    """
+    url = async_database_url(database_url)
+    api = Starlette(routes=[
+        Route('/customers/{customer_id}', customer_detail),
+        Route('/predictions/{customer_id}', prediction_detail),
+        Route('/recent_logs', recent_logs),
+        Route('/logs/stream', logs_stream),
+        Route('/stats/log_stream', log_stream_stats),
+        Route('/readyz', readyz),
+    ])
+    api.state.engine = create_async_engine(url, **async_engine_options(url))
+    api.state.load_session = load_session or (lambda cookies: {})
+    api.state.log_hub = LogStreamHub(api.state.engine, poll=float(os.environ.get('LOG_STREAM_POLL', 1.0)))
+    return api
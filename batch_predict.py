@@ -0,0 +1,99 @@
+from models import Customer, Predictions, RISK_BAND_NAMES, risk_band
+from scoring import feature_query, rows_to_columns, score_columns, retention_strategies, get_scorer
+from bulk_import import PARSERS, IMPORT_FIELDS, MAX_TENURE
+
+#  BATCH PREDICTION
+# Scores a list of customer ids, or inline feature records, in one request:
+# one joined read of features + stored prediction for every id and one
+# vectorized scoring call for the whole batch. Like predict_tool, a stored
+# prediction wins over a fresh score and fresh scores can be saved.
+
+DEFAULT_PREDICT_BATCH_MAX = 1000
+
+# Same fields and rules as the import; only tenure is required. Fields left
+# out score like a customer without that contract / internet / phone row.
+RECORD_DEFAULTS = {'senior_citizen': False, 'partner': False, 'dependents': False}
+RECORD_FIELDS = tuple((field, kind, RECORD_DEFAULTS.get(field), rule)
+                      for field, kind, _, rule in IMPORT_FIELDS if field != 'customer_id')
+
+# Needed for the retention strategies whatever the scorer reads
+RESULT_COLUMNS = ('customer_id', 'tenure', 'contract_mode')
+
+
+def parse_feature_records(records):
+    """
+    Feature columns for inline records (same keys as the export). Raises
+    ValueError naming the first invalid record.
+    """
+    columns = {name: [] for name in ('customer_id',) + tuple(f[0] for f in RECORD_FIELDS)}
+    for n, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"customers[{n}]: expected an object")
+        columns['customer_id'].append(record.get('customer_id'))
+        for field, kind, default, rule in RECORD_FIELDS:
+            raw = record.get(field)
+            if raw is None or raw == '':
+                if field == 'tenure':
+                    raise ValueError(f"customers[{n}]: tenure is required")
+                columns[field].append(default)
+                continue
+            value = PARSERS[kind](raw)
+            if value is None or (isinstance(rule, tuple) and value not in rule) \
+                    or (isinstance(rule, int) and len(value) > rule):
+                raise ValueError(f"customers[{n}]: invalid {field} {raw!r}")
+            if field == 'tenure' and not 0 <= value <= MAX_TENURE:
+                raise ValueError(f"customers[{n}]: tenure out of range")
+            columns[field].append(value)
+    return columns
+
+
+def load_batch(session, customer_ids):
+    """Feature columns plus 'stored' (saved probability or None) for the ids that exist."""
+    names = tuple(dict.fromkeys(get_scorer().columns + RESULT_COLUMNS))
+    stmt = feature_query(customer_ids, columns=names).add_columns(Predictions.churn_probability)\
+        .outerjoin(Predictions, Predictions.customer_id == Customer.customer_id)
+    rows = session.execute(stmt).all()
+    columns = rows_to_columns([row[:-1] for row in rows], names)
+    columns['stored'] = [row[-1] for row in rows]
+    return columns
+
+
+def merge_columns(columns, inline):
+    """
+    The ids' columns followed by the inline records, as one batch for a
+    single scoring call. Inline rows have no stored prediction and are
+    tagged source 'inline'.
+    """
+    found, count = len(columns['customer_id']), len(inline['customer_id'])
+    merged = {name: list(values) + inline.get(name, [None] * count) for name, values in columns.items()}
+    merged['source'] = ['computed'] * found + ['inline'] * count
+    return merged
+
+
+def prediction_result(customer_id, probability, source, tenure, contract_mode):
+    return {
+        'id': customer_id,
+        'probability': probability,
+        'score': round(probability * 100, 1),
+        'risk_level': 'High' if probability > 0.5 else 'Low',
+        'risk_band': RISK_BAND_NAMES[risk_band(probability)],
+        'source': source,
+        'strategies': retention_strategies(probability, tenure, contract_mode)
+    }
+
+
+def score_batch(columns, source='computed'):
+    """
+    One result per row of columns; a non-null 'stored' probability is
+    returned as-is. A 'source' column overrides source row by row.
+    """
+    scores = score_columns(columns)
+    stored = columns.get('stored') or [None] * len(scores)
+    sources = columns.get('source') or [source] * len(scores)
+    results = []
+    for i, customer_id in enumerate(columns['customer_id']):
+        kept = stored[i] is not None
+        probability = float(stored[i]) if kept else float(scores[i])
+        results.append(prediction_result(customer_id, probability, 'stored' if kept else sources[i],
+                                         columns['tenure'][i], columns['contract_mode'][i]))
+    return results
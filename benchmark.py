@@ -0,0 +1,512 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import datetime
+import threading
+import subprocess
+
+#  BENCHMARK SUITE
+# Drives the hot paths through the Flask test client against SQLite databases
+# seeded with seed_bulk.py, and records latency percentiles, queries per
+# request and peak RSS for each endpoint.
+#
+#   python benchmark.py run --sizes 1000 100000 1000000 --out bench.json
+#   python benchmark.py compare baseline.json bench.json
+#   python benchmark.py risk-bands --sizes 1000000
+#   python benchmark.py async-load --sizes 100000 --concurrency 50 200
+#   python benchmark.py scorers --sizes 1000000
+#
+# Each (size, endpoint) pair runs in its own subprocess so the app binds to
+# the right database and peak RSS belongs to that endpoint alone.
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_DB_DIR = '.bench'
+
+ENDPOINTS = {
+    'api_get_customers': ('GET', '/api/customers'),
+    'dashboard': ('GET', '/dashboard'),
+    'predict_tool': ('POST', '/predict'),
+    'api_recent_logs': ('GET', '/api/recent_logs'),
+    'reports': ('GET', '/reports'),
+    'download_report': ('GET', '/download_report'),
+}
+
+
+def percentile(values, p):
+    import numpy as np
+    return float(np.percentile(values, p)) if values else None
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+def database_path(db_dir, size):
+    return os.path.abspath(os.path.join(db_dir, f'clientguard_{size}.db'))
+
+
+def ensure_database(db_dir, size, seed):
+    path = database_path(db_dir, size)
+    if not os.path.exists(path):
+        from seed_bulk import run_bulk_seed
+        os.makedirs(db_dir, exist_ok=True)
+        run_bulk_seed(f'sqlite:///{path}', size, seed=seed)
+    else:
+        # Databases cached by an older checkout may predate a migration
+        from sqlalchemy import create_engine
+        from migrations import run_migrations
+        engine = create_engine(f'sqlite:///{path}')
+        run_migrations(engine)
+        engine.dispose()
+    return path
+
+
+# --- Child process: one endpoint against one database ---
+def measure_endpoint(db_path, endpoint, requests, warmup, seed):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    import app as clientguard
+    from sqlalchemy import event
+    from models import db, Customer
+
+    flask_app = clientguard.app
+    method, path = ENDPOINTS[endpoint]
+    request_thread = threading.get_ident()
+    queries = [0]
+
+    with flask_app.app_context():
+        # Count only statements issued by the request thread (not the log writer)
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args):
+            if threading.get_ident() == request_thread:
+                queries[0] += 1
+
+        sample_ids = [cid for (cid,) in db.session.query(Customer.customer_id).limit(1000)]
+
+    client = flask_app.test_client()
+    with client.session_transaction() as s:
+        s['user_id'], s['user_name'], s['role'] = 'EMP001', 'Super Admin', 'Manager'
+
+    rng = random.Random(seed)
+    def call():
+        if method == 'POST':
+            resp = client.post(path, data={'customer_id': rng.choice(sample_ids)})
+        else:
+            resp = client.get(path)
+        resp.get_data() # Consume streamed bodies completely
+        if resp.status_code >= 400:
+            raise RuntimeError(f'{endpoint} returned {resp.status_code}')
+
+    for _ in range(warmup):
+        call()
+
+    rss_before = peak_rss_mb()
+    latencies = []
+    queries[0] = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    clientguard.log_writer.flush()
+
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries_per_request': round(queries[0] / requests, 2),
+        'baseline_rss_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+# --- Risk-band queries: full scan vs band index vs maintained counts ---
+def time_query(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, round(percentile(timings, 50), 3)
+
+
+def risk_band_queries(db_path, repeats):
+    from sqlalchemy import create_engine, select, func
+    from sqlalchemy.orm import Session
+    from models import Predictions, HIGH_RISK_THRESHOLD, above_threshold
+    from stats_cache import AggregateCache
+
+    engine = create_engine(f'sqlite:///{db_path}')
+    by_probability = Predictions.churn_probability > HIGH_RISK_THRESHOLD
+    queries = {
+        'count_high_scan': select(func.count()).select_from(Predictions).where(by_probability),
+        'count_high_band': select(func.count()).select_from(Predictions).where(above_threshold(HIGH_RISK_THRESHOLD)),
+        'top20_scan': select(Predictions.customer_id).where(by_probability)
+                      .order_by(Predictions.churn_probability.desc()).limit(20),
+        'top20_band': select(Predictions.customer_id)
+                      .order_by(Predictions.risk_band.desc(), Predictions.churn_probability.desc(),
+                                Predictions.customer_id.desc()).limit(20),
+    }
+    results = {}
+    with Session(engine) as session:
+        for name, stmt in queries.items():
+            rows, p50 = time_query(lambda: session.execute(stmt).all(), repeats)
+            results[name] = {'p50_ms': p50, 'rows': len(rows)}
+        cache = AggregateCache(ttl=3600)
+        cache.get(session) # Cold load, as on the first request after startup
+        high, p50 = time_query(lambda: cache.get(session)['high_risk'], repeats)
+        results['count_high_cached'] = {'p50_ms': p50, 'rows': 1}
+        assert high == session.execute(queries['count_high_scan']).scalar() == session.execute(queries['count_high_band']).scalar()
+    engine.dispose()
+    return results
+
+
+def run_risk_bands(sizes, repeats, db_dir, seed):
+    for size in sizes:
+        results = risk_band_queries(ensure_database(db_dir, size, seed), repeats)
+        for name, stats in results.items():
+            print(f"  {size:>9} {name:<18} p50 {stats['p50_ms']:>10.3f}ms")
+
+
+# --- Scorer throughput: rule table vs compiled logistic model ---
+def run_scorers(sizes, repeats, model_path, db_dir, seed):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from scoring import RuleScorer, load_feature_columns
+    from churn_model import MODEL_COLUMNS, LogisticScorer, design_matrix, train_model
+
+    for size in sizes:
+        db_path = ensure_database(db_dir, size, seed)
+        engine = create_engine(f'sqlite:///{db_path}')
+        with Session(engine) as session:
+            path = model_path or os.path.join(db_dir, f'churn_logreg_{size}')
+            if not os.path.exists(os.path.join(path, 'model.json')):
+                print(f"Training {path} ...")
+                train_model(session, path, seed=seed)
+            start = time.perf_counter()
+            columns = load_feature_columns(session, columns=MODEL_COLUMNS)
+            load_s = time.perf_counter() - start
+        engine.dispose()
+
+        rows = len(columns['customer_id'])
+        rules, model = RuleScorer(), LogisticScorer(path)
+        model.score_columns({name: values[:1] for name, values in columns.items()}) # Load weights
+        spec = model._load()['features']
+        X = design_matrix(columns, spec)
+        timings = {
+            'rules': lambda: rules.score_columns(columns),
+            'logistic': lambda: model.score_columns(columns),
+            'logistic_encode': lambda: design_matrix(columns, spec),
+            'logistic_matvec': lambda: X @ model._weights[:-1] + model._weights[-1],
+        }
+        print(f"  {size:>9} feature read {load_s:.2f}s ({rows} rows, {X.shape[1]} model features)")
+        for name, fn in timings.items():
+            _, p50 = time_query(fn, repeats)
+            print(f"  {size:>9} {name:<16} p50 {p50:>10.2f}ms  {rows / (p50 / 1000):>14,.0f} rows/s")
+
+
+# --- Load test: sync routes (Gunicorn) vs async routes (Uvicorn) ---
+# Each scenario is a (sync path, async path) pair answering the same lookup;
+# {id} / {prev} are filled from consecutive customer ids.
+LOAD_SCENARIOS = {
+    'customer': ('/api/customers?limit=1&after={prev}', '/async/api/customers/{id}'),
+    'recent_logs': ('/api/recent_logs', '/async/api/recent_logs'),
+}
+
+
+def start_server(kind, db_path, port, workers):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+    if kind == 'sync':
+        env.update(GUNICORN_BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers), GUNICORN_ACCESS_LOG='')
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    else:
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(workers), '--no-access-log', '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import urllib.request
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/healthz', timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{kind} server did not come up on port {port}")
+
+
+def login_cookie(port):
+    """Session cookie of the seeded admin, sent with every load request (the lookups need a login)."""
+    import urllib.request
+    import urllib.parse
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    data = urllib.parse.urlencode({'username': 'admin', 'password': 'admin123'}).encode()
+    opener = urllib.request.build_opener(NoRedirect)
+    try:
+        response = opener.open(f'http://127.0.0.1:{port}/login', data=data, timeout=10)
+    except urllib.error.HTTPError as e:
+        response = e # The 302 to the dashboard
+    return response.headers['Set-Cookie'].split(';', 1)[0]
+
+
+async def http_get(reader, writer, path, cookie):
+    """One keep-alive GET; returns (status, server closes the connection)."""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n".encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    status = int(lines[0].split(b' ', 2)[1])
+    length, close = 0, False
+    for line in lines[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection':
+            close = value.strip().lower() == b'close'
+    await reader.readexactly(length)
+    return status, close
+
+
+async def load_user(port, paths, cookie, start, deadline, latencies, counts):
+    import asyncio
+    writer = None
+    i = random.randrange(len(paths))
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        path = paths[i % len(paths)]
+        i += 1
+        sent = time.perf_counter()
+        try:
+            status, close = await http_get(reader, writer, path, cookie)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            counts['errors'] += 1
+            writer.close()
+            writer = None
+            continue
+        if sent >= start: # Requests sent during warmup are not counted
+            latencies.append((time.perf_counter() - sent) * 1000)
+            counts['ok' if status == 200 else 'errors'] += 1
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+def drive_load(port, paths, concurrency, duration, warmup=1.0):
+    import asyncio
+    cookie = login_cookie(port)
+
+    async def main():
+        latencies, counts = [], {'ok': 0, 'errors': 0}
+        start = time.perf_counter() + warmup
+        deadline = start + duration
+        await asyncio.gather(*[load_user(port, paths, cookie, start, deadline, latencies, counts)
+                               for _ in range(concurrency)])
+        return latencies, counts
+
+    latencies, counts = asyncio.run(main())
+    return {
+        'rps': round(counts['ok'] / duration, 1),
+        'errors': counts['errors'],
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def sample_lookup_paths(db_path, count, seed):
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    ids = [row[0] for row in conn.execute("SELECT CustomerID FROM customer ORDER BY CustomerID")]
+    conn.close()
+    rng = random.Random(seed)
+    picks = [rng.randrange(1, len(ids)) for _ in range(count)]
+    return {
+        name: ([sync.format(prev=ids[i - 1], id=ids[i]) for i in picks],
+               [async_.format(prev=ids[i - 1], id=ids[i]) for i in picks])
+        for name, (sync, async_) in LOAD_SCENARIOS.items()
+    }
+
+
+def run_async_load(sizes, concurrency, duration, workers, db_dir, seed, out):
+    results = {}
+    for size in sizes:
+        db_path = ensure_database(db_dir, size, seed)
+        paths = sample_lookup_paths(db_path, 2000, seed)
+        results[str(size)] = {}
+        for kind, port in (('sync', 5801), ('async', 5802)):
+            server = start_server(kind, db_path, port, workers)
+            try:
+                for name, (sync_paths, async_paths) in paths.items():
+                    for clients in concurrency:
+                        stats = drive_load(port, sync_paths if kind == 'sync' else async_paths, clients, duration)
+                        results[str(size)].setdefault(name, {}).setdefault(str(clients), {})[kind] = stats
+                        print(f"  {size:>9} {name:<12} {kind:<5} c={clients:<5} {stats['rps']:>9.1f} req/s  "
+                              f"p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  errors {stats['errors']}")
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f"{'size':>9} {'scenario':<12} {'clients':>7} {'sync req/s':>11} {'async req/s':>12} {'ratio':>7}")
+    for size, scenarios in results.items():
+        for name, by_clients in scenarios.items():
+            for clients, pair in by_clients.items():
+                ratio = pair['async']['rps'] / pair['sync']['rps'] if pair['sync']['rps'] else float('inf')
+                print(f"{size:>9} {name:<12} {clients:>7} {pair['sync']['rps']:>11.1f} {pair['async']['rps']:>12.1f} {ratio:>6.2f}x")
+    if out:
+        with open(out, 'w') as f:
+            json.dump({'meta': {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                                'commit': git_commit(), 'workers': workers, 'duration': duration},
+                       'results': results}, f, indent=2)
+        print(f"Results written to {out}")
+    return results
+
+
+# --- Parent process ---
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def run_suite(sizes, endpoints, requests, warmup, db_dir, seed, out):
+    results = {}
+    for size in sizes:
+        db_path = ensure_database(db_dir, size, seed)
+        results[str(size)] = {}
+        for endpoint in endpoints:
+            cmd = [sys.executable, __file__, '_endpoint', '--db', db_path, '--endpoint', endpoint,
+                   '--requests', str(requests), '--warmup', str(warmup), '--seed', str(seed)]
+            proc = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode != 0:
+                print(f"✗ {size:>9} {endpoint:<18} failed:\n{proc.stderr.strip()[-2000:]}")
+                results[str(size)][endpoint] = {'error': proc.stderr.strip().splitlines()[-1:]}
+                continue
+            stats = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[str(size)][endpoint] = stats
+            print(f"  {size:>9} {endpoint:<18} p50 {stats['p50_ms']:>9.2f}ms  p95 {stats['p95_ms']:>9.2f}ms  "
+                  f"p99 {stats['p99_ms']:>9.2f}ms  q/req {stats['queries_per_request']:>6}  rss {stats['peak_rss_mb']:>7}MB")
+
+    report = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': requests,
+            'warmup': warmup,
+            'seed': seed
+        },
+        'results': results
+    }
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+    return report
+
+
+def compare_reports(baseline_path, current_path, threshold):
+    """Prints per-endpoint deltas; returns the number of regressions."""
+    with open(baseline_path) as f: baseline = json.load(f)['results']
+    with open(current_path) as f: current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'size':>9} {'endpoint':<18} {'p95 base':>10} {'p95 now':>10} {'delta':>8} {'q/req':>12}")
+    for size, endpoints in current.items():
+        for endpoint, now in endpoints.items():
+            base = baseline.get(size, {}).get(endpoint)
+            if not base or 'error' in base or 'error' in now:
+                continue
+            delta = (now['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0
+            slower = delta > threshold
+            more_queries = now['queries_per_request'] > base['queries_per_request']
+            flag = ' REGRESSION' if slower or more_queries else ''
+            regressions += bool(flag)
+            print(f"{size:>9} {endpoint:<18} {base['p95_ms']:>10.2f} {now['p95_ms']:>10.2f} {delta:>+8.1%} "
+                  f"{base['queries_per_request']:>5}->{now['queries_per_request']:<5}{flag}")
+    print(f"{regressions} regression(s) (p95 threshold {threshold:.0%}, or more queries per request)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ClientGuard benchmark suite")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help="Benchmark the hot paths and write a JSON report")
+    run.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    run.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    run.add_argument('--requests', type=int, default=30)
+    run.add_argument('--warmup', type=int, default=3)
+    run.add_argument('--db-dir', default=DEFAULT_DB_DIR, help="Where seeded databases are cached")
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--out', default='bench_results.json')
+
+    cmp = sub.add_parser('compare', help="Diff a report against a saved baseline")
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--threshold', type=float, default=0.10, help="Allowed p95 slowdown (0.10 = 10%%)")
+
+    bands = sub.add_parser('risk-bands', help="Time high-risk count / top-N queries with and without the band index")
+    bands.add_argument('--sizes', type=int, nargs='+', default=[1000000])
+    bands.add_argument('--repeats', type=int, default=20)
+    bands.add_argument('--db-dir', default=DEFAULT_DB_DIR)
+    bands.add_argument('--seed', type=int, default=42)
+
+    load = sub.add_parser('async-load', help="Sustained req/s of the async read API vs the sync routes")
+    load.add_argument('--sizes', type=int, nargs='+', default=[100000])
+    load.add_argument('--concurrency', type=int, nargs='+', default=[50, 200])
+    load.add_argument('--duration', type=float, default=10.0, help="Seconds per measurement")
+    load.add_argument('--workers', type=int, default=4, help="Server worker processes (both servers)")
+    load.add_argument('--db-dir', default=DEFAULT_DB_DIR)
+    load.add_argument('--seed', type=int, default=42)
+    load.add_argument('--out', default=None)
+
+    scorers = sub.add_parser('scorers', help="Scoring throughput of the rule table vs the logistic model")
+    scorers.add_argument('--sizes', type=int, nargs='+', default=[1000000])
+    scorers.add_argument('--repeats', type=int, default=5)
+    scorers.add_argument('--model', default=None, help="Model directory (trained on the bench database if missing)")
+    scorers.add_argument('--db-dir', default=DEFAULT_DB_DIR)
+    scorers.add_argument('--seed', type=int, default=42)
+
+    child = sub.add_parser('_endpoint')
+    child.add_argument('--db', required=True)
+    child.add_argument('--endpoint', required=True, choices=list(ENDPOINTS))
+    child.add_argument('--requests', type=int, required=True)
+    child.add_argument('--warmup', type=int, required=True)
+    child.add_argument('--seed', type=int, required=True)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_suite(args.sizes, args.endpoints, args.requests, args.warmup, args.db_dir, args.seed, args.out)
+    elif args.command == 'compare':
+        sys.exit(1 if compare_reports(args.baseline, args.current, args.threshold) else 0)
+    elif args.command == 'risk-bands':
+        run_risk_bands(args.sizes, args.repeats, args.db_dir, args.seed)
+    elif args.command == 'scorers':
+        run_scorers(args.sizes, args.repeats, args.model, args.db_dir, args.seed)
+    elif args.command == 'async-load':
+        run_async_load(args.sizes, args.concurrency, args.duration, args.workers, args.db_dir, args.seed, args.out)
+    else:
+        print(json.dumps(measure_endpoint(args.db, args.endpoint, args.requests, args.warmup, args.seed)))
+
+
+if __name__ == '__main__':
+    main()
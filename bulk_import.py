@@ -0,0 +1,333 @@
+import io
+import csv
+import json
+import time
+import numpy as np
+from sqlalchemy import select
+from models import Customer
+from scoring import score_columns
+from bulk_writer import _chunks
+
+#  BULK CUSTOMER IMPORT
+# Loads CSV / NDJSON customer files (same columns as export.py) into the
+# customer, contract, internet_service, phone_service and predictions
+# tables. Rows are validated a chunk at a time: each field is parsed value by
+# value, then its rule checks (length, allowed values, range) and the
+# duplicate-id check run as NumPy masks over the whole chunk. Each chunk
+# is inserted with one driver-level executemany per table in its own
+# transaction, and rejected rows are collected into a per-row error report
+# instead of aborting the load. Missing service columns get the same defaults as the
+# "Add Customer" form.
+
+DEFAULT_IMPORT_CHUNK = 5000
+MAX_TENURE = 1200
+EXISTING_LOOKUP_BATCH = 10000
+
+CONTRACT_MODES = ('Month-to-month', 'One year', 'Two year')
+INTERNET_TYPES = ('Fiber optic', 'DSL', 'No')
+
+# Exact spellings are looked up as-is; anything else is normalized first
+BOOL_VALUES = {True: True, False: False, 'True': True, 'False': False, 'TRUE': True, 'FALSE': False}
+BOOL_VALUES.update({text: True for text in ('1', 'true', 'yes', 'y', 't')})
+BOOL_VALUES.update({text: False for text in ('0', 'false', 'no', 'n', 'f')})
+
+
+def _parse_str(value):
+    return str(value).strip()
+
+
+def _parse_bool(value):
+    found = BOOL_VALUES.get(value)
+    if found is None and isinstance(value, str):
+        found = BOOL_VALUES.get(value.strip().lower())
+    return found
+
+
+def _parse_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else None
+
+
+def _parse_float(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if np.isfinite(number) else None
+
+
+def parse_probability(value):
+    """A churn probability as float, or None unless it is a finite number in [0, 1]."""
+    number = _parse_float(value)
+    return number if number is not None and 0.0 <= number <= 1.0 else None
+
+
+PARSERS = {'str': _parse_str, 'bool': _parse_bool, 'int': _parse_int, 'float': _parse_float}
+
+# (field, kind, default, max length or allowed values); default None = required
+IMPORT_FIELDS = (
+    ('customer_id', 'str', None, 10),
+    ('gender', 'str', None, 10),
+    ('senior_citizen', 'bool', False, None),
+    ('partner', 'bool', False, None),
+    ('dependents', 'bool', False, None),
+    ('tenure', 'int', None, None),
+    ('contract_mode', 'str', 'Month-to-month', CONTRACT_MODES),
+    ('paperless_billing', 'bool', False, None),
+    ('payment_method', 'str', 'Mailed check', 50),
+    ('monthly_charges', 'float', 0.0, None),
+    ('total_charges', 'float', 0.0, None),
+    ('internet_type', 'str', 'No', INTERNET_TYPES),
+    ('online_security', 'bool', False, None),
+    ('online_backup', 'bool', False, None),
+    ('device_protection', 'bool', False, None),
+    ('tech_support', 'bool', False, None),
+    ('streaming_movies', 'bool', False, None),
+    ('has_phone_service', 'bool', False, None),
+    ('multiple_lines', 'bool', False, None),
+)
+
+# table -> (db column, field) pairs
+TABLE_FIELDS = (
+    ('customer', (('CustomerID', 'customer_id'), ('Gender', 'gender'), ('SeniorCitizen', 'senior_citizen'),
+                  ('Partner', 'partner'), ('Dependents', 'dependents'), ('Tenure', 'tenure'))),
+    ('contract', (('CustomerID', 'customer_id'), ('ContractMode', 'contract_mode'),
+                  ('PaperlessBilling', 'paperless_billing'), ('PaymentMethod', 'payment_method'),
+                  ('MonthlyCharges', 'monthly_charges'), ('TotalCharges', 'total_charges'))),
+    ('internet_service', (('CustomerID', 'customer_id'), ('InternetType', 'internet_type'),
+                          ('OnlineSecurity', 'online_security'), ('OnlineBackup', 'online_backup'),
+                          ('DeviceProtection', 'device_protection'), ('TechSupport', 'tech_support'),
+                          ('StreamingMovies', 'streaming_movies'))),
+    ('phone_service', (('CustomerID', 'customer_id'), ('has_phone_service', 'has_phone_service'),
+                       ('MultipleLines', 'multiple_lines'))),
+)
+PREDICTION_COLUMNS = ('CustomerID', 'ChurnProbability')
+
+
+# --- Readers: yield (row number, dict) or (row number, error message) ---
+def iter_csv_records(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for n, record in enumerate(csv.DictReader(text), start=1):
+        if None in record:
+            yield n, 'too many columns'
+        else:
+            yield n, record
+
+
+def iter_ndjson_records(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    n = 0
+    for line in text:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield n, f'invalid JSON: {e}'
+            continue
+        yield n, record if isinstance(record, dict) else 'expected a JSON object'
+
+
+READERS = {'csv': iter_csv_records, 'ndjson': iter_ndjson_records}
+
+
+# --- Validation ---
+def validate_chunk(records):
+    """
+    records: list of (row number, dict). Returns (columns, row_numbers, errors):
+    parsed columns of the valid rows only, their row numbers, and one
+    {'row', 'id', 'errors'} entry per rejected row. Parsing is per value;
+    the rule checks are array masks per field.
+    """
+    n = len(records)
+    problems = {}
+    columns = {}
+
+    for field, kind, default, rule in IMPORT_FIELDS:
+        parse = PARSERS[kind]
+        raw = [r.get(field) for _, r in records]
+        values = [default if v is None or v == '' else parse(v) for v in raw]
+        invalid = np.fromiter((v is None for v in values), dtype=bool, count=n)
+
+        if kind == 'str' and isinstance(rule, int):
+            lengths = np.fromiter((len(v) if v is not None else 0 for v in values), dtype=np.int64, count=n)
+            invalid |= (lengths == 0) | (lengths > rule)
+        elif isinstance(rule, tuple):
+            invalid |= ~np.isin(np.array([v or '' for v in values], dtype=object), rule)
+        elif kind in ('int', 'float'):
+            numbers = np.array([v if v is not None else -1 for v in values], dtype=np.float64)
+            invalid |= numbers < 0
+            if field == 'tenure':
+                invalid |= numbers > MAX_TENURE
+
+        columns[field] = values
+        if invalid.any():
+            problems[field] = invalid
+
+    probability = [r.get('churn_probability') for _, r in records]
+    probability = [None if v is None or v == '' else parse_probability(v) for v in probability]
+    bad_probability = np.fromiter(
+        (v is None for v in probability), dtype=bool, count=n
+    ) & np.fromiter((r.get('churn_probability') not in (None, '') for _, r in records), dtype=bool, count=n)
+    if bad_probability.any():
+        problems['churn_probability'] = bad_probability
+    columns['churn_probability'] = probability
+
+    # Same id twice in one chunk: keep the first occurrence
+    ids = np.array([v or '' for v in columns['customer_id']], dtype=object)
+    _, first = np.unique(ids, return_index=True)
+    duplicate = np.ones(n, dtype=bool)
+    duplicate[first] = False
+    if duplicate.any():
+        problems['duplicate'] = duplicate
+
+    rejected = np.zeros(n, dtype=bool)
+    for mask in problems.values():
+        rejected |= mask
+
+    errors = []
+    for i in np.flatnonzero(rejected):
+        messages = ['duplicate customer_id in file' if name == 'duplicate'
+                    else f"{name}: {'missing' if records[i][1].get(name) in (None, '') else 'invalid'} value"
+                    for name, mask in problems.items() if mask[i]]
+        errors.append({'row': records[i][0], 'id': records[i][1].get('customer_id'), 'errors': messages})
+
+    keep = np.flatnonzero(~rejected)
+    valid = {field: [values[i] for i in keep] for field, values in columns.items()}
+    return valid, [records[i][0] for i in keep], errors
+
+
+def drop_existing(session, columns, row_numbers):
+    """Removes rows whose customer_id is already in the database (IN queries)."""
+    ids = columns['customer_id']
+    if not ids:
+        return columns, row_numbers, []
+    existing = set()
+    # Sliced so large chunks stay under the driver's bound-parameter limit
+    for start in range(0, len(ids), EXISTING_LOOKUP_BATCH):
+        batch = ids[start:start + EXISTING_LOOKUP_BATCH]
+        existing.update(session.execute(select(Customer.customer_id).where(Customer.customer_id.in_(batch))).scalars())
+    if not existing:
+        return columns, row_numbers, []
+    keep = [i for i, cid in enumerate(ids) if cid not in existing]
+    errors = [{'row': row_numbers[i], 'id': cid, 'errors': ['customer_id already exists']}
+              for i, cid in enumerate(ids) if cid in existing]
+    return {field: [values[i] for i in keep] for field, values in columns.items()}, [row_numbers[i] for i in keep], errors
+
+
+# --- Writes ---
+def insert_sql(session, table, columns):
+    ph = '%s' if session.get_bind().dialect.paramstyle in ('format', 'pyformat') else '?'
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([ph] * len(columns))})"
+
+
+def table_rows(columns, score):
+    """Row tuples per table for one validated chunk, predictions last."""
+    rows = {}
+    for table, pairs in TABLE_FIELDS:
+        rows[table] = list(zip(*[columns[field] for _, field in pairs]))
+
+    if score:
+        probabilities = score_columns(columns)
+        rows['predictions'] = list(zip(columns['customer_id'], (float(p) for p in probabilities)))
+    else:
+        rows['predictions'] = [(cid, p) for cid, p in zip(columns['customer_id'], columns['churn_probability'])
+                               if p is not None]
+    return rows
+
+
+def write_rows(session, rows):
+    # Driver-level executemany, as in seed_bulk.py: no per-row SQLAlchemy
+    # parameter processing, and the drivers batch these into multi-row INSERTs
+    conn = session.connection()
+    for table, pairs in TABLE_FIELDS:
+        if rows[table]:
+            conn.exec_driver_sql(insert_sql(session, table, [name for name, _ in pairs]), rows[table])
+    if rows['predictions']:
+        conn.exec_driver_sql(insert_sql(session, 'predictions', PREDICTION_COLUMNS), rows['predictions'])
+
+
+def write_chunk(session, columns, row_numbers, score):
+    """Inserts one chunk in one transaction; falls back to row by row if it fails."""
+    rows = table_rows(columns, score)
+    try:
+        write_rows(session, rows)
+        session.commit()
+        return len(row_numbers), len(rows['predictions']), []
+    except Exception as e:
+        session.rollback()
+        print(f"Error importing chunk ({len(row_numbers)} rows), retrying row by row: {e.__cause__ or e}")
+
+    inserted = scored = 0
+    errors = []
+    predictions = {row[0]: row for row in rows.pop('predictions')}
+    for i, row_number in enumerate(row_numbers):
+        # Every table but predictions has exactly one row per customer, in order
+        single = {table: [chunk_rows[i]] for table, chunk_rows in rows.items()}
+        prediction = predictions.get(columns['customer_id'][i])
+        single['predictions'] = [prediction] if prediction else []
+        try:
+            write_rows(session, single)
+            session.commit()
+            inserted += 1
+            scored += len(single['predictions'])
+        except Exception as e:
+            session.rollback()
+            errors.append({'row': row_number, 'id': columns['customer_id'][i], 'errors': [str(e.__cause__ or e)]})
+    return inserted, scored, errors
+
+
+def import_customers(session, records, chunk_size=DEFAULT_IMPORT_CHUNK, score=False, max_errors=1000, on_chunk=None):
+    """
+    Imports (row number, dict | error message) records as produced by the
+    readers. Returns a summary with per-chunk stats and up to max_errors
+    per-row errors ('rejected' is always the full count).
+    """
+    summary = {'rows': 0, 'inserted': 0, 'scored': 0, 'rejected': 0, 'chunks': [], 'errors': []}
+
+    def reject(errors):
+        summary['rejected'] += len(errors)
+        room = max_errors - len(summary['errors'])
+        if room > 0:
+            summary['errors'].extend(errors[:room])
+
+    for n, chunk in enumerate(_chunks(records, chunk_size), start=1):
+        start = time.perf_counter()
+        summary['rows'] += len(chunk)
+        parsed = [(row, record) for row, record in chunk if isinstance(record, dict)]
+        reject([{'row': row, 'id': None, 'errors': [record]} for row, record in chunk if not isinstance(record, dict)])
+
+        columns, row_numbers, errors = validate_chunk(parsed)
+        reject(errors)
+        columns, row_numbers, errors = drop_existing(session, columns, row_numbers)
+        reject(errors)
+
+        inserted = scored = 0
+        if row_numbers:
+            inserted, scored, errors = write_chunk(session, columns, row_numbers, score)
+            reject(errors)
+        summary['inserted'] += inserted
+        summary['scored'] += scored
+
+        elapsed = time.perf_counter() - start
+        chunk_stats = {
+            'chunk': n,
+            'rows': len(chunk),
+            'inserted': inserted,
+            'seconds': round(elapsed, 4),
+            'rows_per_sec': round(len(chunk) / elapsed, 1) if elapsed > 0 else None
+        }
+        summary['chunks'].append(chunk_stats)
+        if on_chunk:
+            on_chunk(chunk_stats)
+
+    summary['errors_truncated'] = summary['rejected'] > len(summary['errors'])
+    return summary
@@ -0,0 +1,70 @@
+import time
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from models import Predictions
+
+#  BULK PREDICTION WRITER
+# Writes (customer_id, probability) pairs with one multi-row upsert per chunk
+# instead of a SELECT + INSERT/UPDATE round trip per customer.
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_upsert(dialect_name, table, rows, key_columns, update_columns):
+    """
+    Builds the dialect-native upsert for `rows` (list of dicts keyed by column name):
+    ON DUPLICATE KEY UPDATE on MySQL, ON CONFLICT DO UPDATE on SQLite/PostgreSQL.
+    """
+    if dialect_name in ('mysql', 'mariadb'):
+        stmt = mysql.insert(table).values(rows)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+    if dialect_name in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect_name == 'sqlite' else postgresql.insert
+        stmt = insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c[c] for c in key_columns],
+            set_={c: stmt.excluded[c] for c in update_columns}
+        )
+    raise ValueError(f"Bulk upsert not supported for dialect '{dialect_name}'")
+
+
+def upsert_predictions(session, pairs, chunk_size=DEFAULT_CHUNK_SIZE, commit=True, on_chunk=None):
+    """
+    Upserts (customer_id, churn_probability) pairs into `predictions`.
+
+    Each chunk is a single INSERT statement (and its own transaction when
+    commit=True). Returns one stats dict per chunk: rows, seconds, rows_per_sec.
+    `on_chunk`, if given, is called with each stats dict as it is produced.
+    """
+    table = Predictions.__table__
+    dialect_name = session.get_bind().dialect.name
+    stats = []
+
+    for n, chunk in enumerate(_chunks(pairs, chunk_size), start=1):
+        start = time.perf_counter()
+        rows = [{'CustomerID': cid, 'ChurnProbability': float(prob)} for cid, prob in chunk]
+        session.execute(build_upsert(dialect_name, table, rows, ['CustomerID'], ['ChurnProbability']))
+        if commit:
+            session.commit()
+        elapsed = time.perf_counter() - start
+        chunk_stats = {
+            'chunk': n,
+            'rows': len(rows),
+            'seconds': round(elapsed, 4),
+            'rows_per_sec': round(len(rows) / elapsed, 1) if elapsed > 0 else None
+        }
+        stats.append(chunk_stats)
+        if on_chunk:
+            on_chunk(chunk_stats)
+
+    return stats
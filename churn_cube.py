@@ -0,0 +1,215 @@
+import time
+import datetime
+import threading
+import numpy as np
+from sqlalchemy import select, insert, func, case
+from models import (Customer, Contract, InternetService, Predictions, ChurnCubeCell, ChurnCubeRefresh,
+                    RISK_BAND_HIGH)
+from bulk_import import PARSERS
+
+#  CHURN ANALYTICS CUBE
+# Churn broken down by contract mode x internet type x payment method x
+# senior / partner / dependents x tenure bucket. refresh_cube() computes
+# every combination in one GROUP BY pass over the base tables and replaces
+# the churn_cube table in a single transaction (a few thousand rows, however
+# large the book is); run it on a schedule (`flask refresh-cube`).
+#
+# Readers never touch the base tables: each worker keeps the cube in memory
+# as NumPy code / measure arrays, reloaded only when churn_cube_refreshes
+# has a newer version, and answers any slice (filters) and drill-down
+# (group-by dimensions) by masking and summing those arrays.
+
+NO_VALUE = '(none)' # No contract / internet row
+
+CUBE_DIMENSIONS = ('contract_mode', 'internet_type', 'payment_method',
+                   'senior_citizen', 'partner', 'dependents', 'tenure_bucket')
+BOOLEAN_DIMENSIONS = ('senior_citizen', 'partner', 'dependents')
+CUBE_MEASURES = ('customers', 'analysed', 'churn_sum', 'high_risk', 'revenue', 'total_charges')
+
+# Upper bound (inclusive) of each bucket; the first two edges are the rule boundaries
+TENURE_BUCKETS = (('0-5', 5), ('6-12', 12), ('13-24', 24), ('25-48', 48), ('49-72', 72), ('73+', None))
+TENURE_BUCKET_LABELS = tuple(label for label, _ in TENURE_BUCKETS)
+
+DEFAULT_CUBE_CHECK_INTERVAL = 5
+
+
+def tenure_bucket_expr(tenure):
+    return case(*[(tenure <= upper, label) for label, upper in TENURE_BUCKETS if upper is not None],
+                else_=TENURE_BUCKETS[-1][0])
+
+
+def cube_select():
+    """Every dimension combination with its measures: one grouped pass over the base tables."""
+    dims = [
+        func.coalesce(Contract.contract_mode, NO_VALUE),
+        func.coalesce(InternetService.internet_type, NO_VALUE),
+        func.coalesce(Contract.payment_method, NO_VALUE),
+        Customer.senior_citizen, Customer.partner, Customer.dependents,
+        tenure_bucket_expr(Customer.tenure)
+    ]
+    measures = [
+        func.count(Customer.customer_id),
+        func.count(Predictions.customer_id),
+        func.coalesce(func.sum(Predictions.churn_probability), 0.0),
+        func.coalesce(func.sum(case((Predictions.risk_band == RISK_BAND_HIGH, 1), else_=0)), 0),
+        func.coalesce(func.sum(Contract.monthly_charges), 0.0),
+        func.coalesce(func.sum(Contract.total_charges), 0.0)
+    ]
+    return select(*dims, *measures)\
+        .outerjoin(Contract, Contract.customer_id == Customer.customer_id)\
+        .outerjoin(InternetService, InternetService.customer_id == Customer.customer_id)\
+        .outerjoin(Predictions, Predictions.customer_id == Customer.customer_id)\
+        .group_by(*dims)
+
+
+def refresh_cube(session):
+    """Rebuilds the churn_cube table and records a new version. Returns a summary dict."""
+    start = time.perf_counter()
+    rows = session.execute(cube_select()).all()
+    table = ChurnCubeCell.__table__
+    names = [col.name for col in table.columns] # Same order as cube_select()
+    session.execute(table.delete())
+    if rows:
+        session.execute(insert(table), [dict(zip(names, row)) for row in rows])
+    refresh = ChurnCubeRefresh(refreshed_at=datetime.datetime.now(), cells=len(rows),
+                               customers=sum(row[len(CUBE_DIMENSIONS)] for row in rows),
+                               seconds=round(time.perf_counter() - start, 3))
+    session.add(refresh)
+    session.commit()
+    return {'version': refresh.refresh_id, 'cells': refresh.cells, 'customers': refresh.customers,
+            'seconds': refresh.seconds}
+
+
+def _member_order(dimension, value):
+    if dimension == 'tenure_bucket':
+        return (TENURE_BUCKET_LABELS.index(value),) if value in TENURE_BUCKET_LABELS else (len(TENURE_BUCKETS),)
+    return (value == NO_VALUE, value) # '(none)' last
+
+
+class ChurnCube:
+    """Immutable in-memory copy of one cube version."""
+
+    def __init__(self, version, refreshed_at, rows):
+        self.version = version
+        self.refreshed_at = refreshed_at
+        self.members, self.codes, self._index = {}, {}, {}
+        for d, name in enumerate(CUBE_DIMENSIONS):
+            values = [row[d] for row in rows]
+            members = sorted(set(values), key=lambda v: _member_order(name, v))
+            index = {value: code for code, value in enumerate(members)}
+            self.members[name] = members
+            self._index[name] = index
+            self.codes[name] = np.fromiter((index[v] for v in values), dtype=np.int32, count=len(rows))
+        self.measures = np.array([row[len(CUBE_DIMENSIONS):] for row in rows], dtype=np.float64)\
+            .reshape(len(rows), len(CUBE_MEASURES))
+
+    def query(self, by=(), filters=None):
+        """
+        Sums the measures of the cells matching `filters` ({dimension: allowed
+        values}), grouped by the `by` dimensions. Returns (cells, total).
+        """
+        mask = np.ones(len(self.measures), dtype=bool)
+        for name, allowed in (filters or {}).items():
+            index = self._index[name]
+            mask &= np.isin(self.codes[name], [index[v] for v in allowed if v in index])
+        selected = np.flatnonzero(mask)
+        measures = self.measures[selected]
+        total = _measures_dict(measures.sum(axis=0).tolist())
+        if not by:
+            return [], total
+
+        keys = np.stack([self.codes[name][selected] for name in by], axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        sums = np.zeros((len(groups), len(CUBE_MEASURES)))
+        np.add.at(sums, inverse.reshape(-1), measures)
+        members = [self.members[name] for name in by]
+        cells = []
+        for key, values in zip(groups.tolist(), sums.tolist()):
+            cell = {name: values_of[code] for name, values_of, code in zip(by, members, key)}
+            cell.update(_measures_dict(values))
+            cells.append(cell)
+        return cells, total
+
+
+def _measures_dict(values):
+    customers, analysed, churn_sum, high_risk, revenue, total_charges = values
+    return {
+        'customers': int(customers),
+        'analysed': int(analysed),
+        'mean_churn': round(churn_sum / analysed, 4) if analysed else None,
+        'high_risk': int(high_risk),
+        'revenue': round(revenue, 2),
+        'total_charges': round(total_charges, 2)
+    }
+
+
+def load_cube(session, version=None):
+    """The materialized cube (latest version by default), or None if it was never built."""
+    refresh = session.get(ChurnCubeRefresh, version) if version is not None else \
+        session.execute(select(ChurnCubeRefresh).order_by(ChurnCubeRefresh.refresh_id.desc()).limit(1)).scalar()
+    if refresh is None:
+        return None
+    table = ChurnCubeCell.__table__
+    rows = session.execute(select(*table.columns)).all()
+    return ChurnCube(refresh.refresh_id, refresh.refreshed_at, rows)
+
+
+def parse_cube_query(args):
+    """(by, filters) from query args: by=dim,dim and dim=value[,value]. Raises ValueError."""
+    by = [name for name in (args.get('by') or '').split(',') if name]
+    for name in by:
+        if name not in CUBE_DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {name}")
+    if len(set(by)) != len(by):
+        raise ValueError("Repeated dimension in by")
+    filters = {}
+    for name in CUBE_DIMENSIONS:
+        raw = [v for arg in args.getlist(name) for v in arg.split(',') if v != '']
+        if not raw:
+            continue
+        if name in BOOLEAN_DIMENSIONS:
+            values = [PARSERS['bool'](v) for v in raw]
+            if None in values:
+                raise ValueError(f"{name} must be true or false")
+            raw = values
+        filters[name] = raw
+    return by, filters
+
+
+class CubeStore:
+    """Per-worker cube copy; checks for a newer version at most every `check_interval` seconds."""
+
+    def __init__(self, check_interval=DEFAULT_CUBE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._cube = None
+        self._checked_at = 0.0
+        self.metrics = {'queries': 0, 'loads': 0, 'version_checks': 0}
+
+    def get(self, session):
+        with self._lock:
+            self.metrics['queries'] += 1
+            if self._cube is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._cube
+            version = session.execute(select(func.max(ChurnCubeRefresh.refresh_id))).scalar()
+            self.metrics['version_checks'] += 1
+            self._checked_at = time.monotonic()
+            if version is not None and (self._cube is None or self._cube.version != version):
+                self._cube = load_cube(session, version)
+                self.metrics['loads'] += 1
+            return self._cube
+
+    def invalidate(self):
+        """Forces a version check on the next get() (after a refresh in this process)."""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics)
+            cube = self._cube
+        data['version'] = cube.version if cube is not None else None
+        data['refreshed_at'] = cube.refreshed_at.isoformat(timespec='seconds') if cube is not None else None
+        data['cells'] = len(cube.measures) if cube is not None else 0
+        data['check_interval'] = self.check_interval
+        return data
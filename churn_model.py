@@ -0,0 +1,245 @@
+import os
+import csv
+import json
+import datetime
+import threading
+import numpy as np
+from sqlalchemy import select, func
+from models import Predictions
+from scoring import MIN_RISK, MAX_RISK, SCORING_FEATURES, feature_query, rows_to_columns
+from bulk_import import PARSERS
+
+#  TRAINED CHURN MODEL (LOGISTIC REGRESSION)
+# Uses every stored feature: demographics, tenure, contract, billing,
+# charges, internet add-ons and phone lines. Training runs offline
+# (`flask train-model`) with Newton/IRLS on standardized features; the
+# standardization is then folded into the weights, so inference is one
+# design matrix and one matrix-vector product, X @ coef + bias, followed
+# by a sigmoid. A model is a directory holding weights.npy (memory-mapped
+# on load) and model.json (feature encoding plus training metadata).
+#
+# The tables hold no churn outcome. With a labels CSV (customer_id, churn)
+# the model learns observed churn; without one it is fitted to the stored
+# ChurnProbability values (soft targets), i.e. it learns the current
+# scores from the full feature set.
+
+MODEL_FORMAT_VERSION = 1
+DEFAULT_TRAIN_SAMPLE = 200000
+MAX_CATEGORY_LEVELS = 20
+
+MODEL_COLUMNS = tuple(SCORING_FEATURES)
+
+NUMERIC_FEATURES = {'tenure': None, 'monthly_charges': None, 'total_charges': 'log1p'}
+CATEGORY_FEATURES = ('gender', 'contract_mode', 'payment_method', 'internet_type')
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -40.0, 40.0)))
+
+
+class _LevelIndex(dict):
+    """Category level -> position; unknown levels and None map to -1."""
+    def __missing__(self, key):
+        return -1
+
+
+def feature_spec(columns):
+    """Encoding for every model column; category levels come from the training data."""
+    spec = []
+    for name in MODEL_COLUMNS[1:]:
+        if name in CATEGORY_FEATURES:
+            values, counts = np.unique(np.asarray([v for v in columns[name] if v is not None], dtype=object),
+                                       return_counts=True)
+            levels = [str(v) for v in values[np.argsort(-counts)][:MAX_CATEGORY_LEVELS]]
+            spec.append({'name': name, 'kind': 'category', 'levels': sorted(levels)})
+        elif name in NUMERIC_FEATURES:
+            spec.append({'name': name, 'kind': 'numeric', 'transform': NUMERIC_FEATURES[name]})
+        else:
+            spec.append({'name': name, 'kind': 'bool'})
+    return spec
+
+
+def feature_names(spec):
+    names = []
+    for feature in spec:
+        if feature['kind'] == 'category':
+            names.extend(f"{feature['name']}={level}" for level in feature['levels'])
+        else:
+            names.append(feature['name'])
+    return names
+
+
+def design_matrix(columns, spec):
+    """
+    n x d float64 matrix for a dict of columns. Missing values (no contract /
+    internet / phone row, or a field left out) encode as 0; categories are one-hot.
+    """
+    n = len(columns['customer_id'])
+    X = np.zeros((n, len(feature_names(spec))), dtype=np.float64)
+    j = 0
+    for feature in spec:
+        values = columns.get(feature['name'], [None] * n)
+        if feature['kind'] == 'category':
+            # One dict lookup per value, then a scatter into the one-hot block
+            index = _LevelIndex((level, i) for i, level in enumerate(feature['levels']))
+            codes = np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=n)
+            known = codes >= 0
+            X[np.flatnonzero(known), j + codes[known]] = 1.0
+            j += len(feature['levels'])
+            continue
+        col = np.array(values, dtype=np.float64) # Copy; None -> nan
+        np.nan_to_num(col, copy=False, nan=0.0)
+        if feature.get('transform') == 'log1p':
+            col = np.log1p(np.maximum(col, 0.0))
+        X[:, j] = col
+        j += 1
+    return X
+
+
+def fit_logistic(X, y, l2=1.0, max_iter=25, tol=1e-6):
+    """
+    L2-regularized logistic regression by Newton/IRLS on standardized
+    features (y may be soft targets in [0, 1]). Returns (coef, bias, iterations)
+    for the raw, unstandardized features.
+    """
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = np.hstack([(X - mean) / std, np.ones((len(X), 1))])
+    penalty = np.full(Z.shape[1], l2)
+    penalty[-1] = 0.0 # Intercept is not regularized
+    w = np.zeros(Z.shape[1])
+    for iteration in range(1, max_iter + 1):
+        p = _sigmoid(Z @ w)
+        gradient = Z.T @ (p - y) + penalty * w
+        hessian = (Z * (p * (1 - p))[:, None]).T @ Z + np.diag(penalty)
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < tol:
+            break
+    coef = w[:-1] / std
+    bias = w[-1] - float((w[:-1] * mean / std).sum())
+    return coef, bias, iteration
+
+
+def read_labels(path):
+    """{customer_id: 0/1} from a CSV with customer_id (or CustomerID) and churn (or Churn) columns."""
+    labels = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        fields = {name.lower(): name for name in reader.fieldnames or ()}
+        id_field = fields.get('customer_id') or fields.get('customerid')
+        label_field = fields.get('churn')
+        if not id_field or not label_field:
+            raise ValueError("Labels CSV needs customer_id and churn columns")
+        for row in reader:
+            churned = PARSERS['bool'](row[label_field])
+            if churned is not None:
+                labels[row[id_field].strip()] = float(churned)
+    return labels
+
+
+def training_set(session, labels=None, sample=DEFAULT_TRAIN_SAMPLE, seed=42, batch_size=50000):
+    """(columns, targets) for up to `sample` customers, sampled uniformly in one streaming pass."""
+    rng = np.random.default_rng(seed)
+    if labels is None:
+        total = session.execute(select(func.count(Predictions.customer_id))).scalar()
+        stmt = feature_query(only_predicted=True, columns=MODEL_COLUMNS).add_columns(Predictions.churn_probability)
+    else:
+        total = len(labels)
+        stmt = feature_query(labels.keys() if len(labels) <= 10000 else None, columns=MODEL_COLUMNS)
+    fraction = min(1.0, sample / total) if total else 1.0
+
+    rows, targets = [], []
+    result = session.connection().execute(stmt.execution_options(yield_per=batch_size))
+    for batch in result.partitions(batch_size):
+        keep = rng.random(len(batch)) < fraction
+        for row, kept in zip(batch, keep):
+            if not kept:
+                continue
+            if labels is None:
+                rows.append(row[:-1])
+                targets.append(row[-1])
+            elif row[0] in labels:
+                rows.append(row)
+                targets.append(labels[row[0]])
+    return rows_to_columns(rows, MODEL_COLUMNS), np.asarray(targets, dtype=np.float64)
+
+
+def train_model(session, path, labels_path=None, sample=DEFAULT_TRAIN_SAMPLE, l2=1.0, seed=42):
+    """Trains on the database and writes the model directory. Returns its metadata."""
+    labels = read_labels(labels_path) if labels_path else None
+    columns, y = training_set(session, labels, sample, seed)
+    if len(y) == 0:
+        raise ValueError("No training rows (no predictions stored and no labels given)")
+    spec = feature_spec(columns)
+    X = design_matrix(columns, spec)
+    coef, bias, iterations = fit_logistic(X, y, l2)
+
+    p = np.clip(_sigmoid(X @ coef + bias), 1e-12, 1 - 1e-12)
+    metrics = {
+        'log_loss': round(float(-(y * np.log(p) + (1 - y) * np.log(1 - p)).mean()), 5),
+        'mean_abs_error': round(float(np.abs(p - y).mean()), 5),
+        'accuracy': round(float(((p > 0.5) == (y > 0.5)).mean()), 5)
+    }
+    meta = {
+        'version': MODEL_FORMAT_VERSION,
+        'kind': 'logistic',
+        'features': spec,
+        'trained': {
+            'at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'rows': int(len(y)),
+            'target': 'labels' if labels is not None else 'stored_probability',
+            'l2': l2,
+            'iterations': iterations,
+            'metrics': metrics
+        }
+    }
+    save_model(path, meta, coef, bias)
+    return meta
+
+
+def save_model(path, meta, coef, bias):
+    os.makedirs(path, exist_ok=True)
+    weights = np.append(coef, bias).astype(np.float64)
+    tmp = os.path.join(path, f'weights.{os.getpid()}.tmp.npy')
+    np.save(tmp, weights)
+    os.replace(tmp, os.path.join(path, 'weights.npy'))
+    with open(os.path.join(path, 'model.json.tmp'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(path, 'model.json.tmp'), os.path.join(path, 'model.json'))
+
+
+class LogisticScorer:
+    """Scorer backed by a trained model directory, loaded on first use."""
+    name = 'logistic'
+    tenure_boundaries = None # Tenure is a numeric feature: every month changes the score
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._meta = None
+        self._weights = None
+
+    def _load(self):
+        if self._meta is None:
+            with self._lock:
+                if self._meta is None:
+                    with open(os.path.join(self.path, 'model.json')) as f:
+                        meta = json.load(f)
+                    if meta.get('version') != MODEL_FORMAT_VERSION:
+                        raise ValueError(f"Unsupported model format in {self.path}")
+                    # Read-only mapping: pages are shared between worker processes
+                    self._weights = np.load(os.path.join(self.path, 'weights.npy'), mmap_mode='r')
+                    self._meta = meta
+        return self._meta
+
+    @property
+    def columns(self):
+        return ('customer_id',) + tuple(f['name'] for f in self._load()['features'])
+
+    def score_columns(self, columns):
+        meta = self._load()
+        X = design_matrix(columns, meta['features'])
+        z = X @ self._weights[:-1] + self._weights[-1]
+        return np.clip(_sigmoid(z), MIN_RISK, MAX_RISK)
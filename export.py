@@ -0,0 +1,151 @@
+import io
+import csv
+from sqlalchemy import select
+from models import Customer, Contract, InternetService, PhoneService, Predictions
+
+#  COLUMNAR EXPORT
+# The full customer + contract + internet + phone + prediction dataset, read
+# with one outer-joined Core SELECT on a server-side cursor in fixed-size
+# batches (plain row tuples, no ORM objects) and written out as CSV, Parquet
+# or Arrow IPC chunk by chunk. Memory depends on batch_size, not on the
+# table size. Parquet / Arrow need pyarrow.
+
+DEFAULT_EXPORT_BATCH = 50000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+# (output name, column, arrow type name)
+EXPORT_COLUMNS = (
+    ('customer_id', Customer.customer_id, 'string'),
+    ('gender', Customer.gender, 'string'),
+    ('senior_citizen', Customer.senior_citizen, 'bool_'),
+    ('partner', Customer.partner, 'bool_'),
+    ('dependents', Customer.dependents, 'bool_'),
+    ('tenure', Customer.tenure, 'int32'),
+    ('contract_mode', Contract.contract_mode, 'string'),
+    ('paperless_billing', Contract.paperless_billing, 'bool_'),
+    ('payment_method', Contract.payment_method, 'string'),
+    ('monthly_charges', Contract.monthly_charges, 'float64'),
+    ('total_charges', Contract.total_charges, 'float64'),
+    ('internet_type', InternetService.internet_type, 'string'),
+    ('online_security', InternetService.online_security, 'bool_'),
+    ('online_backup', InternetService.online_backup, 'bool_'),
+    ('device_protection', InternetService.device_protection, 'bool_'),
+    ('tech_support', InternetService.tech_support, 'bool_'),
+    ('streaming_movies', InternetService.streaming_movies, 'bool_'),
+    ('has_phone_service', PhoneService.has_phone_service, 'bool_'),
+    ('multiple_lines', PhoneService.multiple_lines, 'bool_'),
+    ('churn_probability', Predictions.churn_probability, 'float64'),
+)
+
+
+def export_select():
+    """Every customer with its related rows (NULLs where a table has no row)."""
+    return select(*[col.label(name) for name, col, _ in EXPORT_COLUMNS])\
+        .select_from(Customer)\
+        .outerjoin(Contract, Contract.customer_id == Customer.customer_id)\
+        .outerjoin(InternetService, InternetService.customer_id == Customer.customer_id)\
+        .outerjoin(PhoneService, PhoneService.customer_id == Customer.customer_id)\
+        .outerjoin(Predictions, Predictions.customer_id == Customer.customer_id)\
+        .order_by(Customer.customer_id)
+
+
+def iter_export_batches(session, batch_size=DEFAULT_EXPORT_BATCH):
+    """Lists of row tuples, batch_size at a time, from a server-side cursor."""
+    # Executed on the Core connection: rows skip the ORM loading layer entirely
+    result = session.connection().execute(export_select().execution_options(yield_per=batch_size))
+    for partition in result.partitions(batch_size):
+        yield partition
+
+
+def csv_chunks(batches):
+    yield ','.join(name for name, _, _ in EXPORT_COLUMNS) + '\r\n'
+    for batch in batches:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(batch)
+        yield buf.getvalue()
+
+
+def arrow_schema():
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, type_name)()) for name, _, type_name in EXPORT_COLUMNS])
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain()."""
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def columnar_chunks(batches, fmt):
+    """Parquet (one row group per batch) or Arrow IPC file bytes, one chunk per batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode='w')
+    writer = pq.ParquetWriter(out, schema) if fmt == 'parquet' else pa.ipc.new_file(out, schema)
+    for batch in batches:
+        if not batch:
+            continue
+        columns = zip(*batch)
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(batches, fmt):
+    """str chunks for csv, bytes chunks for parquet / arrow."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'csv':
+        return csv_chunks(batches)
+    return columnar_chunks(batches, fmt)
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def export_to_file(session, path, fmt, batch_size=DEFAULT_EXPORT_BATCH, on_chunk=None):
+    """Writes the export to path; returns the number of rows written."""
+    rows = 0
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+            if on_chunk: on_chunk(rows)
+
+    chunks = export_chunks(counted(iter_export_batches(session, batch_size)), fmt)
+    with open(path, 'w', newline='') if fmt == 'csv' else open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return rows
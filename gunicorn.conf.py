@@ -0,0 +1,57 @@
+import os
+import tempfile
+import multiprocessing
+
+#  GUNICORN CONFIGURATION
+# Production serving: `gunicorn -c gunicorn.conf.py wsgi:app`. Several worker
+# processes, each with a pool of request threads (gthread), so slow requests
+# do not block everyone else; long-lived connections (the SSE log feed) are
+# served by the async app instead of pinning a thread here. Each worker's
+# SQLAlchemy pool should be at least as large as its thread count
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW >= GUNICORN_THREADS).
+#
+# Workers share no memory, so everything a request can read back in another
+# worker lives outside the process: consultation logs and the churn cube in
+# the database, report jobs in REPORT_CACHE_DIR, the risk view cache and the
+# aggregate cache generation in Redis, profiler counters in PROFILING_DIR.
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None # empty disables it
+errorlog = '-'
+
+# Workers do not share memory: with more than one, the risk view cache must
+# live in Redis or an edit served by one worker leaves stale views in the
+# others. Workers inherit the environment, so default it here.
+if workers > 1 and not os.environ.get('RISK_CACHE_URL'):
+    os.environ['RISK_CACHE_URL'] = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+# Likewise the profiler's /metrics would only count the answering worker
+if workers > 1 and not os.environ.get('PROFILING_DIR'):
+    os.environ['PROFILING_DIR'] = os.path.join(tempfile.gettempdir(), 'clientguard-profiling')
+
+
+def on_starting(server):
+    # Once, in the master, before any worker is forked
+    from app import app, wait_for_db
+    from models import db
+    from profiling import clear_shared_dir
+    clear_shared_dir(os.environ.get('PROFILING_DIR')) # Counters start from zero with the server
+    if not wait_for_db():
+        raise SystemExit("Database not reachable, giving up")
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    # Pooled connections must never be shared with the master or other workers
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,24 @@
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from models import Customer
+
+#  CUSTOMER AGGREGATE LOADER
+# A customer together with its contract, internet, phone and prediction rows,
+# fetched in a single joined SELECT instead of one primary-key query per
+# table.
+
+
+def aggregate_select():
+    return select(Customer).options(
+        joinedload(Customer.contract),
+        joinedload(Customer.internet),
+        joinedload(Customer.phone),
+        joinedload(Customer.prediction)
+    )
+
+
+def load_customer(session, customer_id):
+    """Customer with every related row loaded, or None."""
+    stmt = aggregate_select().where(Customer.customer_id == customer_id)
+    return session.execute(stmt).unique().scalar_one_or_none()
+
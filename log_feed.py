@@ -0,0 +1,83 @@
+import datetime
+from sqlalchemy import select
+from models import Customer, Employee, ConsultationLogs
+
+#  CONSULTATION LOG FEED
+# Queries behind every view of the consultation logs: latest entries, the
+# ?since= cursor and the live stream (async_api.py). All of them read the
+# shared table, so every worker sees every log whichever process wrote it.
+#
+# Incremental readers page on LogSeq, which the log writers hand out in
+# commit order (see log_writer.py): a row can never appear behind a cursor
+# a reader has already passed, so pages need no settle delay. ?since= only
+# sets where a new reader starts, by consultation time.
+
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG_RECENT_LIMIT = 10
+LOG_SINCE_LIMIT = 100
+
+
+def log_entry(log_time, employee_name, role, customer_id, log_id=None, log_seq=None):
+    entry = {
+        'time': log_time.strftime(LOG_TIME_FORMAT),
+        'employee': employee_name,
+        'role': role,
+        'customer': customer_id
+    }
+    if log_id is not None:
+        entry['id'] = log_id
+    if log_seq is not None:
+        entry['seq'] = log_seq
+    return entry
+
+
+def log_entries_select():
+    return select(ConsultationLogs.consultation_time, Employee.employee_name, Employee.role, Customer.customer_id,
+                  ConsultationLogs.log_id, ConsultationLogs.log_seq)\
+        .join(Employee, ConsultationLogs.employee_id == Employee.employee_id)\
+        .join(Customer, ConsultationLogs.customer_id == Customer.customer_id)
+
+
+def recent_logs_select(limit=LOG_RECENT_LIMIT):
+    """Latest log rows, newest first."""
+    return log_entries_select()\
+        .order_by(ConsultationLogs.consultation_time.desc(), ConsultationLogs.log_id.desc()).limit(limit)
+
+
+def latest_sequenced_logs_select(limit=LOG_RECENT_LIMIT):
+    """Last `limit` numbered log rows in write order, newest first (where a live stream starts)."""
+    seq = ConsultationLogs.log_seq
+    return log_entries_select().where(seq.isnot(None)).order_by(seq.desc()).limit(limit)
+
+
+def logs_since_select(after=None, since_time=None, limit=LOG_SINCE_LIMIT):
+    """
+    Log rows after the `after` LogSeq cursor, in sequence order (range scan on
+    ux_consultation_logs_seq). since_time additionally skips rows consulted
+    at or before it; with neither, paging starts at the first numbered row.
+    """
+    seq = ConsultationLogs.log_seq
+    stmt = log_entries_select().where(seq > after if after is not None else seq.isnot(None))
+    if since_time is not None:
+        stmt = stmt.where(ConsultationLogs.consultation_time > since_time)
+    return stmt.order_by(seq.asc()).limit(limit)
+
+
+def parse_log_cursor(args):
+    """(after, since_time) from ?after= / ?since= query args. Raises ValueError."""
+    after = args.get('after')
+    since = args.get('since')
+    try:
+        after = int(after) if after not in (None, '') else None
+    except ValueError:
+        raise ValueError('after must be an integer (next_after of the previous page)')
+    try:
+        since_time = datetime.datetime.fromisoformat(since) if since else None
+    except ValueError:
+        raise ValueError('since must be an ISO-8601 timestamp')
+    return after, since_time
+
+
+def next_log_cursor(rows, after):
+    """next_after for a page: the last row's LogSeq, or the cursor the page was read from."""
+    return rows[-1][-1] if rows else after
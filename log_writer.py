@@ -0,0 +1,166 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from sqlalchemy import insert, update, select, func
+from models import db, ConsultationLogs, LogSequence
+
+#  ASYNC CONSULTATION LOG WRITER
+# Requests only enqueue log rows in memory. A dedicated worker thread flushes
+# them with one multi-row INSERT when batch_size rows are waiting or
+# flush_interval seconds have passed, whichever comes first.
+#
+# Each INSERT first takes a LogSeq range from the log_sequence counter in the
+# same transaction. The counter's row lock is held until commit, so sequence
+# numbers become visible in order across every worker and host: readers
+# paging on LogSeq never pass a row that commits later, however long the
+# queue backs up or the database stalls.
+
+_STOP = object()
+LOG_SEQUENCE_NAME = 'consultation_logs'
+
+
+def reserve_log_seq(conn, count):
+    """First of `count` consecutive LogSeq values, locking the counter until the transaction ends."""
+    table = LogSequence.__table__
+    bumped = conn.execute(update(table).where(table.c.Name == LOG_SEQUENCE_NAME)
+                          .values(Value=table.c.Value + count)).rowcount
+    if not bumped:
+        # No counter yet (fresh schema without migrations): start after the highest stored value
+        start = conn.execute(select(func.coalesce(func.max(ConsultationLogs.log_seq), 0))).scalar()
+        conn.execute(insert(table).values(Name=LOG_SEQUENCE_NAME, Value=start + count))
+    value = conn.execute(select(table.c.Value).where(table.c.Name == LOG_SEQUENCE_NAME)).scalar()
+    return value - count + 1
+
+
+class LogWriter:
+    def __init__(self, app, max_queue=10000, batch_size=500, flush_interval=1.0, enqueue_timeout=0.05):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.metrics = {
+            'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0,
+            'flushes': 0, 'max_depth': 0, 'last_batch': 0, 'last_flush_ms': None
+        }
+        atexit.register(self.close)
+
+    # --- Request side ---
+    def enqueue(self, log_id, consultation_time, employee_id, customer_id):
+        """Queues one log row. Returns False if the queue stayed full (row dropped)."""
+        self._ensure_worker()
+        row = {'LogID': log_id, 'ConsultationTime': consultation_time,
+               'EmployeeID': employee_id, 'CustomerID': customer_id}
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock: self.metrics['dropped'] += 1
+            return False
+        with self._lock:
+            self.metrics['enqueued'] += 1
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], self._queue.qsize())
+        return True
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics)
+        data['depth'] = self._queue.qsize()
+        data['capacity'] = self._queue.maxsize
+        return data
+
+    def flush(self):
+        """Blocks until every row queued so far has been written (or failed)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Drains the queue and stops the worker (registered with atexit)."""
+        if self._closed: return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    # --- Worker side ---
+    def _ensure_worker(self):
+        # (Re)start lazily, and again in a forked worker process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                self._write(batch)
+                for _ in batch: self._queue.task_done()
+        # Drain whatever is still queued after the stop marker
+        rest = []
+        while True:
+            try:
+                rest.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        rest = [r for r in rest if r is not _STOP]
+        for start in range(0, len(rest), self.batch_size):
+            self._write(rest[start:start + self.batch_size])
+        for _ in rest: self._queue.task_done()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        with self.app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    first = reserve_log_seq(conn, len(batch))
+                    rows = [dict(row, LogSeq=first + i) for i, row in enumerate(batch)]
+                    conn.execute(insert(ConsultationLogs.__table__).values(rows))
+                written, failed = len(batch), 0
+            except Exception as e:
+                # Isolate the bad rows instead of losing the whole batch
+                print(f"Error logging batch ({len(batch)} rows): {e}")
+                written, failed = self._write_one_by_one(batch)
+        with self._lock:
+            m = self.metrics
+            m['written'] += written
+            m['failed'] += failed
+            m['flushes'] += 1
+            m['last_batch'] = len(batch)
+            m['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _write_one_by_one(self, batch):
+        written = failed = 0
+        for row in batch:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(ConsultationLogs.__table__), dict(row, LogSeq=reserve_log_seq(conn, 1)))
+                written += 1
+            except Exception as e:
+                print(f"Error logging: {e}")
+                failed += 1
+        return written, failed
@@ -0,0 +1,145 @@
+from sqlalchemy import inspect, text
+from models import RISK_BAND_SQL
+from log_writer import LOG_SEQUENCE_NAME, reserve_log_seq
+
+#  SCHEMA MIGRATIONS
+# db.create_all() only creates missing tables, so changes to existing tables
+# are applied here. Every step inspects the live schema first and is safe to
+# run again; run_migrations() is called on startup and by `flask migrate`.
+
+
+def _index_names(inspector, table):
+    return {ix['name'] for ix in inspector.get_indexes(table)}
+
+
+def migrate_consultation_logs_datetime(conn):
+    """ConsultationTime String(50) -> DATETIME(6), plus the (time, customer) index."""
+    inspector = inspect(conn)
+    if 'consultation_logs' not in inspector.get_table_names():
+        return False
+    changed = False
+
+    if conn.dialect.name == 'mysql':
+        col = next(c for c in inspector.get_columns('consultation_logs') if c['name'] == 'ConsultationTime')
+        if 'DATETIME' not in str(col['type']).upper():
+            # Existing values are 'YYYY-MM-DD HH:MM:SS' strings, which MySQL converts in place
+            conn.execute(text("ALTER TABLE consultation_logs MODIFY ConsultationTime DATETIME(6) NOT NULL"))
+            changed = True
+    # SQLite: the stored 'YYYY-MM-DD HH:MM:SS' text already is SQLAlchemy's DateTime format
+
+    if 'ix_consultation_logs_time_customer' not in _index_names(inspector, 'consultation_logs'):
+        conn.execute(text("CREATE INDEX ix_consultation_logs_time_customer "
+                          "ON consultation_logs (ConsultationTime, CustomerID)"))
+        changed = True
+    return changed
+
+
+def migrate_predictions_risk_band(conn):
+    """Generated RiskBand column on predictions, plus the (RiskBand, ChurnProbability) index."""
+    inspector = inspect(conn)
+    if 'predictions' not in inspector.get_table_names():
+        return False
+    changed = False
+
+    if 'RiskBand' not in {c['name'] for c in inspector.get_columns('predictions')}:
+        if conn.dialect.name == 'mysql':
+            conn.execute(text(f"ALTER TABLE predictions ADD COLUMN RiskBand SMALLINT AS ({RISK_BAND_SQL}) STORED"))
+        else:
+            # SQLite can only add VIRTUAL generated columns; they index the same way
+            conn.execute(text(f"ALTER TABLE predictions ADD COLUMN RiskBand SMALLINT "
+                              f"GENERATED ALWAYS AS ({RISK_BAND_SQL}) VIRTUAL"))
+        changed = True
+
+    if 'ix_predictions_band_probability' not in _index_names(inspector, 'predictions'):
+        conn.execute(text("CREATE INDEX ix_predictions_band_probability "
+                          "ON predictions (RiskBand, ChurnProbability)"))
+        changed = True
+    return changed
+
+
+def migrate_customer_tenure_index(conn):
+    """(Tenure, CustomerID) index on customer, used by the monthly tenure aging job."""
+    inspector = inspect(conn)
+    if 'customer' not in inspector.get_table_names():
+        return False
+    if 'ix_customer_tenure' in _index_names(inspector, 'customer'):
+        return False
+    conn.execute(text("CREATE INDEX ix_customer_tenure ON customer (Tenure, CustomerID)"))
+    return True
+
+
+def migrate_consultation_logs_time_id_index(conn):
+    """(ConsultationTime, LogID) index for the composite ?since= cursor."""
+    inspector = inspect(conn)
+    if 'consultation_logs' not in inspector.get_table_names():
+        return False
+    if 'ix_consultation_logs_time_id' in _index_names(inspector, 'consultation_logs'):
+        return False
+    conn.execute(text("CREATE INDEX ix_consultation_logs_time_id ON consultation_logs (ConsultationTime, LogID)"))
+    return True
+
+
+
+def number_log_rows(conn):
+    """
+    Gives LogSeq values to log rows that have none (written before the column
+    existed, or by seed scripts), in (ConsultationTime, LogID) order, from a
+    range reserved on the counter. Returns the number of rows numbered.
+    """
+    missing = conn.execute(text("SELECT COUNT(*) FROM consultation_logs WHERE LogSeq IS NULL")).scalar()
+    if not missing:
+        return 0
+    base = reserve_log_seq(conn, missing) - 1
+    numbered = ("SELECT LogID, ROW_NUMBER() OVER (ORDER BY ConsultationTime, LogID) AS n "
+                "FROM consultation_logs WHERE LogSeq IS NULL")
+    if conn.dialect.name == 'mysql':
+        conn.execute(text(f"UPDATE consultation_logs c JOIN ({numbered}) o ON o.LogID = c.LogID "
+                          f"SET c.LogSeq = o.n + :base"), {'base': base})
+    else:
+        conn.execute(text(f"UPDATE consultation_logs SET LogSeq = o.n + :base FROM ({numbered}) AS o "
+                          f"WHERE o.LogID = consultation_logs.LogID"), {'base': base})
+    return missing
+
+
+def migrate_consultation_logs_seq(conn):
+    """Commit-ordered LogSeq column (the ?since= / stream cursor), its counter row and numbering."""
+    inspector = inspect(conn)
+    if 'consultation_logs' not in inspector.get_table_names():
+        return False
+    changed = False
+
+    if 'LogSeq' not in {c['name'] for c in inspector.get_columns('consultation_logs')}:
+        conn.execute(text("ALTER TABLE consultation_logs ADD COLUMN LogSeq BIGINT NULL"))
+        changed = True
+    if 'ux_consultation_logs_seq' not in _index_names(inspector, 'consultation_logs'):
+        conn.execute(text("CREATE UNIQUE INDEX ux_consultation_logs_seq ON consultation_logs (LogSeq)"))
+        changed = True
+    if 'log_sequence' not in inspector.get_table_names():
+        conn.execute(text("CREATE TABLE log_sequence (Name VARCHAR(50) NOT NULL PRIMARY KEY, Value BIGINT NOT NULL)"))
+        changed = True
+    exists = conn.execute(text("SELECT COUNT(*) FROM log_sequence WHERE Name = :name"),
+                          {'name': LOG_SEQUENCE_NAME}).scalar()
+    if not exists:
+        conn.execute(text("INSERT INTO log_sequence (Name, Value) "
+                          "SELECT :name, COALESCE(MAX(LogSeq), 0) FROM consultation_logs"), {'name': LOG_SEQUENCE_NAME})
+        changed = True
+    return number_log_rows(conn) > 0 or changed
+
+
+MIGRATIONS = [
+    ('consultation_logs_datetime', migrate_consultation_logs_datetime),
+    ('predictions_risk_band', migrate_predictions_risk_band),
+    ('customer_tenure_index', migrate_customer_tenure_index),
+    ('consultation_logs_time_id_index', migrate_consultation_logs_time_id_index),
+    ('consultation_logs_seq', migrate_consultation_logs_seq),
+]
+
+
+def run_migrations(engine):
+    """Applies every pending step; returns the names of the ones that changed something."""
+    applied = []
+    for name, step in MIGRATIONS:
+        with engine.begin() as conn:
+            if step(conn):
+                applied.append(name)
+    return applied
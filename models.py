@@ -1,4 +1,9 @@
+import os
+import time
+import secrets
+import threading
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql
 
 db = SQLAlchemy()
 
@@ -12,6 +17,10 @@ class Employee(db.Model):
 
 class Customer(db.Model):
     __tablename__ = 'customer'
+    __table_args__ = (
+        # Customers at a given tenure (monthly aging: who crossed a rule boundary)
+        db.Index('ix_customer_tenure', 'Tenure', 'CustomerID'),
+    )
     customer_id = db.Column('CustomerID', db.String(10), primary_key=True)
     gender = db.Column('Gender', db.String(10), nullable=False)
     senior_citizen = db.Column('SeniorCitizen', db.Boolean, nullable=False)
@@ -20,15 +29,63 @@ class Customer(db.Model):
     tenure = db.Column('Tenure', db.Integer, nullable=False)
 
     
-    contract = db.relationship('Contract', backref='customer', uselist=False)
-    internet = db.relationship('InternetService', backref='customer', uselist=False)
+    # One-to-one rows owned by the customer (deleted with it)
+    contract = db.relationship('Contract', backref='customer', uselist=False, cascade='all, delete-orphan')
+    internet = db.relationship('InternetService', backref='customer', uselist=False, cascade='all, delete-orphan')
+    phone = db.relationship('PhoneService', backref='customer', uselist=False, cascade='all, delete-orphan')
+    prediction = db.relationship('Predictions', backref='customer', uselist=False, cascade='all, delete-orphan')
+
+# Log IDs: zero-padded microsecond timestamp (strictly increasing per process)
+# plus a random per-process node id, so they sort by time and do not collide
+# between workers, even across containers or hosts where the same PIDs repeat.
+# The node id is drawn again in every forked child.
+_log_id_lock = threading.Lock()
+_last_log_us = 0
+_log_node = None
+
+def _new_log_node():
+    global _log_node
+    _log_node = secrets.token_hex(4)
+
+_new_log_node()
+os.register_at_fork(after_in_child=_new_log_node)
+
+def next_log_id():
+    global _last_log_us
+    with _log_id_lock:
+        now_us = max(time.time_ns() // 1000, _last_log_us + 1)
+        _last_log_us = now_us
+    return f"LOG-{now_us:017d}-{_log_node}"
+
+# DATETIME(6) on MySQL so the ?since= cursor has microsecond resolution
+LogTimestamp = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
 
 class ConsultationLogs(db.Model):
     __tablename__ = 'consultation_logs'
-    log_id = db.Column('LogID', db.String(50), primary_key=True)
-    consultation_time = db.Column('ConsultationTime', db.String(50), nullable=False)
+    __table_args__ = (
+        db.Index('ix_consultation_logs_time_customer', 'ConsultationTime', 'CustomerID'),
+        # Latest entries: (time, id) breaks ties between equal timestamps
+        db.Index('ix_consultation_logs_time_id', 'ConsultationTime', 'LogID'),
+        # ?since= / stream cursor, in commit order (see LogSequence)
+        db.Index('ux_consultation_logs_seq', 'LogSeq', unique=True),
+    )
+    log_id = db.Column('LogID', db.String(50), primary_key=True, default=next_log_id)
+    consultation_time = db.Column('ConsultationTime', LogTimestamp, nullable=False)
     employee_id = db.Column('EmployeeID', db.String(10), db.ForeignKey('employee.EmployeeID'))
     customer_id = db.Column('CustomerID', db.String(10), db.ForeignKey('customer.CustomerID'))
+    # Assigned by the log writer inside the insert transaction; NULL until
+    # migrations number rows written by other tools (seed scripts)
+    log_seq = db.Column('LogSeq', db.BigInteger)
+
+class LogSequence(db.Model):
+    """
+    Counter row handing out LogSeq ranges. Writers bump it first in their
+    insert transaction, so its row lock orders the commits: once a reader
+    sees sequence N, every row below N is already committed.
+    """
+    __tablename__ = 'log_sequence'
+    name = db.Column('Name', db.String(50), primary_key=True)
+    value = db.Column('Value', db.BigInteger, nullable=False)
 
 class Contract(db.Model):
     __tablename__ = 'contract'
@@ -55,7 +112,72 @@ class PhoneService(db.Model):
     has_phone_service = db.Column('has_phone_service', db.Boolean, nullable=False)
     multiple_lines = db.Column('MultipleLines', db.Boolean, nullable=False)
 
+# Risk bands (same thresholds as the dashboard progress bars). RiskBand is a
+# generated column, so every write path (ORM, upserts, raw bulk INSERTs)
+# keeps it in sync, and (RiskBand, ChurnProbability) is indexed: band counts
+# and "top N riskiest" become index range scans instead of full scans.
+RISK_BAND_LOW, RISK_BAND_MEDIUM, RISK_BAND_HIGH = 0, 1, 2
+RISK_BAND_NAMES = {RISK_BAND_LOW: 'low', RISK_BAND_MEDIUM: 'medium', RISK_BAND_HIGH: 'high'}
+MEDIUM_RISK_THRESHOLD = 0.50
+HIGH_RISK_THRESHOLD = 0.80
+RISK_BAND_SQL = (f"CASE WHEN ChurnProbability > {HIGH_RISK_THRESHOLD} THEN {RISK_BAND_HIGH} "
+                 f"WHEN ChurnProbability > {MEDIUM_RISK_THRESHOLD} THEN {RISK_BAND_MEDIUM} "
+                 f"ELSE {RISK_BAND_LOW} END")
+
+def risk_band(probability):
+    """Python twin of RISK_BAND_SQL."""
+    if probability > HIGH_RISK_THRESHOLD: return RISK_BAND_HIGH
+    if probability > MEDIUM_RISK_THRESHOLD: return RISK_BAND_MEDIUM
+    return RISK_BAND_LOW
+
 class Predictions(db.Model):
     __tablename__ = 'predictions'
+    __table_args__ = (
+        db.Index('ix_predictions_band_probability', 'RiskBand', 'ChurnProbability'),
+    )
     customer_id = db.Column('CustomerID', db.String(10), db.ForeignKey('customer.CustomerID'), primary_key=True)
     churn_probability = db.Column('ChurnProbability', db.Float, nullable=False)
+    risk_band = db.Column('RiskBand', db.SmallInteger, db.Computed(RISK_BAND_SQL, persisted=True))
+
+def above_threshold(threshold):
+    """Filter for churn_probability > threshold; a band range on the index when threshold is a band boundary."""
+    if threshold == HIGH_RISK_THRESHOLD: return Predictions.risk_band == RISK_BAND_HIGH
+    if threshold == MEDIUM_RISK_THRESHOLD: return Predictions.risk_band >= RISK_BAND_MEDIUM
+    return Predictions.churn_probability > threshold
+
+class TenureAgingRun(db.Model):
+    """One row per monthly tenure roll-forward; the key cursor makes a run resumable."""
+    __tablename__ = 'tenure_aging_runs'
+    period = db.Column('Period', db.String(7), primary_key=True) # 'YYYY-MM'
+    started_at = db.Column('StartedAt', db.DateTime, nullable=False)
+    finished_at = db.Column('FinishedAt', db.DateTime)
+    last_customer_id = db.Column('LastCustomerID', db.String(10))
+    customers_aged = db.Column('CustomersAged', db.Integer, nullable=False, default=0)
+    rescored = db.Column('Rescored', db.Integer, nullable=False, default=0)
+
+# Materialized churn cube (see churn_cube.py): one row per combination of the
+# dimensions, '(none)' where the customer has no contract / internet row.
+class ChurnCubeCell(db.Model):
+    __tablename__ = 'churn_cube'
+    contract_mode = db.Column('ContractMode', db.String(15), primary_key=True)
+    internet_type = db.Column('InternetType', db.String(50), primary_key=True)
+    payment_method = db.Column('PaymentMethod', db.String(50), primary_key=True)
+    senior_citizen = db.Column('SeniorCitizen', db.Boolean, primary_key=True)
+    partner = db.Column('Partner', db.Boolean, primary_key=True)
+    dependents = db.Column('Dependents', db.Boolean, primary_key=True)
+    tenure_bucket = db.Column('TenureBucket', db.String(10), primary_key=True)
+    customers = db.Column('Customers', db.Integer, nullable=False)
+    analysed = db.Column('Analysed', db.Integer, nullable=False)
+    churn_sum = db.Column('ChurnSum', db.Float, nullable=False)
+    high_risk = db.Column('HighRisk', db.Integer, nullable=False)
+    revenue = db.Column('Revenue', db.Float, nullable=False)
+    total_charges = db.Column('TotalCharges', db.Float, nullable=False)
+
+class ChurnCubeRefresh(db.Model):
+    """One row per cube rebuild; the latest id is the cube version workers compare against."""
+    __tablename__ = 'churn_cube_refreshes'
+    refresh_id = db.Column('RefreshID', db.Integer, primary_key=True, autoincrement=True)
+    refreshed_at = db.Column('RefreshedAt', db.DateTime, nullable=False)
+    cells = db.Column('Cells', db.Integer, nullable=False)
+    customers = db.Column('Customers', db.Integer, nullable=False)
+    seconds = db.Column('Seconds', db.Float, nullable=False)
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import defaultdict
+from flask import g, request, has_request_context, jsonify, Response
+from sqlalchemy import event
+
+#  REQUEST PROFILER
+# Per-request SQL and latency instrumentation built on SQLAlchemy engine
+# events and Flask request hooks. Adds a Server-Timing header to every
+# response and aggregates per-endpoint histograms for /metrics (Prometheus
+# text format). When disabled nothing is registered, so there is no overhead.
+#
+# Workers do not share memory, so with several of them each one also dumps
+# its counters to <shared_dir>/<pid>.json (PROFILING_DIR) every
+# flush_interval seconds and at exit; /metrics and /api/stats/profiling sum
+# every worker's file, whichever worker answers. Files of exited workers
+# stay, so counters never go backwards; clear_shared_dir() empties the
+# directory when the server starts. Without a shared_dir the numbers are
+# those of the answering worker only (fine with a single worker).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+def clear_shared_dir(path):
+    """Removes the per-worker files of a previous server run."""
+    if not path or not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        if name.endswith('.json'):
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name, labels):
+        out = [f'{name}_bucket{{{labels},le="{b:g}"}} {c}' for b, c in zip(self.buckets, self.counts)]
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.total}')
+        out.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        out.append(f'{name}_count{{{labels}}} {self.total}')
+        return out
+
+    def state(self):
+        return {'counts': self.counts, 'total': self.total, 'sum': self.sum}
+
+    def merge(self, state):
+        self.counts = [a + b for a, b in zip(self.counts, state['counts'])]
+        self.total += state['total']
+        self.sum += state['sum']
+
+
+class RequestProfiler:
+    def __init__(self, app=None, db=None, enabled=False, slow_query_ms=200,
+                 shared_dir=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.shared_dir = shared_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._db_time = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self._requests = defaultdict(int)
+        self.slowest = {}
+        self._dirty = False
+        self._flusher = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        if not self.enabled:
+            return
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        app.add_url_rule('/api/stats/profiling', 'profiling_stats', self.stats_view)
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+            atexit.register(self.flush)
+
+    # --- SQLAlchemy events ---
+    def _before_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        # Background threads (log writer, workers) have no request to charge
+        if not has_request_context() or 'profile' not in g:
+            return
+        prof = g.profile
+        prof['queries'] += 1
+        prof['db_time'] += elapsed
+        if elapsed > prof['slowest'][0]:
+            prof['slowest'] = (elapsed, statement)
+
+    # --- Flask hooks ---
+    def _start_request(self):
+        g.profile = {'start': time.perf_counter(), 'queries': 0, 'db_time': 0.0, 'slowest': (0.0, None)}
+
+    def _finish_request(self, response):
+        prof = g.pop('profile', None)
+        if prof is None:
+            return response
+        wall = time.perf_counter() - prof['start']
+        slowest_time, slowest_sql = prof['slowest']
+        endpoint = request.endpoint or 'unknown'
+
+        response.headers.add('Server-Timing',
+                             f'db;dur={prof["db_time"] * 1000:.2f};desc="{prof["queries"]} queries", '
+                             f'slowest-query;dur={slowest_time * 1000:.2f}, '
+                             f'total;dur={wall * 1000:.2f}')
+
+        with self._lock:
+            self._latency[endpoint].observe(wall)
+            self._db_time[endpoint].observe(prof['db_time'])
+            self._queries[endpoint].observe(prof['queries'])
+            self._requests[(endpoint, response.status_code)] += 1
+            if slowest_sql and slowest_time > self.slowest.get(endpoint, {}).get('seconds', 0):
+                self.slowest[endpoint] = {'seconds': round(slowest_time, 6), 'statement': slowest_sql}
+            self._dirty = True
+        if self.shared_dir:
+            self._ensure_flusher()
+
+        if slowest_time * 1000 > self.slow_query_ms:
+            print(f"Slow query on {endpoint} ({slowest_time * 1000:.1f} ms): {slowest_sql}")
+        return response
+
+    # --- Shared store (one file per worker) ---
+    def _snapshot(self):
+        # Caller holds the lock
+        return {
+            'requests': [[endpoint, status, count] for (endpoint, status), count in self._requests.items()],
+            'latency': {endpoint: hist.state() for endpoint, hist in self._latency.items()},
+            'db_time': {endpoint: hist.state() for endpoint, hist in self._db_time.items()},
+            'queries': {endpoint: hist.state() for endpoint, hist in self._queries.items()},
+            'slowest': self.slowest
+        }
+
+    def _path(self, pid):
+        return os.path.join(self.shared_dir, f'{pid}.json')
+
+    def flush(self):
+        """Writes this worker's counters to its file (atomic replace)."""
+        if not self.shared_dir:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._snapshot())
+            self._dirty = False
+        path = self._path(os.getpid())
+        tmp = f'{path}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error writing profiler metrics to {path}: {e}")
+
+    def _ensure_flusher(self):
+        # (Re)start lazily, and again in a forked worker process
+        if self._flusher is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._flusher = threading.Thread(target=self._run_flusher, name='profiler-flush', daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _collect(self):
+        """(requests, latency, db_time, queries, slowest) summed over every worker."""
+        with self._lock:
+            snapshots = [json.loads(json.dumps(self._snapshot()))]
+        if self.shared_dir:
+            own = f'{os.getpid()}.json'
+            try:
+                names = [n for n in os.listdir(self.shared_dir) if n.endswith('.json') and n != own]
+            except OSError:
+                names = []
+            for name in names:
+                try:
+                    with open(os.path.join(self.shared_dir, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue # Being replaced or removed: counted on the next scrape
+
+        requests = defaultdict(int)
+        series = {key: defaultdict(lambda b=buckets: Histogram(b))
+                  for key, buckets in (('latency', LATENCY_BUCKETS), ('db_time', LATENCY_BUCKETS),
+                                       ('queries', QUERY_BUCKETS))}
+        slowest = {}
+        for snap in snapshots:
+            for endpoint, status, count in snap['requests']:
+                requests[(endpoint, status)] += count
+            for key, hists in series.items():
+                for endpoint, state in snap[key].items():
+                    hists[endpoint].merge(state)
+            for endpoint, slow in snap['slowest'].items():
+                if slow['seconds'] > slowest.get(endpoint, {}).get('seconds', 0):
+                    slowest[endpoint] = slow
+        return requests, series['latency'], series['db_time'], series['queries'], slowest
+
+    # --- Views ---
+    def metrics_view(self):
+        requests, latency, db_time, queries, _ = self._collect()
+        lines = ['# HELP clientguard_requests_total Requests served, by endpoint and status.',
+                 '# TYPE clientguard_requests_total counter']
+        for (endpoint, status), count in sorted(requests.items()):
+            lines.append(f'clientguard_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        for name, help_text, series in (
+            ('clientguard_request_duration_seconds', 'Wall time per request.', latency),
+            ('clientguard_request_db_seconds', 'Time spent in SQL per request.', db_time),
+            ('clientguard_request_queries', 'SQL statements per request.', queries),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for endpoint, hist in sorted(series.items()):
+                lines += hist.lines(name, f'endpoint="{endpoint}"')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    def stats_view(self):
+        _, latency, db_time, queries, slowest = self._collect()
+        data = {
+            endpoint: {
+                'requests': hist.total,
+                'avg_ms': round(hist.sum / hist.total * 1000, 3) if hist.total else None,
+                'avg_queries': round(queries[endpoint].sum / hist.total, 2) if hist.total else None,
+                'avg_db_ms': round(db_time[endpoint].sum / hist.total * 1000, 3) if hist.total else None,
+                'slowest_query': slowest.get(endpoint)
+            }
+            for endpoint, hist in latency.items()
+        }
+        return jsonify(data)
@@ -0,0 +1,267 @@
+import os
+import json
+import atexit
+import hashlib
+import datetime
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session
+from models import Contract
+from reporting import REPORT_BATCH_SIZE, executive_report_chunks, high_risk_rows
+from streaming import iter_result_batches
+
+#  REPORT JOB QUEUE
+# Requests enqueue a report job; a process pool renders the PDF to disk so
+# no web worker is held for the whole render. Finished artifacts live in an
+# on-disk cache keyed by a hash of the rows the report prints plus its
+# parameters, so identical reports are served without rendering again. The
+# cache is trimmed least-recently-used first once it exceeds max_bytes.
+#
+# The job id is that cache key, and a job's state lives next to its PDF in a
+# small <key>.json file, so any worker (or container sharing the directory)
+# can answer a status poll or a download, and identical submits from
+# different workers share one render.
+
+REPORT_FORMAT_VERSION = 1
+DEFAULT_JOB_TIMEOUT = 900 # A queued/running job older than this is taken as lost (its worker died)
+
+
+def report_fingerprint(session, threshold, batch_size=REPORT_BATCH_SIZE):
+    """
+    SHA-256 over every row the report prints, in print order, plus the
+    revenue total: any change to a printed value (a swapped tenure, a moved
+    probability) changes it, whichever path wrote the data.
+    """
+    digest = hashlib.sha256()
+    revenue = session.execute(select(func.sum(Contract.monthly_charges))).scalar()
+    digest.update(repr(revenue).encode())
+    for batch in iter_result_batches(session, high_risk_rows(threshold), batch_size):
+        for row in batch:
+            digest.update(repr((row['customer_id'], row['tenure'], row['contract_mode'],
+                                row['churn_probability'])).encode())
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def render_report(database_url, threshold, path, job_path):
+    """Runs in a pool process: renders the executive PDF into path. Returns its size."""
+    job = _read_json(job_path)
+    if job is not None:
+        job['status'] = 'running'
+        _write_json(job_path, job)
+    engine = create_engine(database_url)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with Session(engine) as session:
+            revenue = float(session.execute(select(func.sum(Contract.monthly_charges))).scalar() or 0)
+            with open(tmp_path, 'wb') as f:
+                for chunk in executive_report_chunks(session, threshold, revenue):
+                    f.write(chunk)
+        # Readers only ever see complete files
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        engine.dispose()
+
+
+class ReportJobs:
+    def __init__(self, cache_dir='report_cache', max_bytes=512 * 1024 * 1024, workers=2, max_jobs=500,
+                 job_timeout=DEFAULT_JOB_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.job_timeout = job_timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.metrics = {'submitted': 0, 'cache_hits': 0, 'rendered': 0, 'failed': 0, 'evicted': 0}
+        atexit.register(self.close)
+
+    # --- Request side ---
+    def submit(self, session, threshold):
+        """
+        Returns the job for this report. A cached artifact completes the job
+        at once, and an identical job already in flight (in any worker) is reused.
+        """
+        database_url = session.get_bind().url.render_as_string(hide_password=False)
+        key = self.cache_key(session, threshold)
+        with self._lock:
+            self.metrics['submitted'] += 1
+        job = self.get(key)
+        if job is not None and job['status'] == 'done':
+            self._touch(self.artifact_path(key))
+            with self._lock:
+                self.metrics['cache_hits'] += 1
+            job['cached'] = True
+            return job
+        if job is not None and job['status'] in ('queued', 'running'):
+            return job
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        job = {'id': key, 'status': 'queued', 'threshold': threshold,
+               'created': datetime.datetime.now().isoformat(timespec='seconds'),
+               'finished': None, 'rendered_at': None, 'size_bytes': None, 'error': None}
+        if not self._claim(key, job):
+            return self.get(key) # Another worker queued it first
+        future = self._executor().submit(render_report, database_url, threshold,
+                                         self.artifact_path(key), self.job_path(key))
+        future.add_done_callback(lambda f, key=key: self._finished(key, f))
+        job['cached'] = False
+        return job
+
+    def get(self, job_id):
+        """The job's state from its job file (and artifact), or None if unknown."""
+        if not self._valid_id(job_id):
+            return None
+        job = _read_json(self.job_path(job_id))
+        if job is None:
+            return None
+        if job['status'] == 'done' and not os.path.exists(self.artifact_path(job_id)):
+            job['status'] = 'evicted'
+        elif job['status'] in ('queued', 'running') and self._age(job_id) > self.job_timeout:
+            job.update(status='failed', error='timed out')
+        job['cached'] = False
+        return job
+
+    def artifact(self, job_id):
+        """Path of a finished job's PDF, or None if it is gone (evicted or never built)."""
+        if not self._valid_id(job_id):
+            return None
+        path = self.artifact_path(job_id)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics)
+        files = self._cache_files()
+        data['cache_files'] = len(files)
+        data['cache_bytes'] = sum(size for _, size, _ in files)
+        data['cache_max_bytes'] = self.max_bytes
+        return data
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # --- Cache ---
+    def cache_key(self, session, threshold):
+        raw = f"executive|v{REPORT_FORMAT_VERSION}|{threshold}|{report_fingerprint(session, threshold)}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def artifact_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def job_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _valid_id(self, job_id):
+        # Ids are cache keys (hex); anything else must never reach a file path
+        return len(job_id) == 32 and all(c in '0123456789abcdef' for c in job_id)
+
+    def _claim(self, key, job):
+        """Writes a new job file; False if a live job for this key already exists."""
+        path = self.job_path(key)
+        current = self.get(key)
+        if current is not None and current['status'] in ('queued', 'running', 'done'):
+            return False
+        if current is not None:
+            os.remove(path) # Failed or lost: start over
+        try:
+            with open(path, 'x') as f: # Exclusive create: one winner across workers
+                json.dump(job, f)
+        except FileExistsError:
+            return False
+        return True
+
+    def _age(self, key):
+        try:
+            return datetime.datetime.now().timestamp() - os.path.getmtime(self.job_path(key))
+        except OSError:
+            return 0.0
+
+    def _touch(self, path):
+        # mtime doubles as the last-access time for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _cache_files(self, suffix='.pdf'):
+        files = []
+        if not os.path.isdir(self.cache_dir):
+            return files
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(suffix):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _evict(self):
+        files = sorted(self._cache_files())
+        total = sum(size for _, size, _ in files)
+        # The newest artifact is kept even if it alone is over the budget
+        while total > self.max_bytes and len(files) > 1:
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock: self.metrics['evicted'] += 1
+        # Forget the oldest job files; an evicted job's file answers 410 until then
+        jobs = sorted(self._cache_files('.json'))
+        for _, _, path in jobs[:max(0, len(jobs) - self.max_jobs)]:
+            job = _read_json(path)
+            if job is None or job['status'] == 'failed' or \
+                    (job['status'] == 'done' and not os.path.exists(path[:-len('.json')] + '.pdf')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # --- Worker side ---
+    def _executor(self):
+        # Spawned (not forked) workers: the web process runs other threads
+        if self._pool is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _finished(self, key, future):
+        job = _read_json(self.job_path(key)) or {'id': key}
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        job['finished'] = now
+        if future.cancelled():
+            job.update(status='failed', error='cancelled')
+        elif future.exception() is not None:
+            job.update(status='failed', error=str(future.exception()))
+            with self._lock: self.metrics['failed'] += 1
+            print(f"Error rendering report {key}: {future.exception()}")
+        else:
+            job.update(status='done', size_bytes=future.result(), rendered_at=now)
+            with self._lock: self.metrics['rendered'] += 1
+        _write_json(self.job_path(key), job)
+        self._evict()
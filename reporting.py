@@ -0,0 +1,194 @@
+import zlib
+import datetime
+from fpdf import FPDF
+from sqlalchemy import select, func
+from models import Customer, Contract, Predictions, above_threshold
+from streaming import iter_result_batches
+
+#  REPORTING MODULE
+
+REPORT_BATCH_SIZE = 1000
+
+
+class PDF(FPDF):
+    # Set once the priority table starts so every following page repeats its header
+    table_header = False
+
+    def header(self):
+
+        self.set_font('Arial', 'B', 15)
+        self.cell(0, 10, 'ClientGuard - Executive Report', 0, 1, 'C')
+        self.ln(5)
+        if self.table_header:
+            self.priority_table_header()
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+    def priority_table_header(self):
+        self.set_font("Arial", size=10)
+        self.set_fill_color(200, 220, 255)
+        self.cell(40, 10, 'Customer ID', 1, 0, 'C', 1)
+        self.cell(30, 10, 'Tenure', 1, 0, 'C', 1)
+        self.cell(40, 10, 'Contract', 1, 0, 'C', 1)
+        self.cell(30, 10, 'Risk %', 1, 1, 'C', 1)
+
+
+class StreamingPDF(PDF):
+    """
+    FPDF keeps every page in memory until close(). This subclass serializes
+    each page object as soon as the page ends, so drain() can hand finished
+    bytes to the caller and memory stays bounded by one page. Only what the
+    executive report uses is supported (no links, no {nb} alias).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._flushed = 0
+        self._putheader()
+
+    def drain(self):
+        """Returns the bytes produced since the last call."""
+        data = self.buffer.encode('latin-1')
+        self._flushed += len(data)
+        self.buffer = ''
+        return data
+
+    def _offset(self):
+        return self._flushed + len(self.buffer)
+
+    def _newobj(self):
+        self.n += 1
+        self.offsets[self.n] = self._offset()
+        self._out(str(self.n) + ' 0 obj')
+
+    def _endpage(self):
+        super()._endpage()
+        self._putpage(self.page)
+
+    def _putpage(self, n):
+        # Object numbers 3+2*(n-1) (page) and 4+2*(n-1) (content), as _putpages assumes
+        self._newobj()
+        self._out('<</Type /Page')
+        self._out('/Parent 1 0 R')
+        self._out('/Resources 2 0 R')
+        self._out('/Contents ' + str(self.n + 1) + ' 0 R>>')
+        self._out('endobj')
+        content = self.pages[n]
+        self.pages[n] = ''
+        if self.compress:
+            content = zlib.compress(content.encode('latin-1'))
+            stream_filter = '/Filter /FlateDecode '
+        else:
+            stream_filter = ''
+        self._newobj()
+        self._out('<<' + stream_filter + '/Length ' + str(len(content)) + '>>')
+        self._putstream(content)
+        self._out('endobj')
+
+    def _putpages(self):
+        # Pages were already written by _endpage; only the page tree is left
+        nb = self.page
+        self.offsets[1] = self._offset()
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ''.join(f'{3 + 2 * i} 0 R ' for i in range(nb)) + ']')
+        self._out('/Count ' + str(nb))
+        self._out('/MediaBox [0 0 %.2f %.2f]' % (self.fw_pt, self.fh_pt))
+        self._out('>>')
+        self._out('endobj')
+
+    def _putresources(self):
+        self._putfonts()
+        self._putimages()
+        self.offsets[2] = self._offset()
+        self._out('2 0 obj')
+        self._out('<<')
+        self._putresourcedict()
+        self._out('>>')
+        self._out('endobj')
+
+    def _enddoc(self):
+        self._putpages()
+        self._putresources()
+        self._newobj()
+        self._out('<<')
+        self._putinfo()
+        self._out('>>')
+        self._out('endobj')
+        self._newobj()
+        self._out('<<')
+        self._putcatalog()
+        self._out('>>')
+        self._out('endobj')
+        xref = self._offset()
+        self._out('xref')
+        self._out('0 ' + str(self.n + 1))
+        self._out('0000000000 65535 f ')
+        for i in range(1, self.n + 1):
+            self._out('%010d 00000 n ' % self.offsets[i])
+        self._out('trailer')
+        self._out('<<')
+        self._puttrailer()
+        self._out('>>')
+        self._out('startxref')
+        self._out(xref)
+        self._out('%%EOF')
+        self.state = 3
+
+
+def high_risk_rows(threshold):
+    """Every customer above threshold with tenure and contract mode, riskiest first."""
+    return select(
+        Customer.customer_id, Customer.tenure, Contract.contract_mode, Predictions.churn_probability
+    ).join(Predictions, Predictions.customer_id == Customer.customer_id)\
+     .outerjoin(Contract, Contract.customer_id == Customer.customer_id)\
+     .where(above_threshold(threshold))\
+     .order_by(Predictions.churn_probability.desc(), Predictions.customer_id.desc())
+
+
+def executive_report_chunks(session, threshold, total_revenue, batch_size=REPORT_BATCH_SIZE):
+    """
+    Yields the executive PDF as byte chunks. Rows come from a server-side
+    cursor batch_size at a time and finished pages are flushed after each
+    batch, so memory does not grow with the number of high-risk customers.
+    """
+    high_risk_total = session.execute(
+        select(func.count(Predictions.customer_id)).where(above_threshold(threshold))
+    ).scalar()
+
+    pdf = StreamingPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, txt="1. Executive Summary", ln=True)
+    pdf.set_font("Arial", size=12)
+
+    pdf.cell(200, 10, txt=f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=True)
+    pdf.cell(200, 10, txt=f"Total Monthly Revenue: ${round(total_revenue, 2):,}", ln=True)
+    pdf.cell(200, 10, txt=f"High Risk Customers (>{int(threshold * 100)}%): {high_risk_total}", ln=True)
+    pdf.ln(10)
+
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(200, 10, txt="2. Priority Action List (High Risk)", ln=True)
+    pdf.priority_table_header()
+    pdf.table_header = True
+    yield pdf.drain()
+
+    for batch in iter_result_batches(session, high_risk_rows(threshold), batch_size):
+        for row in batch:
+            pdf.set_font("Arial", size=10)
+            pdf.cell(40, 10, str(row['customer_id']), 1)
+            pdf.cell(30, 10, f"{row['tenure']} months", 1)
+            pdf.cell(40, 10, str(row['contract_mode'] or "N/A"), 1)
+
+            pdf.set_text_color(220, 50, 50)
+            pdf.cell(30, 10, f"{int(row['churn_probability'] * 100)}%", 1, 1, 'C')
+            pdf.set_text_color(0, 0, 0) # Reset color
+        yield pdf.drain()
+
+    pdf.close()
+    yield pdf.drain()
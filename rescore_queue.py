@@ -0,0 +1,173 @@
+import os
+import time
+import atexit
+import threading
+from sqlalchemy import event
+from models import db, Customer, Contract, InternetService, PhoneService
+from scoring import score_columns
+from bulk_writer import upsert_predictions
+from batch_predict import load_batch
+
+#  INCREMENTAL RESCORING (DIRTY-CUSTOMER QUEUE)
+# ORM session events record the CustomerID of every Customer / Contract /
+# InternetService / PhoneService row inserted or changed in a flush, and
+# hand them over only when the transaction commits (a rollback drops them).
+# A worker thread drains the set in batches: one joined read, one scoring
+# call, one upsert of the probabilities that actually changed. Repeated
+# edits of the same customer before a batch runs coalesce into one rescore.
+# Customers without a stored prediction stay pending, as before.
+
+TRACKED_MODELS = (Customer, Contract, InternetService, PhoneService)
+_SESSION_KEY = 'dirty_customer_ids'
+
+
+class RescoreQueue:
+    def __init__(self, app, batch_size=500, interval=1.0, on_rescored=None):
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_rescored = on_rescored
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._inflight = 0
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.metrics = {
+            'marked': 0, 'batches': 0, 'rescored': 0, 'unchanged': 0, 'skipped': 0,
+            'failed': 0, 'max_pending': 0, 'last_batch': 0, 'last_batch_ms': None
+        }
+        atexit.register(self.close)
+
+    # --- Change tracking ---
+    def watch(self, session_target):
+        """Registers the session events on a Session class, sessionmaker or scoped_session."""
+        event.listen(session_target, 'after_flush', self._collect)
+        event.listen(session_target, 'after_commit', self._publish)
+        event.listen(session_target, 'after_rollback', self._discard)
+
+    def _collect(self, session, flush_context):
+        # Runs before the flush is reflected: new / dirty still list what was written
+        ids = session.info.setdefault(_SESSION_KEY, set())
+        for obj in session.new:
+            if isinstance(obj, TRACKED_MODELS):
+                ids.add(obj.customer_id)
+        for obj in session.dirty:
+            if isinstance(obj, TRACKED_MODELS) and session.is_modified(obj, include_collections=False):
+                ids.add(obj.customer_id)
+
+    def _publish(self, session):
+        ids = session.info.pop(_SESSION_KEY, None)
+        if ids:
+            self.mark(ids)
+
+    def _discard(self, session):
+        session.info.pop(_SESSION_KEY, None)
+
+    # --- Request side ---
+    def mark(self, customer_ids):
+        """Queues customers for rescoring (for writes that bypass the ORM)."""
+        self._ensure_worker()
+        with self._cond:
+            before = len(self._pending)
+            self._pending.update(customer_ids)
+            self.metrics['marked'] += len(self._pending) - before
+            self.metrics['max_pending'] = max(self.metrics['max_pending'], len(self._pending))
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self, timeout=None):
+        """Blocks until every customer queued so far has been rescored."""
+        if self._thread is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._pending or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._cond.wait(timeout=remaining)
+
+    def stats(self):
+        with self._cond:
+            data = dict(self.metrics)
+            data['pending'] = len(self._pending)
+        return data
+
+    def close(self):
+        """Rescores what is still pending and stops the worker (registered with atexit)."""
+        if self._closed: return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            with self._cond:
+                self._cond.notify()
+            self._thread.join()
+
+    # --- Worker side ---
+    def _ensure_worker(self):
+        # (Re)start lazily, and again in a forked worker process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name='rescore-queue', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(timeout=self.interval)
+                if not self._pending:
+                    if self._closed: return
+                    continue
+                # Give edits a moment to coalesce unless a full batch is waiting
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._cond.wait(timeout=self.interval)
+                batch = [self._pending.pop() for _ in range(min(self.batch_size, len(self._pending)))]
+                self._inflight = len(batch)
+            try:
+                self._rescore(batch)
+            finally:
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
+
+    def _rescore(self, customer_ids):
+        start = time.perf_counter()
+        changes = []
+        unchanged = skipped = failed = 0
+        with self.app.app_context():
+            try:
+                columns = load_batch(db.session, customer_ids)
+                scores = score_columns(columns)
+                for cid, old, new in zip(columns['customer_id'], columns['stored'], scores):
+                    if old is None:
+                        skipped += 1 # Never analysed: stays pending
+                    elif float(new) == old:
+                        unchanged += 1
+                    else:
+                        changes.append((cid, old, float(new)))
+                skipped += len(customer_ids) - len(columns['customer_id']) # Deleted since
+                if changes:
+                    upsert_predictions(db.session, [(cid, new) for cid, _, new in changes])
+                else:
+                    db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error rescoring {len(customer_ids)} customers: {e}")
+                changes, failed = [], len(customer_ids)
+        if changes and self.on_rescored:
+            self.on_rescored(changes)
+        with self._cond:
+            m = self.metrics
+            m['batches'] += 1
+            m['rescored'] += len(changes)
+            m['unchanged'] += unchanged
+            m['skipped'] += skipped
+            m['failed'] += failed
+            m['last_batch'] = len(customer_ids)
+            m['last_batch_ms'] = round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,297 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+#  CUSTOMER RISK VIEW CACHE
+# Bounded LRU + TTL cache of the risk view predict_tool shows (score, level,
+# strategies and the customer fields on the card), keyed by CustomerID.
+# Routes that change a customer invalidate its entry explicitly; TTL only
+# bounds how long an entry can outlive a write made behind the app's back.
+#
+# With a shared backend (RISK_CACHE_URL=redis://...) entries live there
+# instead, so every worker sees the same views and the same invalidations;
+# size limits and eviction are then the store's job. LocalBackend is an
+# in-process stand-in with the same interface. gunicorn.conf.py selects the
+# shared backend by default whenever it runs more than one worker.
+#
+# A miss takes a per-customer generation before reading the database and
+# put() only stores the view if that customer was not invalidated (nor the
+# whole cache cleared) in between; with a shared backend the check and the
+# write are one atomic step in the store.
+
+DEFAULT_RISK_CACHE_SIZE = 10000
+DEFAULT_RISK_CACHE_TTL = 300
+
+
+class LocalBackend:
+    """Shared-backend stand-in: a dict with per-key expiry, values stored as strings."""
+    name = 'local'
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and time.monotonic() >= expires:
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def set_if(self, key, value, ttl, expected):
+        """Sets key only if every key in `expected` still holds the given value (None = absent)."""
+        with self._lock:
+            if any(self._get(k) != v for k, v in expected.items()):
+                return False
+            self._data[key] = (value, time.monotonic() + ttl)
+            return True
+
+    def incr(self, key, ttl=None):
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            self._data[key] = (str(value), time.monotonic() + ttl if ttl else None)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def size(self, prefix):
+        with self._lock:
+            return sum(1 for k in self._data if k.startswith(prefix))
+
+
+class RedisBackend:
+    name = 'redis'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=max(1, int(ttl)))
+
+    def set_if(self, key, value, ttl, expected):
+        """Sets key only if every key in `expected` still holds the given value (WATCH / MULTI)."""
+        with self._client.pipeline() as pipe:
+            try:
+                pipe.watch(*expected)
+                for k, v in expected.items():
+                    current = pipe.get(k)
+                    if (current.decode() if current is not None else None) != v:
+                        return False
+                pipe.multi()
+                pipe.set(key, value, ex=max(1, int(ttl)))
+                pipe.execute()
+                return True
+            except self._redis.WatchError:
+                return False
+
+    def incr(self, key, ttl=None):
+        with self._client.pipeline() as pipe:
+            pipe.incr(key)
+            if ttl:
+                pipe.expire(key, max(1, int(ttl)))
+            return pipe.execute()[0]
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def clear(self, prefix):
+        keys = list(self._client.scan_iter(match=f'{prefix}*', count=1000))
+        if keys:
+            self._client.delete(*keys)
+
+    def size(self, prefix):
+        return sum(1 for _ in self._client.scan_iter(match=f'{prefix}*', count=1000))
+
+
+def backend_from_url(url):
+    """None (in-process LRU), LocalBackend for local://, RedisBackend for redis://."""
+    if not url:
+        return None
+    if url.startswith('local://'):
+        return LocalBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported risk cache backend: {url}")
+
+
+class RiskViewCache:
+    def __init__(self, max_entries=DEFAULT_RISK_CACHE_SIZE, ttl=DEFAULT_RISK_CACHE_TTL, backend=None, prefix='risk:'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # In-process generations: customer -> sequence of its last invalidation
+        # (bounded; ids pushed out raise the floor, so their old tokens stay stale)
+        self._versions = OrderedDict()
+        self._version_floor = 0
+        self._sequence = 0
+        self._epoch = 0
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                        'invalidations': 0, 'stale_puts': 0, 'backend_errors': 0}
+
+    # Shared-backend keys: views, per-customer versions, and the clear() epoch
+    def _view_key(self, customer_id):
+        return f'{self.prefix}d:{customer_id}'
+
+    def _version_key(self, customer_id):
+        return f'{self.prefix}v:{customer_id}'
+
+    @property
+    def _epoch_key(self):
+        return f'{self.prefix}epoch'
+
+    def _backend_error(self, e):
+        print(f"Risk cache backend error: {e}")
+        with self._lock:
+            self.metrics['backend_errors'] += 1
+
+    # --- Reads ---
+    def get(self, customer_id):
+        """The cached view, or None on a miss (absent or expired)."""
+        if self.backend is not None:
+            try:
+                raw = self.backend.get(self._view_key(customer_id))
+            except Exception as e:
+                self._backend_error(e)
+                raw = None
+            view = json.loads(raw) if raw is not None else None
+            with self._lock:
+                self.metrics['hits' if view is not None else 'misses'] += 1
+            return view
+
+        with self._lock:
+            item = self._entries.get(customer_id)
+            if item is not None and time.monotonic() >= item[1]:
+                del self._entries[customer_id]
+                self.metrics['expirations'] += 1
+                item = None
+            if item is None:
+                self.metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(customer_id)
+            self.metrics['hits'] += 1
+            return item[0]
+
+    def generation(self, customer_id):
+        """Token for put(customer_id, ...): take it before reading the database for a miss."""
+        if self.backend is not None:
+            try:
+                return (self.backend.get(self._epoch_key), self.backend.get(self._version_key(customer_id)))
+            except Exception as e:
+                self._backend_error(e)
+                return None
+        with self._lock:
+            return (self._epoch, self._versions.get(customer_id, self._version_floor))
+
+    # --- Writes ---
+    def put(self, customer_id, view, generation=None):
+        """
+        Caches a view. If this customer was invalidated (or the cache cleared)
+        since `generation` was taken, the view may predate it and is dropped instead.
+        """
+        if self.backend is not None:
+            try:
+                raw = json.dumps(view)
+                if generation is None:
+                    self.backend.set(self._view_key(customer_id), raw, self.ttl)
+                    return True
+                expected = {self._epoch_key: generation[0], self._version_key(customer_id): generation[1]}
+                if self.backend.set_if(self._view_key(customer_id), raw, self.ttl, expected):
+                    return True
+            except Exception as e:
+                self._backend_error(e)
+                return False
+            with self._lock:
+                self.metrics['stale_puts'] += 1
+            return False
+
+        with self._lock:
+            if generation is not None and \
+                    generation != (self._epoch, self._versions.get(customer_id, self._version_floor)):
+                self.metrics['stale_puts'] += 1
+                return False
+            self._entries[customer_id] = (view, time.monotonic() + self.ttl)
+            self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics['evictions'] += 1
+            return True
+
+    def invalidate(self, *customer_ids):
+        with self._lock:
+            self.metrics['invalidations'] += len(customer_ids)
+            if self.backend is None:
+                for customer_id in customer_ids:
+                    self._sequence += 1
+                    self._versions[customer_id] = self._sequence
+                    self._versions.move_to_end(customer_id)
+                    self._entries.pop(customer_id, None)
+                while len(self._versions) > self.max_entries:
+                    _, sequence = self._versions.popitem(last=False)
+                    self._version_floor = max(self._version_floor, sequence)
+                return
+        try:
+            for customer_id in customer_ids:
+                # Version first: a put racing with this write fails its check
+                self.backend.incr(self._version_key(customer_id), self.ttl)
+                self.backend.delete(self._view_key(customer_id))
+        except Exception as e:
+            self._backend_error(e)
+
+    def clear(self):
+        """Drops every entry (bulk rescoring, imports)."""
+        with self._lock:
+            self.metrics['invalidations'] += 1
+            self._epoch += 1
+            self._entries.clear()
+        if self.backend is not None:
+            try:
+                self.backend.incr(self._epoch_key)
+                self.backend.clear(f'{self.prefix}d:')
+            except Exception as e:
+                self._backend_error(e)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics)
+            size = len(self._entries)
+        lookups = data['hits'] + data['misses']
+        data['hit_ratio'] = round(data['hits'] / lookups, 4) if lookups else None
+        if self.backend is not None:
+            try:
+                size = self.backend.size(f'{self.prefix}d:')
+            except Exception as e:
+                self._backend_error(e)
+                size = None
+        data['size'] = size
+        data['max_entries'] = self.max_entries if self.backend is None else None
+        data['ttl'] = self.ttl
+        data['backend'] = self.backend.name if self.backend is not None else 'memory'
+        return data
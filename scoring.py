@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+import numpy as np
+from sqlalchemy import select
+from models import Customer, Contract, InternetService, PhoneService, Predictions
+from bulk_writer import upsert_predictions, DEFAULT_CHUNK_SIZE
+from export import EXPORT_COLUMNS
+
+#  VECTORIZED CHURN ENGINE
+# Same rule table as the original calculate_churn_risk, applied to whole
+# NumPy columns. The additions are done in the same order as the scalar
+# rules so the float results are bit-for-bit identical.
+
+BASE_RISK = 0.30
+MIN_RISK = 0.01
+MAX_RISK = 0.99
+
+FEATURE_COLUMNS = ('customer_id', 'tenure', 'senior_citizen', 'partner',
+                   'dependents', 'contract_mode', 'internet_type')
+
+# Every stored feature a scorer can ask for, by name (same names as the export)
+SCORING_FEATURES = {name: col for name, col, _ in EXPORT_COLUMNS if name != 'churn_probability'}
+
+DEFAULT_MODEL_PATH = 'trained_models/churn_logreg'
+
+
+def score_arrays(tenure, senior_citizen, partner, dependents, contract_mode, internet_type):
+    """
+    Scores N customers at once. Every argument is a sequence of length N;
+    contract_mode / internet_type may contain None (no contract / no internet row).
+    """
+    tenure = np.asarray(tenure, dtype=np.int64)
+    senior_citizen = np.asarray(senior_citizen, dtype=bool)
+    partner = np.asarray(partner, dtype=bool)
+    dependents = np.asarray(dependents, dtype=bool)
+    contract_mode = np.asarray(contract_mode, dtype=object)
+    internet_type = np.asarray(internet_type, dtype=object)
+
+    score = np.full(tenure.shape, BASE_RISK, dtype=np.float64)
+
+    # 1. Tenure
+    score += np.where(tenure < 6, 0.20, np.where(tenure > 24, -0.15, 0.0))
+
+    # 2. Contract (High impact)
+    score += np.where(contract_mode == 'Month-to-month', 0.25,
+                      np.where(contract_mode == 'Two year', -0.20, 0.0))
+
+    # 3. Internet
+    score += np.where(internet_type == 'Fiber optic', 0.10, 0.0)
+
+    # 4. Demographics
+    score += np.where(senior_citizen, 0.05, 0.0)
+    score += np.where(~partner & ~dependents, 0.05, 0.0) # Alone = higher risk
+
+    return np.clip(score, MIN_RISK, MAX_RISK)
+
+
+def retention_strategies(risk_score, tenure, contract_mode):
+    """Retention playbook for one scored customer (empty unless risk is above 80%)."""
+    strategies = []
+
+    if risk_score > 0.80:
+        if contract_mode == 'Month-to-month':
+            strategies.append({
+                "title": "Contract Stabilization",
+                "desc": "User is on a volatile Month-to-month plan. Offer 20% off for 6 months to switch to a 1-Year contract."
+            })
+
+        if tenure > 24:
+            strategies.append({
+                "title": "VIP Retention",
+                "desc": "Long-term high-risk customer. Authorize a 'Loyalty Speed Boost' or free equipment upgrade."
+            })
+        else:
+            strategies.append({
+                "title": "Onboarding Rescue",
+                "desc": "New customer at risk. Schedule a call with a Success Manager immediately."
+            })
+
+    return strategies
+
+
+#  SCORERS
+# A scorer declares the feature columns it reads (`columns`, customer_id
+# first), turns a dict of those columns into an array of probabilities
+# (`score_columns`) and lists the tenures at which one more month of tenure
+# can change a score (`tenure_boundaries`, None when any tenure change can;
+# the monthly aging job then rescores everyone). Every scoring path
+# (predict tool, services form, batch API, import, rescoring) goes through
+# the active scorer, chosen with CHURN_SCORER: 'rules' (default, the table
+# above) or 'logistic' (a model trained offline, see churn_model.py).
+# Switching scorers does not touch stored predictions until `flask rescore`
+# runs.
+
+class RuleScorer:
+    name = 'rules'
+    columns = FEATURE_COLUMNS
+    # Tenures at which a customer aged by one month changes score: `tenure < 6`
+    # stops applying at 6 and `tenure > 24` starts at 25 (see tenure_aging.py)
+    tenure_boundaries = (6, 25)
+
+    def score_columns(self, columns):
+        return score_arrays(columns['tenure'], columns['senior_citizen'], columns['partner'],
+                            columns['dependents'], columns['contract_mode'], columns['internet_type'])
+
+
+def make_scorer(name, model_path=DEFAULT_MODEL_PATH):
+    if name == 'rules':
+        return RuleScorer()
+    if name == 'logistic':
+        from churn_model import LogisticScorer
+        return LogisticScorer(model_path)
+    raise ValueError(f"Unknown scorer: {name}")
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_scorer():
+    """The configured scorer, built on first use (a model's weights load lazily too)."""
+    global _scorer
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = make_scorer(os.environ.get('CHURN_SCORER', 'rules'),
+                                      os.environ.get('CHURN_MODEL_PATH', DEFAULT_MODEL_PATH))
+    return _scorer
+
+
+def score_columns(columns):
+    """Scores a dict of feature columns as returned by load_feature_columns."""
+    return get_scorer().score_columns(columns)
+
+
+def object_columns(customer, contract=None, internet=None, phone=None):
+    """Feature columns for one customer from its ORM rows (None where a row is missing)."""
+    owners = {Customer: customer, Contract: contract, InternetService: internet, PhoneService: phone}
+    columns = {}
+    for name in get_scorer().columns:
+        col = SCORING_FEATURES[name]
+        row = owners[col.class_]
+        columns[name] = [getattr(row, col.key) if row is not None else None]
+    return columns
+
+
+def feature_query(customer_ids=None, only_predicted=False, columns=None):
+    """One joined read of the feature columns (the active scorer's by default)."""
+    names = columns or get_scorer().columns
+    selected = [SCORING_FEATURES[name] for name in names]
+    stmt = select(*selected)
+    # Only the tables the columns come from
+    for table in (Contract, InternetService, PhoneService):
+        if any(col.class_ is table for col in selected):
+            stmt = stmt.outerjoin(table, table.customer_id == Customer.customer_id)
+
+    if only_predicted:
+        stmt = stmt.join(Predictions, Predictions.customer_id == Customer.customer_id)
+    if customer_ids is not None:
+        stmt = stmt.where(Customer.customer_id.in_(list(customer_ids)))
+    return stmt.order_by(Customer.customer_id)
+
+
+def rows_to_columns(rows, columns=None):
+    """Transposes result rows into a dict of column lists."""
+    names = columns or get_scorer().columns
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, (list(col) for col in zip(*rows))))
+
+
+def load_feature_columns(session, customer_ids=None, only_predicted=False, columns=None):
+    rows = session.execute(feature_query(customer_ids, only_predicted, columns)).all()
+    return rows_to_columns(rows, columns)
+
+
+def iter_feature_batches(session, batch_size=50000, only_predicted=False, columns=None):
+    """
+    Keyset-paginates the joined feature read on CustomerID so memory stays
+    bounded by batch_size and the connection is free between batches.
+    """
+    last_id = None
+    while True:
+        stmt = feature_query(only_predicted=only_predicted, columns=columns)
+        if last_id is not None:
+            stmt = stmt.where(Customer.customer_id > last_id)
+        rows = session.execute(stmt.limit(batch_size)).all()
+        if not rows:
+            return
+        yield rows_to_columns(rows, columns)
+        last_id = rows[-1][0]
+
+
+def rescore_predictions(session, batch_size=50000, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+    """
+    Recomputes every row of the predictions table in one pass over the book.
+    Scores are written back with chunked bulk upserts (see bulk_writer.py).
+    Returns a small summary dict (rows, seconds).
+    """
+    start = time.perf_counter()
+    total = 0
+    for columns in iter_feature_batches(session, batch_size, only_predicted=True):
+        scores = score_columns(columns)
+        upsert_predictions(session, zip(columns['customer_id'], scores),
+                           chunk_size=chunk_size, on_chunk=on_chunk)
+        total += len(scores)
+    return {'rows': total, 'seconds': round(time.perf_counter() - start, 3)}
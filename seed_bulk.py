@@ -0,0 +1,241 @@
+import os
+import csv
+import time
+import random
+import argparse
+import datetime
+import tempfile
+from collections import deque
+from multiprocessing import Pool
+from sqlalchemy import create_engine, text
+from models import db
+from migrations import run_migrations, number_log_rows
+from scoring import score_arrays
+
+# Generador masivo de datos sintéticos para pruebas de carga (1M–10M clientes).
+# Las filas se construyen en un pool de procesos, por bloques reproducibles
+# (semilla + índice de bloque), y se insertan con executemany multi-fila o
+# con LOAD DATA LOCAL INFILE desde CSV (solo MySQL).
+
+TABLES = ['customer', 'contract', 'internet_service', 'phone_service', 'predictions', 'consultation_logs']
+
+COLUMNS = {
+    'employee': ['EmployeeID', 'Username', 'Password', 'Role', 'EmployeeName'],
+    'customer': ['CustomerID', 'Gender', 'SeniorCitizen', 'Partner', 'Dependents', 'Tenure'],
+    'contract': ['CustomerID', 'ContractMode', 'PaperlessBilling', 'PaymentMethod', 'MonthlyCharges', 'TotalCharges'],
+    'internet_service': ['CustomerID', 'InternetType', 'OnlineSecurity', 'OnlineBackup', 'DeviceProtection', 'TechSupport', 'StreamingMovies'],
+    'phone_service': ['CustomerID', 'has_phone_service', 'MultipleLines'],
+    'predictions': ['CustomerID', 'ChurnProbability'],
+    'consultation_logs': ['LogID', 'ConsultationTime', 'EmployeeID', 'CustomerID'],
+}
+
+EMPLOYEE_IDS = [f'EMP{i:03d}' for i in range(1, 6)]
+CONTRACT_MODES = ['Month-to-month', 'One year', 'Two year']
+PAYMENT_METHODS = ['Electronic check', 'Mailed check', 'Bank transfer', 'Credit card']
+INTERNET_TYPES = ['Fiber optic', 'DSL', 'No']
+LOG_START = datetime.datetime(2025, 1, 1)
+
+
+def customer_id(i):
+    # CustomerID es VARCHAR(10): 'C' + 9 dígitos alcanza para 1.000 millones
+    return f"C{i:09d}"
+
+
+def generate_chunk(args):
+    """Construye todas las filas de los clientes [start, stop). Se ejecuta en un proceso del pool."""
+    seed, chunk_index, start, stop, logs_ratio, csv_dir = args
+    r = random.Random(seed * 1000003 + chunk_index)
+    rows = {t: [] for t in TABLES}
+    features = {'tenure': [], 'senior': [], 'partner': [], 'dependents': [], 'mode': [], 'net': []}
+
+    for i in range(start, stop):
+        cid = customer_id(i)
+        tenure = r.randint(1, 72)
+        senior, partner, dependents = r.randint(0, 1), r.randint(0, 1), r.randint(0, 1)
+        rows['customer'].append((cid, r.choice(['Male', 'Female']), senior, partner, dependents, tenure))
+
+        monthly = round(r.uniform(20.0, 120.0), 2)
+        mode = r.choice(CONTRACT_MODES)
+        rows['contract'].append((cid, mode, r.randint(0, 1), r.choice(PAYMENT_METHODS), monthly, round(monthly * tenure, 2)))
+
+        net = r.choice(INTERNET_TYPES)
+        has_net = net != 'No'
+        rows['internet_service'].append((cid, net) + tuple(r.randint(0, 1) if has_net else 0 for _ in range(5)))
+
+        has_phone = r.randint(0, 1)
+        rows['phone_service'].append((cid, has_phone, r.randint(0, 1) if has_phone else 0))
+
+        if r.random() < logs_ratio:
+            when = LOG_START + datetime.timedelta(seconds=r.randint(0, 365 * 24 * 3600), microseconds=r.randint(0, 999999))
+            rows['consultation_logs'].append((f"LOG-{i:012d}", when.strftime('%Y-%m-%d %H:%M:%S.%f'), r.choice(EMPLOYEE_IDS), cid))
+
+        for key, value in zip(features, (tenure, senior, partner, dependents, mode, net)):
+            features[key].append(value)
+
+    # Predicciones con el mismo motor de reglas que la aplicación (vectorizado)
+    scores = score_arrays(features['tenure'], features['senior'], features['partner'],
+                          features['dependents'], features['mode'], features['net'])
+    rows['predictions'] = [(cid, round(float(s), 4)) for (cid, *_), s in zip(rows['customer'], scores)]
+
+    if csv_dir is None:
+        return chunk_index, rows, None
+
+    paths = {}
+    for table, table_rows in rows.items():
+        path = os.path.join(csv_dir, f"{table}_{chunk_index:06d}.csv")
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(table_rows)
+        paths[table] = (path, len(table_rows))
+    return chunk_index, None, paths
+
+
+class TableTimer:
+    def __init__(self):
+        self.rows = {t: 0 for t in TABLES}
+        self.seconds = {t: 0.0 for t in TABLES}
+
+    def add(self, table, rows, seconds):
+        self.rows[table] += rows
+        self.seconds[table] += seconds
+
+    def report(self):
+        for t in TABLES:
+            rate = self.rows[t] / self.seconds[t] if self.seconds[t] else 0
+            print(f"   {t:<18} {self.rows[t]:>10} filas  {self.seconds[t]:8.2f}s  {rate:>12,.0f} filas/s")
+
+
+def placeholder(engine):
+    return '%s' if engine.dialect.paramstyle in ('format', 'pyformat') else '?'
+
+
+def insert_sql(table, ph):
+    cols = COLUMNS[table]
+    return f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join([ph] * len(cols))})"
+
+
+def prepare_schema(engine):
+    db.metadata.create_all(engine)
+    run_migrations(engine)
+    print("🧹 Limpiando tablas...")
+    with engine.begin() as conn:
+        mysql = engine.dialect.name == 'mysql'
+        if mysql: conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+        for table in TABLES[::-1] + ['employee']:
+            conn.execute(text(f"TRUNCATE TABLE {table}" if mysql else f"DELETE FROM {table}"))
+        if mysql: conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+
+
+def insert_employees(engine):
+    ph = placeholder(engine)
+    rows = [('EMP001', 'admin', 'admin123', 'Manager', 'Super Admin')]
+    rows += [(eid, f'user{eid[-3:]}', 'password', 'Employee', f'Agent {eid}') for eid in EMPLOYEE_IDS[1:]]
+    with engine.begin() as conn:
+        conn.exec_driver_sql(insert_sql('employee', ph), rows)
+
+
+def write_rows(conn, rows, timer, ph, batch_size):
+    for table in TABLES:
+        table_rows = rows[table]
+        sql = insert_sql(table, ph)
+        start = time.perf_counter()
+        for i in range(0, len(table_rows), batch_size):
+            conn.exec_driver_sql(sql, table_rows[i:i + batch_size])
+        timer.add(table, len(table_rows), time.perf_counter() - start)
+
+
+def load_csv_files(conn, paths, timer):
+    for table in TABLES:
+        path, count = paths[table]
+        start = time.perf_counter()
+        if count:
+            conn.exec_driver_sql(
+                f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table} "
+                f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\r\\n' "
+                f"({', '.join(COLUMNS[table])})"
+            )
+        timer.add(table, count, time.perf_counter() - start)
+        os.remove(path)
+
+
+def run_bulk_seed(database_url, rows, seed=42, workers=None, chunk_size=10000, batch_size=1000,
+                  commit_every=50000, logs_ratio=0.4, use_load_data=False):
+    connect_args = {'local_infile': True} if use_load_data else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+    if use_load_data and engine.dialect.name != 'mysql':
+        raise ValueError("LOAD DATA LOCAL INFILE solo está disponible en MySQL")
+
+    print(f"🔌 Conectando a {engine.url.render_as_string(hide_password=True)}...")
+    prepare_schema(engine)
+    insert_employees(engine)
+
+    csv_dir = tempfile.mkdtemp(prefix='clientguard_seed_') if use_load_data else None
+    tasks = [(seed, n, start, min(start + chunk_size, rows), logs_ratio, csv_dir)
+             for n, start in enumerate(range(0, rows, chunk_size))]
+    ph = placeholder(engine)
+    timer = TableTimer()
+    workers = workers or os.cpu_count() or 1
+
+    print(f"🚀 Generando {rows:,} clientes en {len(tasks)} bloques con {workers} procesos...")
+    started = time.perf_counter()
+    done = 0
+    with Pool(workers) as pool, engine.connect() as conn:
+        if engine.dialect.name == 'mysql':
+            conn.exec_driver_sql("SET unique_checks = 0")
+            conn.exec_driver_sql("SET foreign_key_checks = 0")
+        # Como mucho 2 bloques pendientes por proceso: la memoria no crece con --rows
+        task_iter = iter(tasks)
+        pending = deque(pool.apply_async(generate_chunk, (task,))
+                        for _, task in zip(range(workers * 2), task_iter))
+        uncommitted = 0
+        while pending:
+            _, chunk_rows, paths = pending.popleft().get()
+            next_task = next(task_iter, None)
+            if next_task is not None:
+                pending.append(pool.apply_async(generate_chunk, (next_task,)))
+
+            if paths is not None:
+                load_csv_files(conn, paths, timer)
+                chunk_count = paths['customer'][1]
+            else:
+                write_rows(conn, chunk_rows, timer, ph, batch_size)
+                chunk_count = len(chunk_rows['customer'])
+
+            done += chunk_count
+            uncommitted += chunk_count
+            if uncommitted >= commit_every:
+                conn.commit()
+                uncommitted = 0
+                elapsed = time.perf_counter() - started
+                print(f"   ... {done:,}/{rows:,} clientes ({done / elapsed:,.0f} clientes/s)")
+        conn.commit()
+
+    if csv_dir: os.rmdir(csv_dir)
+    with engine.begin() as conn:
+        number_log_rows(conn) # LogSeq cursor for the generated logs
+    elapsed = time.perf_counter() - started
+    print(f"✨ ¡Éxito! {done:,} clientes en {elapsed:.1f}s ({done / elapsed:,.0f} clientes/s)")
+    timer.report()
+    return timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador masivo de datos sintéticos de ClientGuard")
+    parser.add_argument('--rows', type=int, default=1000000, help="Número de clientes")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla aleatoria (resultados reproducibles)")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL', 'sqlite:///local.db'))
+    parser.add_argument('--workers', type=int, default=None, help="Procesos del pool (por defecto: CPUs)")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Clientes generados por bloque")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Filas por executemany")
+    parser.add_argument('--commit-every', type=int, default=50000, help="Clientes por transacción")
+    parser.add_argument('--logs-ratio', type=float, default=0.4, help="Proporción de clientes con un log")
+    parser.add_argument('--load-data', action='store_true', help="Usar LOAD DATA LOCAL INFILE (MySQL)")
+    args = parser.parse_args()
+
+    run_bulk_seed(args.database_url, args.rows, seed=args.seed, workers=args.workers,
+                  chunk_size=args.chunk_size, batch_size=args.batch_size,
+                  commit_every=args.commit_every, logs_ratio=args.logs_ratio,
+                  use_load_data=args.load_data)
+
+
+if __name__ == '__main__':
+    main()
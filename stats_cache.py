@@ -0,0 +1,185 @@
+import time
+import threading
+from collections import Counter
+from sqlalchemy import func
+from models import Customer, Contract, InternetService, Predictions, RISK_BAND_HIGH, RISK_BAND_NAMES, risk_band
+
+#  AGGREGATE CACHE
+# Holds the dashboard / reports figures in memory. A full recompute only
+# happens on a miss (cold start, TTL expiry or invalidate()); the CRUD routes
+# apply deltas so hits stay correct in between.
+#
+# Deltas only reach the worker that made the edit. With a shared backend
+# (the risk cache's Redis) every delta and invalidate() also bumps a shared
+# generation; a worker whose copy was built at another generation than the
+# current one recomputes instead of serving it. A worker that bumps from
+# exactly its own generation keeps its copy, so a single busy worker does
+# not rebuild after its own edits.
+
+
+def contract_values(contract):
+    """(contract_mode, payment_method, monthly_charges) of a Contract row, or None."""
+    if contract is None:
+        return None
+    return (contract.contract_mode, contract.payment_method, contract.monthly_charges or 0.0)
+
+
+class AggregateCache:
+    def __init__(self, ttl=300, backend=None, key='aggregates:generation'):
+        self.ttl = ttl
+        self.backend = backend
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.remote_changes = 0
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = 0.0
+        self._generation = None
+
+    # --- Reads ---
+    def get(self, session):
+        """Returns a snapshot of the aggregates, recomputing them on a miss."""
+        # Recomputing under the lock keeps concurrent deltas from being lost
+        # and stops several requests from rebuilding at the same time.
+        with self._lock:
+            generation = self._shared_generation()
+            if self._data is not None and generation != self._generation:
+                self.remote_changes += 1 # Another worker changed the figures
+                self._data = None
+            if self._data is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._data = self._compute(session)
+                self._loaded_at = time.monotonic()
+                self._generation = generation
+            return self._snapshot()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+                'remote_changes': self.remote_changes,
+                'shared': self.backend is not None,
+                'ttl': self.ttl,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._data else None
+            }
+
+    def _snapshot(self):
+        d = self._data
+        pred_count = d['pred_count']
+        return {
+            'customers': d['customers'],
+            'internet': sorted((k, v) for k, v in d['internet'].items() if v > 0),
+            'contract': sorted((k, v) for k, v in d['contract'].items() if v > 0),
+            'payment': sorted((k, v) for k, v in d['payment'].items() if v > 0),
+            'revenue': d['revenue'],
+            'avg_churn': d['pred_sum'] / pred_count if pred_count else 0,
+            'high_risk': d['bands'][RISK_BAND_HIGH],
+            'bands': {name: d['bands'][band] for band, name in RISK_BAND_NAMES.items()}
+        }
+
+    def _compute(self, session):
+        q = session.query
+        pred_count, pred_sum = q(func.count(Predictions.customer_id), func.sum(Predictions.churn_probability)).one()
+        return {
+            'customers': q(func.count(Customer.customer_id)).scalar(),
+            'internet': Counter(dict(q(InternetService.internet_type, func.count(InternetService.customer_id))
+                                     .group_by(InternetService.internet_type).all())),
+            'contract': Counter(dict(q(Contract.contract_mode, func.count(Contract.customer_id))
+                                     .group_by(Contract.contract_mode).all())),
+            'payment': Counter(dict(q(Contract.payment_method, func.count(Contract.customer_id))
+                                    .group_by(Contract.payment_method).all())),
+            'revenue': float(q(func.sum(Contract.monthly_charges)).scalar() or 0),
+            'pred_count': pred_count,
+            'pred_sum': float(pred_sum or 0),
+            # Index-only scan of ix_predictions_band_probability
+            'bands': Counter(dict(q(Predictions.risk_band, func.count(Predictions.customer_id))
+                                  .group_by(Predictions.risk_band).all()))
+        }
+
+    # --- Shared generation ---
+    def _shared_generation(self):
+        # Caller holds the lock. On a backend error keep serving the local copy (TTL-bounded)
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.get(self.key)
+        except Exception as e:
+            print(f"Aggregate cache backend error: {e}")
+            return self._generation
+
+    def _changed(self):
+        """
+        Caller holds the lock. Announces a change to the other workers; returns
+        False when the local copy cannot take the delta and was dropped instead.
+        """
+        if self.backend is not None:
+            try:
+                generation = self.backend.incr(self.key)
+            except Exception as e:
+                print(f"Aggregate cache backend error: {e}")
+                self._data = None
+                return False
+            if self._data is not None and int(self._generation or 0) + 1 != generation:
+                self._data = None # Missed someone else's change
+            self._generation = str(generation)
+        return self._data is not None
+
+    # --- Incremental maintenance (call after a successful commit) ---
+    def invalidate(self):
+        with self._lock:
+            self._changed()
+            self._data = None
+            self.invalidations += 1
+
+    def customer_added(self, contract=None, internet_type=None, probability=None):
+        with self._lock:
+            if not self._changed(): return
+            self._data['customers'] += 1
+        self.contract_changed(None, contract)
+        self.internet_changed(None, internet_type)
+        self.prediction_changed(None, probability)
+
+    def customer_removed(self, contract=None, internet_type=None, probability=None):
+        with self._lock:
+            if not self._changed(): return
+            self._data['customers'] -= 1
+        self.contract_changed(contract, None)
+        self.internet_changed(internet_type, None)
+        self.prediction_changed(probability, None)
+
+    def contract_changed(self, old, new):
+        """old/new are contract_values() tuples or None."""
+        with self._lock:
+            if not self._changed(): return
+            d = self._data
+            for values, sign in ((old, -1), (new, 1)):
+                if values is None: continue
+                mode, payment, monthly = values
+                d['contract'][mode] += sign
+                d['payment'][payment] += sign
+                d['revenue'] += sign * monthly
+
+    def internet_changed(self, old_type, new_type):
+        with self._lock:
+            if not self._changed(): return
+            d = self._data
+            if old_type is not None: d['internet'][old_type] -= 1
+            if new_type is not None: d['internet'][new_type] += 1
+
+    def prediction_changed(self, old, new):
+        with self._lock:
+            if not self._changed(): return
+            d = self._data
+            for value, sign in ((old, -1), (new, 1)):
+                if value is None: continue
+                d['pred_count'] += sign
+                d['pred_sum'] += sign * value
+                d['bands'][risk_band(value)] += sign
@@ -0,0 +1,37 @@
+import json
+
+#  STREAMING HELPERS
+# Turn batches of dicts into chunked HTTP bodies so memory stays flat
+# regardless of how many rows the query returns.
+
+DEFAULT_STREAM_BATCH = 1000
+
+
+def iter_result_batches(session, stmt, batch_size=DEFAULT_STREAM_BATCH):
+    """
+    Runs `stmt` on a server-side cursor (stream_results) and yields lists of
+    row mappings, batch_size rows at a time.
+    """
+    result = session.execute(stmt.execution_options(yield_per=batch_size))
+    for partition in result.mappings().partitions(batch_size):
+        yield partition
+
+
+def json_array_chunks(batches, serialize=dict):
+    """Yields a JSON array piece by piece, one chunk per batch."""
+    yield '['
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        body = ','.join(json.dumps(serialize(row)) for row in batch)
+        yield body if first else ',' + body
+        first = False
+    yield ']'
+
+
+def ndjson_chunks(batches, serialize=dict):
+    """Yields newline-delimited JSON, one chunk per batch."""
+    for batch in batches:
+        if batch:
+            yield ''.join(json.dumps(serialize(row)) + '\n' for row in batch)
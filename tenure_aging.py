@@ -0,0 +1,146 @@
+import time
+import datetime
+from sqlalchemy import select, update, func
+from models import Customer, Contract, TenureAgingRun
+from scoring import get_scorer, feature_query, rows_to_columns, score_columns, rescore_predictions
+from bulk_writer import upsert_predictions, DEFAULT_CHUNK_SIZE
+from bulk_import import MAX_TENURE
+
+#  MONTHLY TENURE AGING
+# Rolls the book forward one month with set-based UPDATEs: Tenure + 1 and
+# TotalCharges + MonthlyCharges, one CustomerID key range per transaction.
+# Each chunk also advances the run's cursor in tenure_aging_runs, so a run
+# is done at most once per period and an interrupted run resumes where it
+# stopped instead of aging anyone twice.
+#
+# Only customers whose score can have changed are then rescored. For the
+# rule table those are the ones that just reached a tenure boundary (the
+# scorer's tenure_boundaries), read through the (Tenure, CustomerID) index:
+# roughly 2/72 of the book instead of all of it. A scorer without boundaries
+# (the logistic model reads tenure and charges as numbers) rescores everyone.
+#
+# The UPDATEs bypass the ORM session, so the dirty-customer queue does not
+# see them (by design: millions of rows would otherwise be queued).
+
+DEFAULT_AGING_CHUNK = 50000
+PERIOD_FORMAT = '%Y-%m'
+
+
+def current_period(today=None):
+    return (today or datetime.date.today()).strftime(PERIOD_FORMAT)
+
+
+def _key_range(column, after, upto):
+    conditions = [column <= upto]
+    if after is not None:
+        conditions.append(column > after)
+    return conditions
+
+
+def _chunk_end(session, after, chunk_size):
+    """Last CustomerID of the next key range (None when nothing is left)."""
+    stmt = select(Customer.customer_id).order_by(Customer.customer_id)
+    if after is not None:
+        stmt = stmt.where(Customer.customer_id > after)
+    end = session.execute(stmt.offset(chunk_size - 1).limit(1)).scalar()
+    if end is None:
+        # Fewer than chunk_size left: the range ends at the last customer
+        stmt = select(func.max(Customer.customer_id))
+        if after is not None:
+            stmt = stmt.where(Customer.customer_id > after)
+        end = session.execute(stmt).scalar()
+    return end
+
+
+def age_customers(session, run, chunk_size=DEFAULT_AGING_CHUNK, on_chunk=None):
+    """Ages every customer after the run's cursor, one committed key range at a time."""
+    while True:
+        start = time.perf_counter()
+        after = run.last_customer_id
+        upto = _chunk_end(session, after, chunk_size)
+        if upto is None:
+            return
+        aged = session.execute(
+            update(Customer)
+            .where(*_key_range(Customer.customer_id, after, upto), Customer.tenure < MAX_TENURE)
+            .values(tenure=Customer.tenure + 1)
+            .execution_options(synchronize_session=False)).rowcount
+        session.execute(
+            update(Contract)
+            .where(*_key_range(Contract.customer_id, after, upto))
+            .values(total_charges=Contract.total_charges + Contract.monthly_charges)
+            .execution_options(synchronize_session=False))
+        run.last_customer_id = upto
+        run.customers_aged += aged
+        session.commit()
+        if on_chunk:
+            on_chunk({'upto': upto, 'rows': aged, 'seconds': round(time.perf_counter() - start, 4)})
+
+
+def rescore_boundary_crossers(session, boundaries, batch_size=50000, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Rescores the analysed customers at each boundary tenure (index range scans). Returns the row count."""
+    total = 0
+    for tenure in boundaries:
+        last_id = None
+        while True:
+            stmt = feature_query(only_predicted=True).where(Customer.tenure == tenure)
+            if last_id is not None:
+                stmt = stmt.where(Customer.customer_id > last_id)
+            rows = session.execute(stmt.limit(batch_size)).all()
+            if not rows:
+                break
+            columns = rows_to_columns(rows)
+            upsert_predictions(session, zip(columns['customer_id'], score_columns(columns)), chunk_size=chunk_size)
+            total += len(rows)
+            last_id = rows[-1][0]
+    return total
+
+
+def run_tenure_aging(session, period=None, chunk_size=DEFAULT_AGING_CHUNK, batch_size=50000, on_chunk=None):
+    """
+    Monthly roll-forward for `period` ('YYYY-MM', default: this month).
+    Returns a summary dict; status is 'skipped' if the period was already aged.
+    """
+    period = period or current_period()
+    run = session.get(TenureAgingRun, period)
+    if run is not None and run.finished_at is not None:
+        return {'period': period, 'status': 'skipped', 'customers_aged': run.customers_aged,
+                'rescored': run.rescored, 'finished_at': run.finished_at.isoformat(timespec='seconds')}
+    resumed = run is not None
+    if run is None:
+        run = TenureAgingRun(period=period, started_at=datetime.datetime.now(), customers_aged=0, rescored=0)
+        session.add(run)
+        session.commit() # Claims the period: a concurrent run fails on the primary key
+
+    start = time.perf_counter()
+    age_customers(session, run, chunk_size, on_chunk)
+    aging_seconds = time.perf_counter() - start
+
+    boundaries = get_scorer().tenure_boundaries
+    if boundaries is not None:
+        rescored = rescore_boundary_crossers(session, boundaries, batch_size)
+    else:
+        rescored = rescore_predictions(session, batch_size=batch_size)['rows']
+    run.rescored = rescored
+    run.finished_at = datetime.datetime.now()
+    session.commit()
+    return {
+        'period': period,
+        'status': 'resumed' if resumed else 'aged',
+        'customers_aged': run.customers_aged,
+        'rescored': rescored,
+        'rescore_scope': 'boundaries' if boundaries is not None else 'all',
+        'aging_seconds': round(aging_seconds, 3),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def recent_runs(session, limit=12):
+    stmt = select(TenureAgingRun).order_by(TenureAgingRun.period.desc()).limit(limit)
+    return [{
+        'period': run.period,
+        'started_at': run.started_at.isoformat(timespec='seconds'),
+        'finished_at': run.finished_at.isoformat(timespec='seconds') if run.finished_at else None,
+        'customers_aged': run.customers_aged,
+        'rescored': run.rescored
+    } for run in session.execute(stmt).scalars()]
@@ -0,0 +1,8 @@
+from app import app
+
+#  WSGI ENTRY POINT
+# Production servers import `wsgi:app` (see gunicorn.conf.py). Waiting for
+# the database and migrating is done once by the server's master process,
+# not here, so workers never race each other on create_all / migrations.
+
+application = app